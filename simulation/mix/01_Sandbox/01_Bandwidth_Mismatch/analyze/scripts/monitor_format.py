@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Binary monitor readers
+读取 scratch/third 各监控器的二进制输出 (布局见 src/point-to-point/model/monitor-format.h)，
+全部记录经 np.fromfile 直接读入结构化数组，再用 NumPy 分组聚合，不逐行解析。
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+HEADER_DTYPE = np.dtype([('magic', '<u4'), ('version', '<u4'), ('interval', '<u8')])
+
+QLEN_FILE_MAGIC = 0x4c514b48  # "HKQL"
+QLEN_PORT_DTYPE = np.dtype([('node', '<u4'), ('port', '<u4')])
+QLEN_DUMP_DTYPE = np.dtype([('time', '<u8'), ('samples', '<u4'), ('count', '<u4')])
+QLEN_RECORD_DTYPE = np.dtype([('node', '<u4'), ('port', '<u4'), ('kb', '<u4'), ('count', '<u4')])
+
+LINK_UTIL_FILE_MAGIC = 0x554c4b48  # "HKLU"
+LINK_UTIL_PORT_DTYPE = np.dtype([('node', '<u4'), ('port', '<u4'), ('bw', '<u8')])
+
+INGRESS_FILE_MAGIC = 0x51494b48  # "HKIQ"
+INGRESS_CHANGE_FILE_MAGIC = 0x43494b48  # "HKIC"
+INGRESS_CHANGE_TEXT_TAG = '# Change-only:'
+INGRESS_END_TEXT_TAG = '# End:'
+INGRESS_END_NODE = 0xffffffff  # 按变化采样的二进制文件末尾的结束记录
+INGRESS_RECORD_DTYPE = np.dtype([('time', '<u8'), ('node', '<u4'), ('port', '<u4'), ('ingress', '<u4'),
+                                 ('egress', '<u4'), ('hdrm', '<u4'), ('paused', '<u4')])
+
+QlenDeltas = namedtuple('QlenDeltas', ['header', 'ports', 'dumps', 'records', 'dump_index'])
+LinkUtil = namedtuple('LinkUtil', ['header', 'ports', 'times', 'tx_bytes'])
+
+def read_magic(path):
+    """文件头的 magic，文件过短时返回 None (文本格式的输出不会与任何 magic 相同)"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    return int.from_bytes(head, 'little') if len(head) == 4 else None
+
+# --- Queue Length Histogram (QLEN_MON_FORMAT 1) ---
+
+def is_qlen_delta_file(path):
+    return read_magic(path) == QLEN_FILE_MAGIC
+
+def read_qlen_deltas(path):
+    """读取 qlen 增量文件，返回 QlenDeltas：
+
+    ports       被监控的全部 (node, port)
+    dumps       每次输出的 (time, samples, count)
+    records     全部非空队列桶的 (node, port, kb, count)，kb 均大于 0
+    dump_index  每条记录所属的 dumps 下标
+    """
+    raw = np.fromfile(path, dtype=np.uint8)
+    header = raw[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+    if len(header) == 0 or header['magic'][0] != QLEN_FILE_MAGIC:
+        raise ValueError(f"{path} is not a binary qlen monitor file")
+    pos = HEADER_DTYPE.itemsize
+    port_num = int(raw[pos:pos + 4].view('<u4')[0])
+    pos += 4
+    ports = raw[pos:pos + port_num * QLEN_PORT_DTYPE.itemsize].view(QLEN_PORT_DTYPE)
+    pos += port_num * QLEN_PORT_DTYPE.itemsize
+
+    # 只在 Python 中逐次跳过输出头，记录本身整块切片后一次拼接
+    dumps, chunks = [], []
+    while pos + QLEN_DUMP_DTYPE.itemsize <= len(raw):
+        dump = raw[pos:pos + QLEN_DUMP_DTYPE.itemsize].view(QLEN_DUMP_DTYPE)[0]
+        pos += QLEN_DUMP_DTYPE.itemsize
+        end = pos + int(dump['count']) * QLEN_RECORD_DTYPE.itemsize
+        if end > len(raw):  # 仿真仍在写入时末尾可能不完整
+            break
+        dumps.append(dump)
+        chunks.append(raw[pos:end].view(QLEN_RECORD_DTYPE))
+        pos = end
+    dumps = np.array(dumps, dtype=QLEN_DUMP_DTYPE)
+    records = np.concatenate(chunks) if chunks else np.zeros(0, dtype=QLEN_RECORD_DTYPE)
+    dump_index = np.repeat(np.arange(len(dumps)), dumps['count'].astype(np.int64))
+    return QlenDeltas(header[0], ports, dumps, records, dump_index)
+
+def _port_index(data):
+    """每条记录在 data.ports 中的下标"""
+    key = data.ports['node'].astype(np.int64) << 32 | data.ports['port']
+    order = np.argsort(key)
+    rec_key = data.records['node'].astype(np.int64) << 32 | data.records['port']
+    return order[np.searchsorted(key, rec_key, sorter=order)]
+
+def qlen_histograms(data, t_start=None, t_end=None):
+    """输出时刻落在 [t_start, t_end] 的各区间合并后的分布 {(node, port): counts}
+
+    不给 t_start 即为截至 t_end 的累计分布 (与文本格式在 t_end 时刻输出的一行相同)。
+    """
+    dump_mask = np.ones(len(data.dumps), dtype=bool)
+    if t_start is not None:
+        dump_mask &= data.dumps['time'] >= t_start
+    if t_end is not None:
+        dump_mask &= data.dumps['time'] <= t_end
+    samples = int(data.dumps['samples'][dump_mask].sum())
+    sel = dump_mask[data.dump_index]
+    rec = data.records[sel]
+    p_idx = _port_index(data)[sel]
+    n_bins = int(rec['kb'].max()) + 1 if len(rec) else 1
+    hist = np.bincount(p_idx * n_bins + rec['kb'], weights=rec['count'],
+                       minlength=len(data.ports) * n_bins).astype(np.int64).reshape(len(data.ports), n_bins)
+    hist[:, 0] = samples - hist[:, 1:].sum(axis=1)
+    # 每个端口只保留到最后一个非零桶，与文本格式的行长一致
+    last = n_bins - np.argmax(hist[:, ::-1] > 0, axis=1)
+    last[~hist.any(axis=1)] = 0
+    return {(int(node), int(port)): hist[k, :last[k]] for k, (node, port) in enumerate(data.ports)}
+
+def qlen_average(data, cumulative=False):
+    """每次输出时各端口的平均队列长度 (字节)
+
+    cumulative=False 时为该输出区间内的平均，True 时为从开始监控到该时刻的累计平均。
+    返回 (times_ns, {(node, port): avg_bytes 数组})，数组与 times_ns 对齐；没有采样时取 0。
+    """
+    n_dumps = len(data.dumps)
+    cell = _port_index(data) * n_dumps + data.dump_index
+    weighted = np.bincount(cell, weights=data.records['kb'].astype(np.float64) * data.records['count'],
+                           minlength=len(data.ports) * n_dumps).astype(np.float64).reshape(len(data.ports), n_dumps)
+    total = data.dumps['samples'].astype(np.float64)
+    if cumulative:
+        weighted = np.cumsum(weighted, axis=1)
+        total = np.cumsum(total)
+    avg = np.divide(weighted, total, out=np.zeros_like(weighted), where=total > 0) * 1000.0
+    return data.dumps['time'], {(int(node), int(port)): avg[k] for k, (node, port) in enumerate(data.ports)}
+
+# --- Link Utilization (LINK_UTIL_MON_FORMAT 1) ---
+
+def is_link_util_file(path):
+    return read_magic(path) == LINK_UTIL_FILE_MAGIC
+
+def read_link_util(path):
+    """读取链路利用率文件，返回 LinkUtil：
+
+    ports     全部 (node, port, bw)
+    times     每次采样的时刻 (ns)
+    tx_bytes  (采样次数, 端口数) 的累计发送字节数矩阵，列顺序与 ports 相同
+    """
+    raw = np.fromfile(path, dtype=np.uint8)
+    header = raw[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+    if len(header) == 0 or header['magic'][0] != LINK_UTIL_FILE_MAGIC:
+        raise ValueError(f"{path} is not a binary link utilization file")
+    pos = HEADER_DTYPE.itemsize
+    port_num = int(raw[pos:pos + 4].view('<u4')[0])
+    pos += 4
+    ports = raw[pos:pos + port_num * LINK_UTIL_PORT_DTYPE.itemsize].view(LINK_UTIL_PORT_DTYPE)
+    pos += port_num * LINK_UTIL_PORT_DTYPE.itemsize
+    row = 8 * (port_num + 1)
+    n_rows = (len(raw) - pos) // row  # 仿真仍在写入时丢弃末尾不完整的一行
+    body = raw[pos:pos + n_rows * row].view('<u8').reshape(n_rows, port_num + 1)
+    return LinkUtil(header[0], ports, body[:, 0], body[:, 1:])
+
+def link_util_rates(data):
+    """由相邻两次采样计算吞吐 (Gbps) 与利用率 (%，上限 100)
+
+    与文本格式一致，不输出第一次采样以及上一次采样时刻为 0 的行。
+    返回 (times_ns, throughput_gbps, util_percent)，后两者为 (行数, 端口数) 矩阵。
+    """
+    times = data.times.astype(np.int64)
+    keep = (times[:-1] > 0) & (np.diff(times) > 0)
+    dt = np.diff(times).astype(np.float64)[keep]
+    delta = np.diff(data.tx_bytes.astype(np.int64), axis=0)[keep]
+    throughput = delta * 8.0 / dt[:, None]
+    bw = data.ports['bw'].astype(np.float64)
+    util = np.divide(throughput * 1e9, bw, out=np.zeros_like(throughput), where=bw > 0) * 100.0
+    return data.times[1:][keep], throughput, np.minimum(util, 100.0)
+
+# --- Ingress Queue (INGRESS_MON_FORMAT 1, INGRESS_MON_CHANGE_ONLY 1) ---
+
+def is_ingress_file(path):
+    return read_magic(path) in (INGRESS_FILE_MAGIC, INGRESS_CHANGE_FILE_MAGIC)
+
+def read_ingress(path):
+    """读取入端口队列文件，返回 IngressRecord 结构化数组 (time, node, port, ingress, egress, hdrm, paused)
+
+    按变化采样的文件会先向前填充到末尾结束记录的时刻，结果与逐周期采样的文件相同 (每次采样一行非空闲端口)。
+    """
+    raw = np.fromfile(path, dtype=np.uint8)
+    header = raw[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+    if len(header) == 0 or header['magic'][0] not in (INGRESS_FILE_MAGIC, INGRESS_CHANGE_FILE_MAGIC):
+        raise ValueError(f"{path} is not a binary ingress queue file")
+    body = raw[HEADER_DTYPE.itemsize:]
+    n = len(body) // INGRESS_RECORD_DTYPE.itemsize
+    records = body[:n * INGRESS_RECORD_DTYPE.itemsize].view(INGRESS_RECORD_DTYPE)
+    if header['magic'][0] == INGRESS_CHANGE_FILE_MAGIC:
+        end = records['node'] == INGRESS_END_NODE
+        t_end = int(records['time'][end][-1]) if end.any() else None
+        records = ingress_forward_fill(records[~end], int(header['interval'][0]), t_end)
+    return records
+
+def ingress_change_interval(line):
+    """文本格式中按变化采样的标记行 "# Change-only: interval <ns> threshold <bytes>"，返回采样周期，其他行返回 None"""
+    if not line.startswith(INGRESS_CHANGE_TEXT_TAG):
+        return None
+    tokens = line.split()
+    return int(tokens[tokens.index('interval') + 1])
+
+def ingress_end_time(line):
+    """文本格式中按变化采样的结束行 "# End: <ns>"，返回监控的最后一个采样点，其他行返回 None"""
+    if not line.startswith(INGRESS_END_TEXT_TAG):
+        return None
+    return int(line[len(INGRESS_END_TEXT_TAG):])
+
+def ingress_forward_fill(records, interval, t_end=None):
+    """把按变化采样的记录展开为逐周期采样：每条记录的取值保持到同一端口的下一条记录之前
+
+    展开到 t_end (监控的最后一个采样点，取自文件末尾的结束行/结束记录；
+    仿真被中断而没有写出时默认取最后一条记录的时刻)，只保留非空闲的行，按 (time, node, port) 排序。
+    """
+    if len(records) == 0:
+        return records.copy()
+    if t_end is None:
+        t_end = int(records['time'].max())
+    rec = records[np.lexsort((records['time'], records['port'], records['node']))]
+    key = rec['node'].astype(np.int64) << 32 | rec['port']
+    nxt = np.empty(len(rec), dtype=np.int64)
+    nxt[:-1] = rec['time'][1:]
+    nxt[-1] = t_end + interval
+    last_of_port = np.append(key[1:] != key[:-1], True)
+    nxt[last_of_port] = t_end + interval
+    active = (rec['ingress'] > 0) | (rec['egress'] > 0) | (rec['hdrm'] > 0) | (rec['paused'] > 0)
+    rec, nxt = rec[active], nxt[active]
+    counts = np.maximum((nxt - rec['time'].astype(np.int64) + interval - 1) // interval, 0)
+    out = np.repeat(rec, counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    out['time'] += ((np.arange(len(out)) - starts) * interval).astype(np.uint64)
+    return out[np.lexsort((out['port'], out['node'], out['time']))]
@@ -45,6 +45,9 @@ fi
 # 端口过滤参数 (可选)
 INCLUDE_PORTS=""
 
+# Trace解析的并行进程数
+JOBS=1
+
 print_banner() {
     echo -e "${BLUE}==================================================================${NC}"
     echo -e "${BLUE}$1${NC}"
@@ -76,6 +79,7 @@ usage() {
     echo "  -i, --ingress FILE     Ingress queue file (default: output/ingress_queue.txt)"
     echo "  -o, --output DIR       Output directory for analysis results"
     echo "  --include PORTS        Only include specified ports (e.g., 'SW6-P1 SW6-P6 H0-P1')"
+    echo "  -j, --jobs N           Worker processes for trace decoding (default: 1)"
     echo "  -h, --help             Show this help message"
     echo ""
     echo "Examples:"
@@ -108,6 +112,10 @@ while [[ $# -gt 0 ]]; do
             INCLUDE_PORTS="$2"
             shift 2
             ;;
+        -j|--jobs)
+            JOBS="$2"
+            shift 2
+            ;;
         -h|--help)
             usage
             ;;
@@ -152,6 +160,7 @@ if [ -f "$TRACE_FILE" ]; then
         --output-dir "$FIGURES_DIR" \
         --csv-dir "$TRACE_ANALYSIS_DIR" \
         --topology "$TOPOLOGY_FILE" \
+        --jobs "$JOBS" \
         $INCLUDE_ARGS
     
     if [ $? -eq 0 ]; then
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Level-of-detail downsampling for time-series plots
+按输出图像的像素列把时间序列压缩为 min/max/last 包络，
+渲染点数与原始采样数无关，同时保留微秒级的队列尖峰与PFC触发峰值。
+"""
+
+import numpy as np
+
+def axes_pixel_width(ax, dpi):
+    """坐标轴在输出图像中所占的像素列数"""
+    fig = ax.figure
+    return max(1, int(ax.get_position().width * fig.get_figwidth() * dpi))
+
+def envelope_index(x, y, n_cols):
+    """返回保留点的下标 (升序)：每个像素列内的最小值、最大值与最后一个采样，外加序列首点
+
+    x 须按升序排列；采样数不超过 3*n_cols 时原样返回全部下标。
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(x)
+    if n <= 3 * n_cols:
+        return np.arange(n)
+
+    span = float(x[-1] - x[0])
+    if span <= 0:
+        col = np.zeros(n, dtype=np.int64)
+    else:
+        col = ((x - x[0]) * (n_cols / span)).astype(np.int64)
+        np.minimum(col, n_cols - 1, out=col)
+
+    # 每列为一段连续下标 [starts[k], ends[k])
+    starts = np.flatnonzero(np.r_[True, col[1:] != col[:-1]])
+    ends = np.r_[starts[1:], n]
+    seg = np.repeat(np.arange(len(starts)), ends - starts)
+
+    def first_match(values):
+        hit = np.flatnonzero(y == values[seg])
+        _, first = np.unique(seg[hit], return_index=True)
+        return hit[first]
+
+    keep = np.concatenate((
+        [0],
+        first_match(np.minimum.reduceat(y, starts)),
+        first_match(np.maximum.reduceat(y, starts)),
+        ends - 1,
+    ))
+    return np.unique(keep)
+
+def envelope(x, y, n_cols):
+    """返回降采样后的 (x, y)"""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    idx = envelope_index(x, y, n_cols)
+    return x[idx], y[idx]
+
+def plot_envelope(ax, x, y, dpi, **kwargs):
+    """ax.plot 的降采样版本，按 ax 在 dpi 下的像素宽度压缩序列"""
+    return ax.plot(*envelope(x, y, axes_pixel_width(ax, dpi)), **kwargs)
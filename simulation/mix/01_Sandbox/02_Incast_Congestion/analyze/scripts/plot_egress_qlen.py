@@ -1,6 +1,7 @@
 import os
 import matplotlib.pyplot as plt
 import argparse
+from monitor_format import is_qlen_delta_file, read_qlen_deltas, qlen_average
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -23,7 +24,14 @@ def parse_qlen(file_path, use_instantaneous=True):
                           the maximum non-zero bin in the histogram (represents peak
                           queue length seen). If False, use cumulative average 
                           (original behavior, which doesn't reflect current state).
+
+    Binary files written with QLEN_MON_FORMAT 1 already hold per-interval deltas
+    and are aggregated with NumPy instead of being parsed line by line.
     """
+    if is_qlen_delta_file(file_path):
+        times, qlen = qlen_average(read_qlen_deltas(file_path), cumulative=not use_instantaneous)
+        return times.tolist(), {key: series.tolist() for key, series in qlen.items()}
+
     times_ns = []
     qlen = {}
     prev_counts = {}  # Store previous histogram to compute incremental changes
@@ -117,6 +125,11 @@ def main():
             "Optional list of port labels to keep. Supports formats: SW9-P1, S9-1, SW9-1."
         ),
     )
+    parser.add_argument(
+        "--file",
+        default=QLEN_FILE,
+        help="Queue length monitor output, text or binary (QLEN_MON_FORMAT 1). Default: {}".format(QLEN_FILE),
+    )
     args = parser.parse_args()
 
     def parse_include_label(lbl: str):
@@ -140,15 +153,15 @@ def main():
             return (int(node_str), int(port_str))
         return None
 
-    if not os.path.exists(QLEN_FILE):
-        print("QLEN file not found: {}".format(QLEN_FILE))
+    if not os.path.exists(args.file):
+        print("QLEN file not found: {}".format(args.file))
         return
 
     # Use instantaneous queue length estimation instead of cumulative average
     # This better reflects the current queue state rather than historical average
-    times_ns, qlen = parse_qlen(QLEN_FILE, use_instantaneous=True)
+    times_ns, qlen = parse_qlen(args.file, use_instantaneous=True)
     if not times_ns:
-        print("No time points parsed from {}".format(QLEN_FILE))
+        print("No time points parsed from {}".format(args.file))
         return
 
     times_ms = [t / 1e6 for t in times_ns]
@@ -10,33 +10,52 @@ import numpy as np
 import sys
 import os
 from pathlib import Path
+from downsample import axes_pixel_width, envelope_index, plot_envelope
+from monitor_format import (INGRESS_RECORD_DTYPE, ingress_change_interval, ingress_end_time,
+                            ingress_forward_fill, is_ingress_file, read_ingress)
+
+PLOT_DPI = 150
 
 def parse_ingress_file(filepath):
-    """解析ingress_queue.txt文件"""
-    data = []
-    current_time = 0
-    
-    with open(filepath, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('#') or not line:
-                continue
-            if line.startswith('time:'):
-                current_time = int(line.split(':')[1].strip())
-            else:
-                parts = line.split()
-                if len(parts) >= 6:
-                    data.append({
-                        'time_ns': current_time,
-                        'switch_id': int(parts[0]),
-                        'port_id': int(parts[1]),
-                        'ingress_bytes': int(parts[2]),
-                        'egress_bytes': int(parts[3]),
-                        'hdrm_bytes': int(parts[4]),
-                        'paused': int(parts[5])
-                    })
-    
-    return pd.DataFrame(data)
+    """解析ingress_queue.txt文件 (文本或 INGRESS_MON_FORMAT 1 的二进制格式)
+
+    INGRESS_MON_CHANGE_ONLY 1 的输出只含变化的行，读入后按采样周期向前填充。
+    """
+    if is_ingress_file(filepath):
+        rec = read_ingress(filepath)
+    else:
+        rows = []
+        current_time = 0
+        interval = None
+        t_end = None
+        with open(filepath, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('#'):
+                    interval = ingress_change_interval(line) or interval
+                    t_end = ingress_end_time(line) or t_end
+                    continue
+                if not line:
+                    continue
+                if line.startswith('time:'):
+                    current_time = int(line.split(':')[1].strip())
+                else:
+                    parts = line.split()
+                    if len(parts) >= 6:
+                        rows.append((current_time, *map(int, parts[:6])))
+        rec = np.array(rows, dtype=INGRESS_RECORD_DTYPE)
+        if interval:
+            rec = ingress_forward_fill(rec, interval, t_end)
+
+    return pd.DataFrame({
+        'time_ns': rec['time'].astype(np.int64),
+        'switch_id': rec['node'].astype(np.int64),
+        'port_id': rec['port'].astype(np.int64),
+        'ingress_bytes': rec['ingress'].astype(np.int64),
+        'egress_bytes': rec['egress'].astype(np.int64),
+        'hdrm_bytes': rec['hdrm'].astype(np.int64),
+        'paused': rec['paused'].astype(np.int64)
+    })
 
 def load_topology(topo_file):
     """加载拓扑文件获取节点信息"""
@@ -90,8 +109,8 @@ def plot_ingress_analysis(df, output_dir, node_names=None):
         for i, port in enumerate(ports):
             port_data = sw_data[sw_data['port_id'] == port]
             if port_data['ingress_bytes'].max() > 0:
-                ax1.plot(port_data['time_us'], port_data['ingress_bytes']/1024, 
-                        label=f'P{port}', color=colors[i], linewidth=1)
+                plot_envelope(ax1, port_data['time_us'], port_data['ingress_bytes']/1024, PLOT_DPI,
+                              label=f'P{port}', color=colors[i], linewidth=1)
         
         ax1.set_ylabel('Ingress Queue (KB)', fontsize=11)
         ax1.set_title(f'{sw_name} - Ingress Queue (PFC Trigger Basis: ingress_bytes)', fontsize=12)
@@ -108,8 +127,8 @@ def plot_ingress_analysis(df, output_dir, node_names=None):
         for i, port in enumerate(ports):
             port_data = sw_data[sw_data['port_id'] == port]
             if port_data['egress_bytes'].max() > 0:
-                ax2.plot(port_data['time_us'], port_data['egress_bytes']/1024, 
-                        label=f'P{port}', color=colors[i], linewidth=1)
+                plot_envelope(ax2, port_data['time_us'], port_data['egress_bytes']/1024, PLOT_DPI,
+                              label=f'P{port}', color=colors[i], linewidth=1)
         
         ax2.set_ylabel('Egress Queue (KB)', fontsize=11)
         ax2.set_title(f'{sw_name} - Egress Queue', fontsize=12)
@@ -126,6 +145,14 @@ def plot_ingress_analysis(df, output_dir, node_names=None):
             'paused': 'max'
         }).reset_index()
         
+        # 三条序列共用一组下标，保证 fill_between 的 where 掩码与数据对齐
+        n_cols = axes_pixel_width(ax3, PLOT_DPI)
+        keep = np.unique(np.concatenate([
+            envelope_index(time_groups['time_us'], time_groups[c], n_cols)
+            for c in ('ingress_bytes', 'egress_bytes', 'paused')
+        ]))
+        time_groups = time_groups.iloc[keep]
+        
         ax3.fill_between(time_groups['time_us'], 0, time_groups['ingress_bytes']/1024,
                         alpha=0.5, label='Total Ingress', color='blue')
         ax3.fill_between(time_groups['time_us'], 0, time_groups['egress_bytes']/1024,
@@ -146,7 +173,7 @@ def plot_ingress_analysis(df, output_dir, node_names=None):
         plt.tight_layout()
         
         output_file = os.path.join(output_dir, f'{sw_name}_ingress_analysis.png')
-        plt.savefig(output_file, dpi=150, bbox_inches='tight')
+        plt.savefig(output_file, dpi=PLOT_DPI, bbox_inches='tight')
         plt.close()
         print(f"Saved: {output_file}")
         
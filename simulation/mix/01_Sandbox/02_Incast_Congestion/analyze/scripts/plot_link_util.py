@@ -14,6 +14,8 @@ from typing import Optional, Set, Tuple
 
 import matplotlib.pyplot as plt
 
+from monitor_format import is_link_util_file, read_link_util, link_util_rates
+
 
 def parse_switch_nodes(topology_path: Path) -> set[int]:
     lines = [
@@ -37,6 +39,14 @@ def build_port_label(node_id: int, port_id: int, switch_nodes: set[int]) -> str:
 
 def parse_link_util(data_path: Path, switch_nodes: set[int]) -> dict[str, dict[str, list[float]]]:
     per_port = defaultdict(lambda: {"times": [], "throughput": [], "util": []})
+    if is_link_util_file(data_path):
+        # 二进制格式 (LINK_UTIL_MON_FORMAT 1)：整列读出后按端口切片
+        data = read_link_util(data_path)
+        times, throughput, util = link_util_rates(data)
+        for k, (node_id, port_id, _) in enumerate(data.ports):
+            per_port[build_port_label(int(node_id), int(port_id), switch_nodes)] = {
+                "times": times, "throughput": throughput[:, k], "util": util[:, k]}
+        return per_port
     current_time: Optional[int] = None
     for raw_line in data_path.read_text().splitlines():
         line = raw_line.strip()
@@ -66,7 +76,7 @@ def plot_throughput(port_data: dict[str, dict[str, list[float]]], include_labels
         if include_labels and label not in include_labels:
             continue
         series = port_data[label]
-        if not series["times"]:
+        if len(series["times"]) == 0:
             continue
         linestyle = "-" if label.startswith("H") else "--"
         ax.plot(series["times"], series["throughput"], label=label, linestyle=linestyle)
@@ -85,7 +95,7 @@ def plot_utilization(port_data: dict[str, dict[str, list[float]]], include_label
         if include_labels and label not in include_labels:
             continue
         series = port_data[label]
-        if not series["times"]:
+        if len(series["times"]) == 0:
             continue
         linestyle = "-" if label.startswith("H") else "--"
         ax.plot(series["times"], series["util"], label=label, linestyle=linestyle)
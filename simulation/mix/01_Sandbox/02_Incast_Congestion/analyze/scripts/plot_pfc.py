@@ -14,6 +14,9 @@ import numpy as np
 import argparse
 from pathlib import Path
 from collections import defaultdict
+from downsample import plot_envelope
+from monitor_format import (INGRESS_RECORD_DTYPE, ingress_change_interval, ingress_end_time,
+                            ingress_forward_fill, is_ingress_file, read_ingress)
 
 # --- Utilities ---
 
@@ -76,35 +79,48 @@ def parse_topology(topology_path):
     return switch_nodes, link_map
 
 def load_ingress_data(ingress_file):
-    """加载 ingress_queue.txt 数据"""
-    data = []
+    """加载 ingress_queue.txt 数据 (文本或二进制；按变化采样的输出会向前填充)"""
     if not ingress_file or not os.path.exists(ingress_file):
         return pd.DataFrame()
         
-    current_time = 0
     try:
-        with open(ingress_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'): continue
-                if line.startswith('time:'):
-                    current_time = int(line.split(':')[1].strip())
-                else:
-                    parts = line.split()
-                    if len(parts) >= 6:
-                        data.append({
-                            'time_us': current_time / 1000,
-                            'node': int(parts[0]),
-                            'port': int(parts[1]),
-                            'ingress_kb': int(parts[2]) / 1024,
-                            'egress_kb': int(parts[3]) / 1024,
-                            'hdrm_kb': int(parts[4]) / 1024,
-                            'paused': int(parts[5])
-                        })
+        if is_ingress_file(ingress_file):
+            rec = read_ingress(ingress_file)
+        else:
+            rows = []
+            current_time = 0
+            interval = None
+            t_end = None
+            with open(ingress_file, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line: continue
+                    if line.startswith('#'):
+                        interval = ingress_change_interval(line) or interval
+                        t_end = ingress_end_time(line) or t_end
+                        continue
+                    if line.startswith('time:'):
+                        current_time = int(line.split(':')[1].strip())
+                    else:
+                        parts = line.split()
+                        if len(parts) >= 6:
+                            rows.append((current_time, *map(int, parts[:6])))
+            rec = np.array(rows, dtype=INGRESS_RECORD_DTYPE)
+            if interval:
+                rec = ingress_forward_fill(rec, interval, t_end)
     except Exception as e:
         print(f"Warning: Error loading ingress data: {e}")
+        return pd.DataFrame()
         
-    return pd.DataFrame(data)
+    return pd.DataFrame({
+        'time_us': rec['time'] / 1000,
+        'node': rec['node'].astype(np.int64),
+        'port': rec['port'].astype(np.int64),
+        'ingress_kb': rec['ingress'] / 1024,
+        'egress_kb': rec['egress'] / 1024,
+        'hdrm_kb': rec['hdrm'] / 1024,
+        'paused': rec['paused'].astype(np.int64)
+    })
 
 def build_port_label(node_id, port_id, switch_nodes):
     node_id = int(node_id)
@@ -228,6 +244,8 @@ def plot_aggregate_pfc(df_pfc, output_dir, include_labels=None, switch_nodes=Non
 
 # --- Correlation Plotting (from old analyze_pfc.py) ---
 
+CORR_DPI = 150
+
 def plot_pfc_correlation(df_pfc, trace_dir, output_dir, switch_nodes, link_map, df_ingress, include_labels=None):
     """分析 PFC 与队列长度、链路利用率的关联"""
     trace_dir = Path(trace_dir)
@@ -279,7 +297,7 @@ def plot_pfc_correlation(df_pfc, trace_dir, output_dir, switch_nodes, link_map,
 
         # 1. Utilization
         if not port_util.empty:
-            axes[0].plot(port_util['time_us'], port_util['utilization_pct'], color='steelblue', label='Utilization')
+            plot_envelope(axes[0], port_util['time_us'], port_util['utilization_pct'], CORR_DPI, color='steelblue', label='Utilization')
         pauses = port_pfc[port_pfc['type'] == 'Pause']
         resumes = port_pfc[port_pfc['type'] == 'Resume']
         if not pauses.empty:
@@ -294,11 +312,11 @@ def plot_pfc_correlation(df_pfc, trace_dir, output_dir, switch_nodes, link_map,
         # 2. Queue Length (展示对端 Ingress 队列)
         max_val = 10
         if not peer_ingress.empty:
-            axes[1].plot(peer_ingress['time_us'], peer_ingress['ingress_kb'], color='darkorange', label='Peer Ingress Q (MMU)')
+            plot_envelope(axes[1], peer_ingress['time_us'], peer_ingress['ingress_kb'], CORR_DPI, color='darkorange', label='Peer Ingress Q (MMU)')
             axes[1].set_ylabel('Ingress Q (KB)')
             max_val = peer_ingress['ingress_kb'].max()
         elif not port_qlen.empty:
-            axes[1].plot(port_qlen['time_us'], port_qlen['qlen_kb'], color='coral', label='Local Egress Q (Trace)', alpha=0.5, ls='--')
+            plot_envelope(axes[1], port_qlen['time_us'], port_qlen['qlen_kb'], CORR_DPI, color='coral', label='Local Egress Q (Trace)', alpha=0.5, ls='--')
             axes[1].set_ylabel('Egress Q (KB)')
             max_val = port_qlen['qlen_kb'].max()
         
@@ -327,7 +345,7 @@ def plot_pfc_correlation(df_pfc, trace_dir, output_dir, switch_nodes, link_map,
         plt.suptitle(f'PFC Correlation Analysis: {label} (Triggered by {peer_label} Ingress Q)')
         plt.tight_layout()
         out_path = corr_dir / f'pfc_analysis_{label}.png'
-        plt.savefig(out_path, dpi=150)
+        plt.savefig(out_path, dpi=CORR_DPI)
         plt.close()
         print(f"  Saved correlation plot: {out_path}")
 
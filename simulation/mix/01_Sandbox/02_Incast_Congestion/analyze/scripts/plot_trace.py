@@ -4,14 +4,19 @@ NS3 Binary Trace Plotter
 合并了解析和可视化功能，直接从trace_out.tr生成图表
 """
 
+import hashlib
+import json
+import os
 import struct
 import sys
-from collections import defaultdict
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import argparse
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from downsample import plot_envelope
 
 # --- Parser Logic (from parse_trace.py) ---
 
@@ -60,141 +65,1047 @@ class SimSetting:
         self.win = struct.unpack('<I', data)[0]
         return True
 
-class TraceRecord:
-    """单条trace记录"""
-    STRUCT_FORMAT = '<QHBBIIIHBBBBxx'  # 前32字节
-    STRUCT_SIZE = 56
+# TraceFormat (src/point-to-point/model/trace-format.h) 的内存布局
+# 前32字节为公共头部，偏移32处为24字节的union，按 l3Prot 选择 data/cnp/ack/pfc 视图
+TRACE_DATA_DTYPE = np.dtype({
+    'names': ['sport', 'dport', 'seq', 'ts', 'pg', 'payload'],
+    'formats': ['<u2', '<u2', '<u4', '<u8', '<u2', '<u2'],
+    'offsets': [0, 2, 4, 8, 16, 18],
+    'itemsize': 24,
+})
+TRACE_CNP_DTYPE = np.dtype({
+    'names': ['fid', 'qIndex', 'ecnBits', 'qfb', 'total', 'seq'],
+    'formats': ['<u2', 'u1', 'u1', '<u2', '<u2', '<u4'],
+    'offsets': [0, 2, 3, 4, 6, 4],
+    'itemsize': 24,
+})
+TRACE_ACK_DTYPE = np.dtype({
+    'names': ['sport', 'dport', 'flags', 'pg', 'seq', 'ts'],
+    'formats': ['<u2', '<u2', '<u2', '<u2', '<u4', '<u8'],
+    'offsets': [0, 2, 4, 6, 8, 16],
+    'itemsize': 24,
+})
+TRACE_PFC_DTYPE = np.dtype({
+    'names': ['time', 'qlen', 'qIndex'],
+    'formats': ['<u4', '<u4', 'u1'],
+    'offsets': [0, 4, 8],
+    'itemsize': 24,
+})
+TRACE_DTYPE = np.dtype({
+    'names': ['time', 'node', 'intf', 'qidx', 'qlen', 'sip', 'dip', 'size',
+              'l3Prot', 'event', 'ecn', 'nodeType', 'data', 'cnp', 'ack', 'pfc'],
+    'formats': ['<u8', '<u2', 'u1', 'u1', '<u4', '<u4', '<u4', '<u2',
+                'u1', 'u1', 'u1', 'u1',
+                TRACE_DATA_DTYPE, TRACE_CNP_DTYPE, TRACE_ACK_DTYPE, TRACE_PFC_DTYPE],
+    'offsets': [0, 8, 10, 11, 12, 16, 20, 24, 26, 27, 28, 29, 32, 32, 32, 32],
+    'itemsize': 56,
+})
+TRACE_RECORD_SIZE = TRACE_DTYPE.itemsize
+
+# 流式模式下每次读入的记录数 (约56MB)
+DEFAULT_CHUNK_RECORDS = 1 << 20
+
+def read_trace_header(trace_file):
+    """读取SimSetting头部，返回 (SimSetting, 头部字节数)
+
+    块结构trace的头部字节数包含文件头。
+    """
+    sim_setting = SimSetting()
+    with open(trace_file, 'rb') as f:
+        head = f.read(TRACE_FILE_HEADER_SIZE)
+        if len(head) == TRACE_FILE_HEADER_SIZE and struct.unpack('<I', head[:4])[0] == TRACE_FILE_MAGIC:
+            version = struct.unpack('<I', head[4:])[0]
+            if version != TRACE_FILE_VERSION:
+                print(f"Warning: Unsupported block trace version {version}")
+        else:
+            f.seek(0)
+        if not sim_setting.deserialize(f):
+            print("Warning: Failed to read SimSetting")
+        header_size = f.tell()
+    return sim_setting, header_size
+
+def map_records(trace_file, header_size):
+    """以只读 memmap 方式映射头部之后的记录区，文件末尾不足一条记录的残余字节被忽略
+
+    块结构trace无法映射，解码全部块后返回内存数组。
+    """
+    table = BlockTable.scan(trace_file, header_size)
+    if table is not None:
+        return table.decode(trace_file)
+    count = (os.path.getsize(trace_file) - header_size) // TRACE_RECORD_SIZE
+    if count <= 0:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    return np.memmap(trace_file, dtype=TRACE_DTYPE, mode='r',
+                     offset=header_size, shape=(count,))
+
+def map_trace(trace_file):
+    """映射trace文件，返回 (SimSetting, 记录数组)
+
+    记录数组直接引用文件页面，按字段访问 (如 records['time']、records['data']['sport'])
+    不会为每条记录创建Python对象。
+    """
+    sim_setting, header_size = read_trace_header(trace_file)
+    return sim_setting, map_records(trace_file, header_size)
+
+def iter_trace_chunks(trace_file, header_size, chunk_records=DEFAULT_CHUNK_RECORDS, predicate=None):
+    """按固定记录数顺序读取trace，每块为独立的结构化数组，读完即可释放
+
+    块结构trace按块产出 (每次约 chunk_records 条)，并借助块头部跳过 predicate 不可能命中的块；
+    记录级过滤仍由调用方完成。
+    """
+    table = BlockTable.scan(trace_file, header_size)
+    if table is not None:
+        pending, pending_count = [], 0
+        for records in table.iter_blocks(trace_file, table.select(predicate)):
+            pending.append(records.view(f'V{TRACE_RECORD_SIZE}'))
+            pending_count += len(records)
+            if pending_count >= chunk_records:
+                yield np.concatenate(pending).view(TRACE_DTYPE)
+                pending, pending_count = [], 0
+        if pending:
+            yield np.concatenate(pending).view(TRACE_DTYPE)
+        return
+    chunk_bytes = chunk_records * TRACE_RECORD_SIZE
+    with open(trace_file, 'rb') as f:
+        f.seek(header_size)
+        while True:
+            buf = f.read(chunk_bytes)
+            count = len(buf) // TRACE_RECORD_SIZE
+            if count == 0:
+                break
+            yield np.frombuffer(buf, dtype=TRACE_DTYPE, count=count)
+
+def split_by_port(records):
+    """按 (node, intf) 稳定分组，同一端口内保持trace中的时间顺序
+
+    返回 [(port_key, {'time', 'qlen', 'event', 'size'})] 列表，按端口键排序。
+    """
+    if len(records) == 0:
+        return []
+    port_ids = (records['node'].astype(np.uint32) << 8) | records['intf']
+    order = np.argsort(port_ids, kind='stable')
+    port_ids = port_ids[order]
+    times = records['time'][order]
+    qlens = records['qlen'][order]
+    events = records['event'][order]
+    sizes = records['size'][order].astype(np.int64)
     
-    def __init__(self):
-        self.time = 0
-        self.node = 0
-        self.intf = 0
-        self.qidx = 0
-        self.qlen = 0
-        self.sip = 0
-        self.dip = 0
-        self.size = 0
-        self.l3Prot = 0
-        self.event = 0
-        self.ecn = 0
-        self.nodeType = 0
-        self.sport = 0
-        self.dport = 0
-        self.seq = 0
-        self.ts = 0
-        self.pg = 0
-        self.payload = 0
+    bounds = np.flatnonzero(np.diff(port_ids)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(port_ids)]))
     
-    def deserialize(self, file):
-        data = file.read(self.STRUCT_SIZE)
-        if len(data) < self.STRUCT_SIZE:
-            return False
-        
-        (self.time, self.node, self.intf, self.qidx, 
-         self.qlen, self.sip, self.dip, self.size,
-         self.l3Prot, self.event, self.ecn, self.nodeType) = struct.unpack(
-            self.STRUCT_FORMAT, data[:32])
+    groups = []
+    for lo, hi in zip(starts, ends):
+        port_key = (int(port_ids[lo] >> 8), int(port_ids[lo] & 0xff))
+        groups.append((port_key, {
+            'time': times[lo:hi],
+            'qlen': qlens[lo:hi],
+            'event': events[lo:hi],
+            'size': sizes[lo:hi],
+        }))
+    return groups
+
+DEFAULT_UTIL_BIN_NS = 10000  # 10us
+
+def bin_tx_bytes(t, sz, bin_ns):
+    """把出队字节按固定窗口 [k*bin_ns, (k+1)*bin_ns) 分箱
+
+    返回 (首个箱号, 每箱字节数)，首末箱之间没有出队的箱补0。
+    """
+    bins = t // bin_ns
+    first = int(bins[0])
+    counts = np.bincount((bins - first).astype(np.int64), weights=sz)
+    return first, counts.astype(np.int64)
+
+def utilization_frame(node, intf, first_bin, bin_bytes, tx_base, port_speed, bin_ns):
+    """按箱生成利用率样本，语义同 third.cc 中的 monitor_link_utilization：
+    每个窗口结束时刻输出累计发送字节、窗口内吞吐量 (Gbps) 与利用率 (%, 上限100)"""
+    end_ns = (first_bin + 1 + np.arange(len(bin_bytes), dtype=np.int64)) * bin_ns
+    tp = bin_bytes * 8.0 / bin_ns
+    util = tp * 1e9 / port_speed * 100
+    return pd.DataFrame({
+        'time_us': end_ns / 1000,
+        'node': node,
+        'port': intf,
+        'tx_bytes_total': tx_base + np.cumsum(bin_bytes),
+        'throughput_gbps': tp,
+        'utilization_pct': np.minimum(util, 100.0)
+    })
+
+def concat_frames(frames):
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def build_port_stats(records):
+    """由记录数组构建 {(node, intf): {name: (times, values)}}，发送/接收字节为区间内累计值"""
+    port_stats = {}
+    for port_key, cols in split_by_port(records):
+        t, ev, sz = cols['time'], cols['event'], cols['size']
+        enqu = ev == EVENT_ENQU
+        dequ = ev == EVENT_DEQU
+        recv = ev == EVENT_RECV
+        drop = ev == EVENT_DROP
+        port_stats[port_key] = {
+            'queue_len': (t, cols['qlen']),
+            'enqueue_events': (t[enqu], sz[enqu]),
+            'dequeue_events': (t[dequ], sz[dequ]),
+            'tx_bytes': (t[dequ], np.cumsum(sz[dequ])),
+            'rx_bytes': (t[recv], np.cumsum(sz[recv])),
+            'drop_events': (t[drop], sz[drop]),
+        }
+    return port_stats
+
+# 跨分片合并时需要加上前序分片末尾累计值的序列
+CUMULATIVE_STATS = ('tx_bytes', 'rx_bytes')
+
+def analyze_shard(trace_file, start, stop):
+    """工作进程：分析 [start, stop) 区间，原始格式为记录下标，块结构格式为块号"""
+    _, header_size = read_trace_header(trace_file)
+    table = BlockTable.scan(trace_file, header_size)
+    if table is not None:
+        return build_port_stats(table.decode(trace_file, range(start, stop)))
+    return build_port_stats(map_records(trace_file, header_size)[start:stop])
+
+def merge_port_stats(parts):
+    """按文件顺序合并各分片的端口统计，修正累计收发字节的分片边界偏移"""
+    pieces = {}
+    for part in parts:
+        for port_key, stats in part.items():
+            port_pieces = pieces.setdefault(port_key, {name: ([], []) for name in stats})
+            for name, (t, v) in stats.items():
+                times, values = port_pieces[name]
+                if name in CUMULATIVE_STATS and len(v) and values:
+                    v = v + values[-1][-1]
+                if len(t):
+                    times.append(t)
+                    values.append(v)
+    
+    merged = {}
+    for port_key in sorted(pieces):
+        merged[port_key] = {}
+        for name, (times, values) in pieces[port_key].items():
+            if times:
+                merged[port_key][name] = (np.concatenate(times), np.concatenate(values))
+            else:
+                merged[port_key][name] = (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64))
+    return merged
+
+def analyze_parallel(trace_file, count, jobs):
+    """按记录 (块结构格式为块) 边界把trace切成 jobs 个连续分片，多进程并行解析后合并"""
+    bounds = np.linspace(0, count, jobs + 1, dtype=np.int64)
+    print(f"  Decoding {count} records/blocks in {jobs} shards...")
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(analyze_shard, str(trace_file), int(lo), int(hi))
+                   for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+        parts = [f.result() for f in futures]
+    return merge_port_stats(parts)
+
+# --- Block Trace Format ---
+
+# 与 src/point-to-point/model/trace-writer.h 对应：TRACE_BLOCK_RECORDS > 0 时仿真器写出块结构trace，
+# 文件头 + SimSetting 之后为若干 [TraceBlockHeader][节点位图][负载] 块
+TRACE_FILE_MAGIC = 0x42544b48   # "HKTB"
+TRACE_BLOCK_MAGIC = 0x4b4c4254  # "TBLK"
+TRACE_FILE_VERSION = 1
+TRACE_FILE_HEADER_SIZE = 8
+TRACE_CODEC_NONE = 0
+TRACE_CODEC_ZLIB = 1
+TRACE_BLOCK_HEADER_DTYPE = np.dtype({
+    'names': ['magic', 'count', 'tFirst', 'tLast', 'nodeMin', 'bitmapBytes', 'codec',
+              'rawBytes', 'compBytes'],
+    'formats': ['<u4', '<u4', '<u8', '<u8', '<u2', '<u2', 'u1', '<u4', '<u4'],
+    'offsets': [0, 4, 8, 16, 24, 26, 28, 32, 36],
+    'itemsize': 40,
+})
+
+def is_block_trace(trace_file):
+    with open(trace_file, 'rb') as f:
+        head = f.read(TRACE_FILE_HEADER_SIZE)
+    return len(head) == TRACE_FILE_HEADER_SIZE and struct.unpack('<I', head[:4])[0] == TRACE_FILE_MAGIC
+
+class BlockTable:
+    """块结构trace的块目录：各块头部、节点位图与负载偏移，只读头部不解压负载"""
+    def __init__(self, headers, bitmaps, offsets):
+        self.headers = headers
+        self.bitmaps = bitmaps
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.headers)
+
+    @property
+    def num_records(self):
+        return int(self.headers['count'].sum())
+
+    @classmethod
+    def scan(cls, trace_file, header_size):
+        """顺序跳读各块头部；非块结构trace返回 None，截断的末尾块被忽略"""
+        if not is_block_trace(trace_file):
+            return None
+        size = os.path.getsize(trace_file)
+        headers, bitmaps, offsets = [], [], []
+        hsize = TRACE_BLOCK_HEADER_DTYPE.itemsize
+        with open(trace_file, 'rb') as f:
+            pos = header_size
+            while pos + hsize <= size:
+                f.seek(pos)
+                header = np.frombuffer(f.read(hsize), dtype=TRACE_BLOCK_HEADER_DTYPE)[0]
+                if header['magic'] != TRACE_BLOCK_MAGIC:
+                    print(f"Warning: Bad trace block magic at offset {pos}, ignoring the rest")
+                    break
+                bitmap = np.frombuffer(f.read(int(header['bitmapBytes'])), dtype=np.uint8)
+                payload = pos + hsize + int(header['bitmapBytes'])
+                if payload + int(header['compBytes']) > size:
+                    break
+                headers.append(header)
+                bitmaps.append(bitmap)
+                offsets.append(payload)
+                pos = payload + int(header['compBytes'])
+        return cls(np.array(headers, dtype=TRACE_BLOCK_HEADER_DTYPE), bitmaps,
+                   np.array(offsets, dtype=np.int64))
+
+    def has_nodes(self, i, nodes):
+        """块 i 的节点位图是否包含 nodes 中任一节点"""
+        present = np.unpackbits(self.bitmaps[i], bitorder='little')
+        rel = np.fromiter(nodes, dtype=np.int64) - int(self.headers['nodeMin'][i])
+        rel = rel[(rel >= 0) & (rel < len(present))]
+        return bool(present[rel].any())
+
+    def select(self, predicate=None):
+        """按块头部的时间范围与节点位图筛选块号 (升序)，predicate 为 None 时返回全部块"""
+        selected = np.ones(len(self), dtype=bool)
+        if predicate is None:
+            return np.flatnonzero(selected)
+        if predicate.t_start is not None:
+            selected &= self.headers['tLast'] >= predicate.t_start
+        if predicate.t_end is not None:
+            selected &= self.headers['tFirst'] <= predicate.t_end
+        nodes = predicate.nodes
+        if predicate.ports is not None:
+            port_nodes = {node for node, _ in predicate.ports}
+            nodes = port_nodes if nodes is None else set(nodes) & port_nodes
+        if nodes is not None:
+            for i in np.flatnonzero(selected):
+                selected[i] = self.has_nodes(i, nodes)
+        return np.flatnonzero(selected)
+
+    def read_block(self, f, i):
+        """读取并解压第 i 块，返回原始字节"""
+        header = self.headers[i]
+        f.seek(int(self.offsets[i]))
+        payload = f.read(int(header['compBytes']))
+        if header['codec'] == TRACE_CODEC_ZLIB:
+            payload = zlib.decompress(payload)
+        elif header['codec'] != TRACE_CODEC_NONE:
+            raise ValueError(f"Unknown trace block codec {int(header['codec'])}")
+        return payload
+
+    def iter_blocks(self, trace_file, block_ids=None):
+        """逐块解码为记录数组"""
+        ids = range(len(self)) if block_ids is None else block_ids
+        with open(trace_file, 'rb') as f:
+            for i in ids:
+                yield np.frombuffer(self.read_block(f, i), dtype=TRACE_DTYPE)
+
+    def decode(self, trace_file, block_ids=None):
+        """解码指定块 (默认全部) 并按文件顺序拼接"""
+        ids = range(len(self)) if block_ids is None else block_ids
+        with open(trace_file, 'rb') as f:
+            payload = b''.join(self.read_block(f, i) for i in ids)
+        return np.frombuffer(payload, dtype=TRACE_DTYPE)
+
+# --- Decode Cache ---
+
+# 缓存格式版本，改动 port_stats 结构时递增以使旧缓存失效
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.cache.npz'
+
+def sidecar_path(trace_file, suffix):
+    trace_file = Path(trace_file)
+    return trace_file.with_name(trace_file.name + suffix)
+
+def cache_path_for(trace_file):
+    return sidecar_path(trace_file, CACHE_SUFFIX)
+
+def trace_fingerprint(trace_file, header_size):
+    """缓存有效性键：文件大小、修改时间与SimSetting头部摘要"""
+    st = os.stat(trace_file)
+    with open(trace_file, 'rb') as f:
+        header_digest = hashlib.sha1(f.read(header_size)).hexdigest()
+    return {
+        'version': CACHE_VERSION,
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'header_sha1': header_digest,
+    }
+
+def load_port_stats_cache(trace_file, fingerprint):
+    """读取旁路缓存，缓存不存在或已过期时返回 None"""
+    path = cache_path_for(trace_file)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as cache:
+            meta = json.loads(str(cache['__meta__']))
+            if meta != fingerprint:
+                print(f"Decode cache is stale, rebuilding: {path}")
+                return None
+            port_stats = {}
+            for key in cache.files:
+                if key == '__meta__':
+                    continue
+                node, intf, name, col = key.split('.')
+                stats = port_stats.setdefault((int(node), int(intf)), {})
+                pair = stats.setdefault(name, [None, None])
+                pair[0 if col == 't' else 1] = cache[key]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Ignoring unreadable decode cache {path}: {e}")
+        return None
+    return {port_key: {name: tuple(pair) for name, pair in stats.items()}
+            for port_key, stats in sorted(port_stats.items())}
+
+def save_port_stats_cache(trace_file, fingerprint, port_stats):
+    """按端口分区保存解码后的列，先写临时文件再原子替换"""
+    path = cache_path_for(trace_file)
+    arrays = {'__meta__': np.array(json.dumps(fingerprint, sort_keys=True))}
+    for (node, intf), stats in port_stats.items():
+        for name, (t, v) in stats.items():
+            arrays[f'{node}.{intf}.{name}.t'] = t
+            arrays[f'{node}.{intf}.{name}.v'] = v
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not write decode cache {path}: {e}")
+        return
+    print(f"Decode cache saved to {path}")
+
+# --- Block Index ---
+
+# 索引把记录区按固定记录数切块，记录每块的时间范围和出现过的端口。
+# trace按仿真时间顺序写出，时间窗口可二分定位到块；端口查询只读包含该端口的块。
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.index.npz'
+INDEX_BLOCK_RECORDS = 1 << 14
+
+def port_id_of(node, intf):
+    return (int(node) << 8) | int(intf)
+
+class TraceIndex:
+    """trace_out.tr 的块索引：块时间范围 + 端口到块列表 (CSR)"""
+    def __init__(self, block_records, first_time, last_time, port_ids, port_indptr, port_blocks):
+        self.block_records = block_records
+        self.first_time = first_time
+        self.last_time = last_time
+        self.port_ids = port_ids
+        self.port_indptr = port_indptr
+        self.port_blocks = port_blocks
+
+    @property
+    def num_blocks(self):
+        return len(self.first_time)
+
+    @classmethod
+    def build(cls, trace_file, header_size, block_records=INDEX_BLOCK_RECORDS):
+        """单遍顺序扫描构建索引，内存占用与trace大小无关"""
+        chunk_records = block_records * max(1, DEFAULT_CHUNK_RECORDS // block_records)
+        first_time, last_time, pair_parts = [], [], []
+        block_base = 0
+        for records in iter_trace_chunks(trace_file, header_size, chunk_records):
+            times = records['time']
+            starts = np.arange(0, len(records), block_records)
+            first_time.append(times[starts])
+            last_time.append(times[np.minimum(starts + block_records, len(records)) - 1])
+            
+            block_ids = block_base + np.arange(len(records), dtype=np.int64) // block_records
+            port_ids = (records['node'].astype(np.int64) << 8) | records['intf']
+            pair_parts.append(np.unique((port_ids << 32) | block_ids))
+            block_base += len(starts)
         
-        union_data = data[32:56]
-        if len(union_data) >= 20:
-            (self.sport, self.dport, self.seq, self.ts, 
-             self.pg, self.payload) = struct.unpack('<HHIQHH', union_data[:20])
+        if not pair_parts:
+            empty = np.empty(0, dtype=np.int64)
+            return cls(block_records, empty.astype(np.uint64), empty.astype(np.uint64),
+                       empty, np.zeros(1, dtype=np.int64), empty)
         
-        return True
+        # 按 (端口, 块) 排序后的唯一对，即端口的CSR块列表
+        pairs = np.unique(np.concatenate(pair_parts))
+        pair_ports = pairs >> 32
+        port_ids, counts = np.unique(pair_ports, return_counts=True)
+        port_indptr = np.concatenate(([0], np.cumsum(counts)))
+        return cls(block_records, np.concatenate(first_time), np.concatenate(last_time),
+                   port_ids, port_indptr, pairs & 0xffffffff)
+
+    def blocks_for(self, ports=None, t_start=None, t_end=None):
+        """返回可能包含所查端口/时间窗口 [t_start, t_end] 内记录的块号 (升序)"""
+        selected = np.ones(self.num_blocks, dtype=bool)
+        if t_start is not None:
+            selected &= self.last_time >= t_start
+        if t_end is not None:
+            selected &= self.first_time <= t_end
+        if ports is not None:
+            port_mask = np.zeros(self.num_blocks, dtype=bool)
+            for port_id in ports:
+                i = np.searchsorted(self.port_ids, port_id)
+                if i < len(self.port_ids) and self.port_ids[i] == port_id:
+                    port_mask[self.port_blocks[self.port_indptr[i]:self.port_indptr[i + 1]]] = True
+            selected &= port_mask
+        return np.flatnonzero(selected)
+
+    def save(self, path, fingerprint):
+        meta = dict(fingerprint, version=INDEX_VERSION)
+        tmp_path = path.with_name(path.name + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, __meta__=np.array(json.dumps(meta, sort_keys=True)),
+                         block_records=np.array(self.block_records),
+                         first_time=self.first_time, last_time=self.last_time,
+                         port_ids=self.port_ids, port_indptr=self.port_indptr,
+                         port_blocks=self.port_blocks)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write trace index {path}: {e}")
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """读取索引，不存在或与trace不匹配时返回 None"""
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as idx:
+                if json.loads(str(idx['__meta__'])) != dict(fingerprint, version=INDEX_VERSION):
+                    return None
+                return cls(int(idx['block_records']), idx['first_time'], idx['last_time'],
+                           idx['port_ids'], idx['port_indptr'], idx['port_blocks'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable trace index {path}: {e}")
+            return None
+
+def load_or_build_index(trace_file, header_size):
+    path = sidecar_path(trace_file, INDEX_SUFFIX)
+    fingerprint = trace_fingerprint(trace_file, header_size)
+    index = TraceIndex.load(path, fingerprint)
+    if index is None:
+        print(f"Building trace index: {path}")
+        index = TraceIndex.build(trace_file, header_size)
+        index.save(path, fingerprint)
+    return index
+
+def field_lut(values, size):
+    """把取值集合转为查找表，lut[column] 即为逐记录的布尔掩码"""
+    lut = np.zeros(size, dtype=bool)
+    lut[np.fromiter(values, dtype=np.int64)] = True
+    return lut
+
+class TracePredicate:
+    """记录过滤条件 (谓词下推)，各项为 None 表示不过滤
+
+    ports 为 {(node, intf)}，events/node_types/nodes/intfs 为取值集合，
+    t_start/t_end 为闭区间时间窗口 (ns)。端口、节点、时间条件借助块索引跳过无关块，
+    其余条件在映射缓冲区上以查找表掩码过滤，均发生在聚合与DataFrame构造之前。
+    """
+    def __init__(self, ports=None, t_start=None, t_end=None, events=None,
+                 node_types=None, nodes=None, intfs=None):
+        self.ports = ports
+        self.t_start = t_start
+        self.t_end = t_end
+        self.events = events
+        self.node_types = node_types
+        self.nodes = nodes
+        self.intfs = intfs
+
+    @property
+    def is_empty(self):
+        return all(v is None for v in vars(self).values())
+
+    @property
+    def uses_index(self):
+        """是否存在可由块索引下推的条件"""
+        return any(v is not None for v in (self.ports, self.t_start, self.t_end, self.nodes, self.intfs))
+
+    def port_ids(self, index):
+        """索引中满足端口/节点/接口条件的端口号集合，无相关条件时为 None"""
+        ids = None
+        if self.ports is not None:
+            ids = {port_id_of(node, intf) for node, intf in self.ports}
+        if self.nodes is not None or self.intfs is not None:
+            candidates = index.port_ids
+            keep = np.ones(len(candidates), dtype=bool)
+            if self.nodes is not None:
+                keep &= np.isin(candidates >> 8, np.fromiter(self.nodes, dtype=np.int64))
+            if self.intfs is not None:
+                keep &= np.isin(candidates & 0xff, np.fromiter(self.intfs, dtype=np.int64))
+            matched = {int(pid) for pid in candidates[keep]}
+            ids = matched if ids is None else ids & matched
+        return ids
+
+    def mask(self, records):
+        mask = np.ones(len(records), dtype=bool)
+        if self.ports is not None:
+            port_ids = (records['node'].astype(np.int64) << 8) | records['intf']
+            mask &= np.isin(port_ids, np.fromiter((port_id_of(*p) for p in self.ports), dtype=np.int64))
+        if self.t_start is not None:
+            mask &= records['time'] >= self.t_start
+        if self.t_end is not None:
+            mask &= records['time'] <= self.t_end
+        if self.events is not None:
+            mask &= field_lut(self.events, 256)[records['event']]
+        if self.node_types is not None:
+            mask &= field_lut(self.node_types, 256)[records['nodeType']]
+        if self.nodes is not None:
+            mask &= field_lut(self.nodes, 1 << 16)[records['node']]
+        if self.intfs is not None:
+            mask &= field_lut(self.intfs, 256)[records['intf']]
+        return mask
+
+def select_records(records, predicate, index=None):
+    """只读取索引命中的块，再按谓词逐记录精确过滤"""
+    selected = records
+    if index is not None:
+        blocks = index.blocks_for(predicate.port_ids(index), predicate.t_start, predicate.t_end)
+        if len(blocks) == 0:
+            return np.empty(0, dtype=TRACE_DTYPE)
+        if len(blocks) < index.num_blocks:
+            # 合并相邻块为连续区间，减少切片次数
+            breaks = np.flatnonzero(np.diff(blocks) != 1) + 1
+            parts = []
+            for run in np.split(blocks, breaks):
+                lo = int(run[0]) * index.block_records
+                hi = min((int(run[-1]) + 1) * index.block_records, len(records))
+                parts.append(np.asarray(records[lo:hi]).view(f'V{TRACE_RECORD_SIZE}'))
+            # 以原始字节拼接：对重叠字段的dtype直接concatenate会被展开为非union布局
+            selected = np.concatenate(parts).view(TRACE_DTYPE)
+    return selected[predicate.mask(selected)]
 
 class TraceAnalyzer:
     """Trace文件分析器"""
     def __init__(self, trace_file):
         self.trace_file = Path(trace_file)
         self.sim_setting = SimSetting()
-        self.records = []
-        self.port_stats = defaultdict(lambda: {
-            'tx_bytes': [],
-            'rx_bytes': [],
-            'queue_len': [],
-            'enqueue_events': [],
-            'dequeue_events': [],
-            'drop_events': []
-        })
+        self._records = np.empty(0, dtype=TRACE_DTYPE)
+        self.header_size = 0
+        # 块结构trace的块目录，原始格式为 None
+        self.block_table = None
+        self.selected = False
+        # {(node, intf): {name: (times, values)}}，每项均为按时间排序的NumPy数组
+        self.port_stats = {}
+    
+    @property
+    def records(self):
+        """记录数组；块结构trace在首次访问时才解码全部块"""
+        if self._records is None:
+            self._records = self.block_table.decode(self.trace_file)
+        return self._records
+    
+    @records.setter
+    def records(self, records):
+        self._records = records
         
     def parse(self):
         print(f"Parsing trace file: {self.trace_file}")
-        with open(self.trace_file, 'rb') as f:
-            if not self.sim_setting.deserialize(f):
-                print("Warning: Failed to read SimSetting")
-            
-            count = 0
-            while True:
-                record = TraceRecord()
-                if not record.deserialize(f):
-                    break
-                self.records.append(record)
-                count += 1
-                if count % 50000 == 0:
-                    print(f"  Parsed {count} records...", end='\r')
-            print(f"\nTotal records parsed: {count}")
+        self.sim_setting, self.header_size = read_trace_header(self.trace_file)
+        self.block_table = BlockTable.scan(self.trace_file, self.header_size)
+        if self.block_table is not None:
+            self._records = None
+            print(f"Total records in blocks: {self.block_table.num_records} ({len(self.block_table)} blocks)")
+            return
+        self.records = map_records(self.trace_file, self.header_size)
+        print(f"Total records mapped: {len(self.records)}")
     
-    def analyze(self):
+    def select(self, predicate):
+        """只保留满足 TracePredicate 的记录
+
+        选择后的发送/接收累计字节从窗口起点开始计数；结果不写入解码缓存。
+        """
+        if predicate.is_empty:
+            return
+        if self.block_table is not None and self._records is None:
+            # 块结构trace直接按块头部跳过无关块，只解压命中的块
+            block_ids = self.block_table.select(predicate)
+            records = self.block_table.decode(self.trace_file, block_ids)
+            self.records = records[predicate.mask(records)]
+            self.selected = True
+            print(f"Selected {len(self.records)} of {self.block_table.num_records} records "
+                  f"({len(block_ids)}/{len(self.block_table)} trace blocks read)")
+            return
+        total = len(self.records)
+        index = None
+        if predicate.uses_index:
+            index = load_or_build_index(self.trace_file, self.header_size)
+        self.records = select_records(self.records, predicate, index)
+        self.selected = True
+        blocks = ''
+        if index is not None:
+            read = len(index.blocks_for(predicate.port_ids(index), predicate.t_start, predicate.t_end))
+            blocks = f" ({read}/{index.num_blocks} index blocks read)"
+        print(f"Selected {len(self.records)} of {total} records{blocks}")
+    
+    def analyze(self, jobs=1, use_cache=True):
         print("Analyzing trace data...")
-        tx_cumulative = defaultdict(lambda: defaultdict(int))
-        rx_cumulative = defaultdict(lambda: defaultdict(int))
+        use_cache = use_cache and not self.selected
+        fingerprint = None
+        if use_cache:
+            fingerprint = trace_fingerprint(self.trace_file, self.header_size)
+            port_stats = load_port_stats_cache(self.trace_file, fingerprint)
+            if port_stats is not None:
+                print(f"Loaded decoded columns from {cache_path_for(self.trace_file)}")
+                self.port_stats = port_stats
+                return
         
-        for rec in self.records:
-            port_key = (rec.node, rec.intf)
-            stats = self.port_stats[port_key]
-            stats['queue_len'].append((rec.time, rec.qlen))
-            
-            if rec.event == EVENT_ENQU:
-                stats['enqueue_events'].append((rec.time, rec.size))
-            elif rec.event == EVENT_DEQU:
-                stats['dequeue_events'].append((rec.time, rec.size))
-                tx_cumulative[rec.node][rec.intf] += rec.size
-                stats['tx_bytes'].append((rec.time, tx_cumulative[rec.node][rec.intf]))
-            elif rec.event == EVENT_RECV:
-                rx_cumulative[rec.node][rec.intf] += rec.size
-                stats['rx_bytes'].append((rec.time, rx_cumulative[rec.node][rec.intf]))
-            elif rec.event == EVENT_DROP:
-                stats['drop_events'].append((rec.time, rec.size))
-
-    def get_utilization_df(self):
-        rows = []
+        # 分片单位：原始格式为记录，块结构格式为块
+        shards = len(self.block_table) if self.block_table is not None else len(self.records)
+        if jobs > 1 and shards >= jobs and not self.selected:
+            self.port_stats = analyze_parallel(self.trace_file, shards, jobs)
+        else:
+            self.port_stats = build_port_stats(self.records)
+        
+        if use_cache:
+            save_port_stats_cache(self.trace_file, fingerprint, self.port_stats)
+
+    def get_utilization_df(self, bin_ns=DEFAULT_UTIL_BIN_NS):
+        frames = []
         for port_key, stats in self.port_stats.items():
             node, intf = port_key
-            if not stats['tx_bytes'] or len(stats['tx_bytes']) < 2:
+            t, sz = stats['dequeue_events']
+            if len(t) == 0:
                 continue
             
             port_speed = self.sim_setting.port_speed.get(node, {}).get(intf, 0)
             if port_speed == 0: continue
             
-            tx_series = stats['tx_bytes']
-            for i in range(1, len(tx_series)):
-                t1, b1 = tx_series[i-1]
-                t2, b2 = tx_series[i]
-                if t2 == t1: continue
-                tp = (b2 - b1) * 8 / (t2 - t1)
-                util = (tp * 1e9 / port_speed) * 100
-                rows.append({
-                    'time_us': t2 / 1000,
-                    'node': node,
-                    'port': intf,
-                    'throughput_gbps': tp,
-                    'utilization_pct': min(util, 100.0)
-                })
-        return pd.DataFrame(rows)
+            first_bin, bin_bytes = bin_tx_bytes(t, sz, bin_ns)
+            frames.append(utilization_frame(node, intf, first_bin, bin_bytes, 0, port_speed, bin_ns))
+        return concat_frames(frames)
 
     def get_qlen_df(self):
-        rows = []
+        frames = []
         for port_key, stats in self.port_stats.items():
             node, intf = port_key
-            for t, qlen in stats['queue_len']:
-                rows.append({
-                    'time_us': t / 1000,
-                    'node': node,
-                    'port': intf,
-                    'qlen_kb': qlen / 1000
-                })
+            t, qlen = stats['queue_len']
+            frames.append(pd.DataFrame({
+                'time_us': t / 1000,
+                'node': node,
+                'port': intf,
+                'qlen_kb': qlen / 1000
+            }))
+        return concat_frames(frames)
+
+    def get_event_stats_df(self):
+        rows = []
+        for (node, intf), stats in sorted(self.port_stats.items()):
+            tx, rx = stats['tx_bytes'][1], stats['rx_bytes'][1]
+            rows.append({
+                'node': node,
+                'port': intf,
+                'enqueue_count': len(stats['enqueue_events'][0]),
+                'dequeue_count': len(stats['dequeue_events'][0]),
+                'drop_count': len(stats['drop_events'][0]),
+                'total_tx_bytes': int(tx[-1]) if len(tx) else 0,
+                'total_rx_bytes': int(rx[-1]) if len(rx) else 0
+            })
         return pd.DataFrame(rows)
 
+class StreamingTraceAnalyzer:
+    """分块流式分析器，内存占用与trace大小无关
+
+    每块按端口分组后更新运行聚合量 (累计收发字节、事件计数)，
+    并把本块已完整的利用率窗口与队列长度样本直接追加写入CSV，不在内存中保留历史样本。
+    相邻两块之间只需携带每个端口最后一个 (可能未结束的) 利用率窗口。
+    """
+    def __init__(self, trace_file, chunk_records=DEFAULT_CHUNK_RECORDS, bin_ns=DEFAULT_UTIL_BIN_NS,
+                 predicate=None):
+        self.trace_file = Path(trace_file)
+        self.chunk_records = chunk_records
+        self.bin_ns = bin_ns
+        self.predicate = predicate if predicate is not None and not predicate.is_empty else None
+        self.sim_setting = SimSetting()
+        # {(node, intf): 运行聚合量}
+        self.port_totals = {}
+
+    def _totals(self, port_key):
+        totals = self.port_totals.get(port_key)
+        if totals is None:
+            totals = self.port_totals[port_key] = {
+                'enqueue_count': 0, 'dequeue_count': 0, 'drop_count': 0,
+                'total_tx_bytes': 0, 'total_rx_bytes': 0,
+                'tx_emitted': 0,  # 已输出窗口的累计字节
+                'open_bin': None,  # (箱号, 字节数)
+            }
+        return totals
+
+    def _process_chunk(self, records):
+        util_frames, qlen_frames = [], []
+        for port_key, cols in split_by_port(records):
+            node, intf = port_key
+            totals = self._totals(port_key)
+            t, ev, sz = cols['time'], cols['event'], cols['size']
+            
+            qlen_frames.append(pd.DataFrame({
+                'time_us': t / 1000,
+                'node': node,
+                'port': intf,
+                'qlen_kb': cols['qlen'] / 1000
+            }))
+            
+            dequ = ev == EVENT_DEQU
+            recv = ev == EVENT_RECV
+            totals['enqueue_count'] += int(np.count_nonzero(ev == EVENT_ENQU))
+            totals['dequeue_count'] += int(np.count_nonzero(dequ))
+            totals['drop_count'] += int(np.count_nonzero(ev == EVENT_DROP))
+            totals['total_rx_bytes'] += int(sz[recv].sum())
+            
+            if not dequ.any():
+                continue
+            tx_t, tx_sz = t[dequ], sz[dequ]
+            totals['total_tx_bytes'] += int(tx_sz.sum())
+            
+            # 把上一块未结束的窗口并入本块，除最后一个窗口外其余均已完整
+            first_bin, bin_bytes = bin_tx_bytes(tx_t, tx_sz, self.bin_ns)
+            if totals['open_bin'] is not None:
+                open_idx, open_bytes = totals['open_bin']
+                if first_bin == open_idx:
+                    bin_bytes[0] += open_bytes
+                else:
+                    gap = np.zeros(first_bin - open_idx - 1, dtype=np.int64)
+                    bin_bytes = np.concatenate(([open_bytes], gap, bin_bytes))
+                    first_bin = open_idx
+            totals['open_bin'] = (first_bin + len(bin_bytes) - 1, int(bin_bytes[-1]))
+            df_util = self._utilization_frame(node, intf, first_bin, bin_bytes[:-1])
+            if df_util is not None:
+                util_frames.append(df_util)
+        return concat_frames(util_frames), concat_frames(qlen_frames)
+
+    def _utilization_frame(self, node, intf, first_bin, bin_bytes):
+        """输出已完整的窗口并推进该端口的已输出字节数"""
+        port_speed = self.sim_setting.port_speed.get(node, {}).get(intf, 0)
+        totals = self.port_totals[(node, intf)]
+        tx_base = totals['tx_emitted']
+        totals['tx_emitted'] += int(bin_bytes.sum())
+        if port_speed == 0 or len(bin_bytes) == 0:
+            return None
+        return utilization_frame(node, intf, first_bin, bin_bytes, tx_base, port_speed, self.bin_ns)
+
+    def _flush_open_bins(self):
+        """trace结束时输出各端口最后一个窗口"""
+        frames = []
+        for (node, intf), totals in sorted(self.port_totals.items()):
+            if totals['open_bin'] is None:
+                continue
+            open_idx, open_bytes = totals['open_bin']
+            totals['open_bin'] = None
+            df_util = self._utilization_frame(node, intf, open_idx, np.array([open_bytes], dtype=np.int64))
+            if df_util is not None:
+                frames.append(df_util)
+        return concat_frames(frames)
+
+    def run(self, csv_dir):
+        """流式处理整个trace，结果写入 csv_dir"""
+        csv_path = Path(csv_dir)
+        csv_path.mkdir(parents=True, exist_ok=True)
+        print(f"Streaming trace file: {self.trace_file}")
+        self.sim_setting, header_size = read_trace_header(self.trace_file)
+        self.port_totals = {}
+        
+        util_header = 'time_us,node,port,tx_bytes_total,throughput_gbps,utilization_pct\n'
+        qlen_header = 'time_us,node,port,qlen_kb\n'
+        count = 0
+        with open(csv_path / 'trace_link_utilization.csv', 'w', newline='') as f_util, \
+             open(csv_path / 'trace_queue_length.csv', 'w', newline='') as f_qlen:
+            f_util.write(util_header)
+            f_qlen.write(qlen_header)
+            for records in iter_trace_chunks(self.trace_file, header_size, self.chunk_records, self.predicate):
+                count += len(records)
+                if self.predicate is not None:
+                    records = records[self.predicate.mask(records)]
+                df_util, df_qlen = self._process_chunk(records)
+                if not df_util.empty:
+                    df_util.to_csv(f_util, header=False, index=False)
+                if not df_qlen.empty:
+                    df_qlen.to_csv(f_qlen, header=False, index=False)
+                print(f"  Streamed {count} records...", end='\r')
+            df_util = self._flush_open_bins()
+            if not df_util.empty:
+                df_util.to_csv(f_util, header=False, index=False)
+        print(f"\nTotal records streamed: {count}")
+        
+        self.get_event_stats_df().to_csv(csv_path / 'trace_event_statistics.csv', index=False)
+
+    def get_event_stats_df(self):
+        rows = []
+        for (node, intf), totals in sorted(self.port_totals.items()):
+            row = {'node': node, 'port': intf}
+            row.update({k: v for k, v in totals.items() if k not in ('tx_emitted', 'open_bin')})
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+# --- Flow Analysis ---
+
+# l3Prot 取值 (见 qbb-helper.cc 中的 GetTraceFromPacket)
+L3_UDP = 0x11
+L3_PFC = 0xFE
+
+def ip_to_node(ip):
+    """与 third.cc 中 ip_to_node_id 相同的映射"""
+    return (ip >> 8) & 0xffff
+
+def factorize_flows(sip, dip, sport, dport, pg):
+    """对五元组做哈希分组，返回 (每条记录的流编号, 每条流首次出现的下标)
+
+    五元组共112位，先分别对 (sip, dip) 与 (sport, dport, pg) 两个64位键做
+    pd.factorize，再对两组编号的组合键做一次 factorize，全程不为每条流建Python对象。
+    """
+    ip_key = sip.astype(np.uint64) << np.uint64(32) | dip.astype(np.uint64)
+    port_key = (sport.astype(np.uint64) << np.uint64(32)
+                | dport.astype(np.uint64) << np.uint64(16)
+                | pg.astype(np.uint64))
+    ip_codes, _ = pd.factorize(ip_key)
+    port_codes, port_uniques = pd.factorize(port_key)
+    flow, uniques = pd.factorize(ip_codes.astype(np.int64) * len(port_uniques) + port_codes)
+    first = np.empty(len(uniques), dtype=np.int64)
+    first[flow[::-1]] = np.arange(len(flow) - 1, -1, -1)
+    return flow.astype(np.int64), first
+
+def pause_timeline(records):
+    """由trace中收到的PFC帧还原各队列的暂停状态
+
+    与 QbbNetDevice::Receive 一致：pfc.time > 0 暂停该队列，pfc.time == 0 恢复。
+    返回 {(node, intf, qIndex): (状态变化时刻, 变化后状态)}。
+    """
+    pfc = records[(records['l3Prot'] == L3_PFC) & (records['event'] == EVENT_RECV)]
+    if len(pfc) == 0:
+        return {}
+    df = pd.DataFrame({
+        'node': pfc['node'], 'intf': pfc['intf'], 'qidx': pfc['pfc']['qIndex'],
+        'time': pfc['time'].astype(np.int64), 'paused': (pfc['pfc']['time'] > 0).astype(np.int64),
+    })
+    return {key: (g['time'].to_numpy(), g['paused'].to_numpy())
+            for key, g in df.groupby(['node', 'intf', 'qidx'], sort=True)}
+
+def paused_between(ev_t, ev_state, t0, t1):
+    """队列在每个区间 [t0, t1] 内处于暂停状态的总时长 (ns)"""
+    # 每次状态变化时刻之前的累计暂停时长
+    cum = np.concatenate(([0], np.cumsum(np.diff(ev_t) * ev_state[:-1])))
+
+    def paused_until(t):
+        i = np.searchsorted(ev_t, t, side='right') - 1
+        valid = i >= 0
+        i = np.maximum(i, 0)
+        return np.where(valid, cum[i] + ev_state[i] * (t - ev_t[i]), 0)
+
+    return paused_until(t1) - paused_until(t0)
+
+class FlowAnalyzer:
+    """按五元组 (sip, dip, sport, dport, pg) 分析数据包的流级指标
+
+    - 吞吐: 目的主机 Recv 事件按 seq 去重后的 payload，按固定窗口分箱
+    - 每跳排队时延: 同一数据包在同一出端口上 Enqu 与 Dequ 的时间差
+      (数据包以 (流, seq, ts) 区分，ts 仅在 IntHeader TS 模式下非0，可区分重传；
+       同一键出现多次时按出现顺序配对，出端口队列为FIFO)
+    - 暂停时长: 每跳排队区间与该队列PFC暂停区间的重叠时长之和
+    """
+    def __init__(self, records, bin_ns=DEFAULT_UTIL_BIN_NS):
+        self.bin_ns = bin_ns
+        data = records[records['l3Prot'] == L3_UDP]
+        self.flow, first = factorize_flows(data['sip'], data['dip'], data['data']['sport'],
+                                           data['data']['dport'], data['data']['pg'])
+        self.num_flows = len(first)
+        head = data[first]
+        self.flows = pd.DataFrame({
+            'flow_id': np.arange(self.num_flows),
+            'sip': head['sip'], 'dip': head['dip'],
+            'src': ip_to_node(head['sip']), 'dst': ip_to_node(head['dip']),
+            'sport': head['data']['sport'], 'dport': head['data']['dport'], 'pg': head['data']['pg'],
+        })
+        self.data = data
+        self.pauses = pause_timeline(records)
+        self.hops = None
+        
+    def _delivered(self):
+        """目的主机首次收到的数据包 (按 (流, seq) 去重，重传不计入吞吐)"""
+        d = self.data
+        recv = (d['event'] == EVENT_RECV) & (d['nodeType'] == NODE_HOST)
+        flow = self.flow[recv]
+        seq = d['data']['seq'][recv].astype(np.int64)
+        first = ~pd.Series(flow << 32 | seq).duplicated().to_numpy()
+        return flow[first], d['time'][recv][first], d['data']['payload'][recv][first]
+
+    def get_goodput_df(self):
+        """每条流的吞吐时间序列，只输出有数据到达的窗口 (窗口结束时刻为 time_us)"""
+        flow, t, payload = self._delivered()
+        df = pd.DataFrame({'flow_id': flow, 'bin': t // self.bin_ns, 'bytes': payload.astype(np.int64)})
+        df = df.groupby(['flow_id', 'bin'], sort=True)['bytes'].sum().reset_index()
+        df['time_us'] = (df['bin'] + 1) * self.bin_ns / 1000
+        df['goodput_gbps'] = df['bytes'] * 8.0 / self.bin_ns
+        return df[['flow_id', 'time_us', 'bytes', 'goodput_gbps']]
+
+    def get_hop_delay_df(self):
+        """每个数据包在每一跳出端口的排队时延与其间的PFC暂停时长"""
+        if self.hops is not None:
+            return self.hops
+        d = self.data
+        keys = ['flow_id', 'seq', 'ts', 'node', 'intf', 'qidx']
+        sides = []
+        for event in (EVENT_ENQU, EVENT_DEQU):
+            m = d['event'] == event
+            side = pd.DataFrame({
+                'flow_id': self.flow[m], 'seq': d['data']['seq'][m], 'ts': d['data']['ts'][m],
+                'node': d['node'][m], 'intf': d['intf'][m], 'qidx': d['qidx'][m],
+                'time': d['time'][m].astype(np.int64),
+            })
+            side['nth'] = side.groupby(keys, sort=False).cumcount()
+            sides.append(side)
+        hops = sides[0].merge(sides[1], on=keys + ['nth'], suffixes=('_enq', '_deq'))
+        hops['delay_ns'] = hops['time_deq'] - hops['time_enq']
+        
+        paused = np.zeros(len(hops), dtype=np.int64)
+        if self.pauses:
+            for queue, idx in hops.groupby(['node', 'intf', 'qidx'], sort=False).indices.items():
+                timeline = self.pauses.get(tuple(int(v) for v in queue))
+                if timeline is not None:
+                    paused[idx] = paused_between(*timeline, hops['time_enq'].to_numpy()[idx],
+                                                 hops['time_deq'].to_numpy()[idx])
+        hops['paused_ns'] = paused
+        self.hops = hops[['flow_id', 'node', 'intf', 'qidx', 'seq', 'time_enq', 'time_deq',
+                          'delay_ns', 'paused_ns']].sort_values(['flow_id', 'time_deq'], kind='stable',
+                                                                  ignore_index=True)
+        return self.hops
+
+    def get_flow_summary_df(self):
+        flow, t, payload = self._delivered()
+        summary = self.flows.copy()
+        n = self.num_flows
+        summary['rx_packets'] = np.bincount(flow, minlength=n)
+        summary['rx_bytes'] = np.bincount(flow, weights=payload, minlength=n).astype(np.int64)
+        t_first = np.full(n, np.iinfo(np.int64).max)
+        t_last = np.zeros(n, dtype=np.int64)
+        np.minimum.at(t_first, flow, t.astype(np.int64))
+        np.maximum.at(t_last, flow, t.astype(np.int64))
+        has_rx = summary['rx_packets'].to_numpy() > 0
+        duration = np.where(has_rx, t_last - t_first, 0)
+        summary['first_rx_us'] = np.where(has_rx, t_first / 1000, np.nan)
+        summary['last_rx_us'] = np.where(has_rx, t_last / 1000, np.nan)
+        summary['avg_goodput_gbps'] = np.divide(summary['rx_bytes'] * 8.0, duration,
+                                                out=np.full(n, np.nan), where=duration > 0)
+        
+        hops = self.get_hop_delay_df()
+        per_flow = hops.groupby('flow_id').agg(
+            hop_samples=('delay_ns', 'size'), avg_delay_ns=('delay_ns', 'mean'),
+            max_delay_ns=('delay_ns', 'max'), paused_ns=('paused_ns', 'sum'))
+        summary = summary.join(per_flow, on='flow_id')
+        summary['hop_samples'] = summary['hop_samples'].fillna(0).astype(np.int64)
+        summary['paused_ns'] = summary['paused_ns'].fillna(0).astype(np.int64)
+        return summary
+
+    def run(self, csv_dir):
+        csv_path = Path(csv_dir)
+        csv_path.mkdir(parents=True, exist_ok=True)
+        print(f"Analyzing {self.num_flows} flows...")
+        self.get_flow_summary_df().to_csv(csv_path / 'trace_flow_summary.csv', index=False)
+        self.get_goodput_df().to_csv(csv_path / 'trace_flow_goodput.csv', index=False)
+        self.get_hop_delay_df().to_csv(csv_path / 'trace_flow_hop_delay.csv', index=False)
+
 # --- Visualization Logic (from visualize_trace.py) ---
 
 def canonical_label(lbl: str) -> str:
@@ -213,6 +1124,17 @@ def canonical_label(lbl: str) -> str:
             return f"SW{int(parts[0])}-P{int(parts[1])}"
     return s
 
+def label_to_port(lbl):
+    """SW10-P3 / H0-P1 -> (node, port)，无法解析时返回 None"""
+    s = canonical_label(lbl)
+    prefix = "SW" if s.startswith("SW") else "H" if s.startswith("H") else None
+    if prefix is None or '-P' not in s:
+        return None
+    node, port = s[len(prefix):].split('-P', 1)
+    if node.isdigit() and port.isdigit():
+        return int(node), int(port)
+    return None
+
 def parse_topology(topology_path):
     try:
         with open(topology_path, 'r') as f:
@@ -230,64 +1152,63 @@ def build_port_label(node_id, port_id, switch_nodes):
     prefix = "SW" if node_id in switch_nodes else "H"
     return f"{prefix}{node_id}-P{port_id}"
 
+PLOT_DPI = 200
+
+def port_labels(df, switch_nodes):
+    """按 (node, port) 去重后生成标签，避免逐行 apply"""
+    codes, keys = pd.factorize(df['node'].astype(np.int64) * 65536 + df['port'].astype(np.int64))
+    labels = np.array([build_port_label(k >> 16, k & 0xffff, switch_nodes) for k in keys], dtype=object)
+    return labels[codes]
+
 def plot_results(df_util, df_qlen, output_dir, switch_nodes, include_labels=None):
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # 1. Link Utilization
     if not df_util.empty:
-        df_util['label'] = df_util.apply(lambda r: build_port_label(r['node'], r['port'], switch_nodes), axis=1)
+        df_util['label'] = port_labels(df_util, switch_nodes)
         if include_labels:
             df_util = df_util[df_util['label'].isin(include_labels)]
         
         if not df_util.empty:
             fig, axes = plt.subplots(2, 1, figsize=(12, 8))
             for label, group in df_util.groupby('label'):
-                # 对吞吐量和利用率进行平滑处理，避免瞬时波动导致图表出现“方块”状
-                # 使用滑动平均 (Rolling Mean)，窗口大小设为 100 个采样点
-                window_size = min(100, len(group))
-                if window_size > 1:
-                    smooth_tp = group['throughput_gbps'].rolling(window=window_size, center=True, min_periods=1).mean()
-                    smooth_util = group['utilization_pct'].rolling(window=window_size, center=True, min_periods=1).mean()
-                else:
-                    smooth_tp = group['throughput_gbps']
-                    smooth_util = group['utilization_pct']
-
-                axes[0].plot(group['time_us'], smooth_tp, label=label, alpha=0.8)
-                axes[1].plot(group['time_us'], smooth_util, label=label, alpha=0.8)
+                plot_envelope(axes[0], group['time_us'], group['throughput_gbps'], PLOT_DPI, label=label, alpha=0.8)
+                plot_envelope(axes[1], group['time_us'], group['utilization_pct'], PLOT_DPI, label=label, alpha=0.8)
             
             axes[0].set_ylabel('Throughput (Gbps)')
-            axes[0].set_title('Link Throughput (from Trace, Smoothed)')
+            axes[0].set_title('Link Throughput (from Trace, Binned)')
             axes[0].legend(loc='upper right', fontsize='small', ncol=2)
             axes[0].grid(True, ls=':')
             
             axes[1].set_ylabel('Utilization (%)')
             axes[1].set_xlabel('Time (us)')
             axes[1].set_ylim(0, 105)
-            axes[1].set_title('Link Utilization (from Trace, Smoothed)')
+            axes[1].set_title('Link Utilization (from Trace, Binned)')
             axes[1].grid(True, ls=':')
             
             plt.tight_layout()
-            plt.savefig(output_dir / 'trace_link_utilization.png', dpi=200)
+            plt.savefig(output_dir / 'trace_link_utilization.png', dpi=PLOT_DPI)
             plt.close()
 
     # 2. Queue Length
     if not df_qlen.empty:
-        df_qlen['label'] = df_qlen.apply(lambda r: build_port_label(r['node'], r['port'], switch_nodes), axis=1)
+        df_qlen['label'] = port_labels(df_qlen, switch_nodes)
         if include_labels:
             df_qlen = df_qlen[df_qlen['label'].isin(include_labels)]
             
         if not df_qlen.empty:
             plt.figure(figsize=(12, 5))
+            ax = plt.gca()
             for label, group in df_qlen.groupby('label'):
-                plt.plot(group['time_us'], group['qlen_kb'], label=label, alpha=0.8)
+                plot_envelope(ax, group['time_us'], group['qlen_kb'], PLOT_DPI, label=label, alpha=0.8)
             plt.title('Queue Length (from Trace)')
             plt.ylabel('Queue Length (KB)')
             plt.xlabel('Time (us)')
             plt.legend(loc='upper right', fontsize='small', ncol=2)
             plt.grid(True, ls=':')
             plt.tight_layout()
-            plt.savefig(output_dir / 'trace_queue_length.png', dpi=200)
+            plt.savefig(output_dir / 'trace_queue_length.png', dpi=PLOT_DPI)
             plt.close()
 
 def main():
@@ -297,14 +1218,60 @@ def main():
     parser.add_argument('--csv-dir', help='Optional: Output directory for CSV files')
     parser.add_argument('--topology', help='Path to topology.txt to identify switches')
     parser.add_argument('--include', nargs='+', help='Specific ports to plot (e.g., SW6-P1 H0-P1)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Bounded-memory mode: analyze the trace chunk by chunk and write CSVs only (requires --csv-dir)')
+    parser.add_argument('--chunk-records', type=int, default=DEFAULT_CHUNK_RECORDS,
+                        help='Records per chunk in --stream mode')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of worker processes used to decode the trace')
+    parser.add_argument('--util-bin-us', type=float, default=DEFAULT_UTIL_BIN_NS / 1000,
+                        help='Link utilization window in microseconds (same semantics as LINK_UTIL_MON_INTERVAL)')
+    parser.add_argument('--start', type=float, help='Only analyze records at or after this time (seconds)')
+    parser.add_argument('--end', type=float, help='Only analyze records at or before this time (seconds)')
+    parser.add_argument('--events', nargs='+', choices=list(EVENT_NAMES.values()),
+                        help='Only analyze these event types (e.g., Dequ Drop)')
+    parser.add_argument('--node-type', choices=['host', 'switch'], help='Only analyze records from hosts or switches')
+    parser.add_argument('--nodes', nargs='+', type=int, help='Only analyze records from these node IDs')
+    parser.add_argument('--intfs', nargs='+', type=int, help='Only analyze records on these interface IDs')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the decoded-column cache next to the trace file')
+    parser.add_argument('--flows', action='store_true',
+                        help='Also write per-flow goodput, per-hop queueing delay and paused time CSVs (requires --csv-dir)')
     
     args = parser.parse_args()
+    bin_ns = max(1, round(args.util_bin_us * 1000))
+    
+    if args.flows and (args.stream or not args.csv_dir):
+        parser.error('--flows requires --csv-dir and cannot be combined with --stream')
+    
+    include_labels = [canonical_label(l) for l in args.include] if args.include else None
+    include_ports = None
+    if include_labels:
+        include_ports = ({label_to_port(l) for l in include_labels} - {None}) or None
+    event_codes = {name: code for code, name in EVENT_NAMES.items()}
+    predicate = TracePredicate(
+        ports=include_ports,
+        t_start=round(args.start * 1e9) if args.start is not None else None,
+        t_end=round(args.end * 1e9) if args.end is not None else None,
+        events={event_codes[e] for e in args.events} if args.events else None,
+        node_types={NODE_HOST if args.node_type == 'host' else NODE_SWITCH} if args.node_type else None,
+        nodes=set(args.nodes) if args.nodes else None,
+        intfs=set(args.intfs) if args.intfs else None,
+    )
+    
+    if args.stream:
+        if not args.csv_dir:
+            parser.error('--stream requires --csv-dir')
+        StreamingTraceAnalyzer(args.trace_file, args.chunk_records, bin_ns, predicate).run(args.csv_dir)
+        print(f"CSVs saved to {args.csv_dir} (plots skipped in streaming mode)")
+        return
     
     analyzer = TraceAnalyzer(args.trace_file)
     analyzer.parse()
-    analyzer.analyze()
+    analyzer.select(predicate)
+    analyzer.analyze(jobs=args.jobs, use_cache=not args.no_cache)
     
-    df_util = analyzer.get_utilization_df()
+    df_util = analyzer.get_utilization_df(bin_ns)
     df_qlen = analyzer.get_qlen_df()
     
     if args.csv_dir:
@@ -312,10 +1279,12 @@ def main():
         csv_path.mkdir(parents=True, exist_ok=True)
         df_util.to_csv(csv_path / 'trace_link_utilization.csv', index=False)
         df_qlen.to_csv(csv_path / 'trace_queue_length.csv', index=False)
+        analyzer.get_event_stats_df().to_csv(csv_path / 'trace_event_statistics.csv', index=False)
+        if args.flows:
+            FlowAnalyzer(analyzer.records, bin_ns).run(csv_path)
         print(f"CSVs saved to {args.csv_dir}")
 
     switch_nodes = parse_topology(args.topology) if args.topology else set()
-    include_labels = [canonical_label(l) for l in args.include] if args.include else None
     
     plot_results(df_util, df_qlen, args.output_dir, switch_nodes, include_labels)
     print(f"Plots saved to {args.output_dir}")
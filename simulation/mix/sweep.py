@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Parameter sweep runner
+按参数网格展开模板配置，为每组参数生成独立的输出目录与 config.txt，直接调用已编译的 scratch/third
+(不经过 waf) 并行运行。每完成一次运行就向 manifest.jsonl 追加一行，中断后重新执行同一命令会跳过已完成的运行。
+
+需在 simulation 目录下运行 (配置中的相对路径以该目录为基准)，例如:
+  python3 mix/sweep.py mix/00_Hawkeye/config/config.txt -o mix/sweeps/cc \\
+      -p CC_MODE=1,3,8 -p BUFFER_SIZE=1000,2000 -p ENABLE_TRACE=0
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MANIFEST = "manifest.jsonl"
+
+def is_output_key(key):
+    """输出路径类配置项：每次运行都重定向到各自的运行目录"""
+    return key == "DIR" or key.endswith("_OUTPUT_FILE") or key.endswith("_MON_FILE")
+
+def load_grid(params, grid_file=None):
+    """合并 --grid JSON ({key: [v, ...]}) 与 -p KEY=v1,v2 参数，返回有序的 {key: [v, ...]}"""
+    grid = {}
+    if grid_file:
+        with open(grid_file, 'r') as f:
+            for key, values in json.load(f).items():
+                grid[key] = [str(v) for v in (values if isinstance(values, list) else [values])]
+    for item in params or []:
+        key, sep, values = item.partition('=')
+        if not sep or not key:
+            raise ValueError(f"bad parameter '{item}', expected KEY=v1,v2,...")
+        grid[key.strip()] = [v.strip() for v in values.split(',')]
+    return grid
+
+def expand_grid(grid):
+    """网格的笛卡尔积，每项为 {key: value}"""
+    keys = list(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+def run_id(template, params):
+    """由模板内容与参数确定的运行编号，网格顺序变化或追加参数值时已完成的运行仍可复用"""
+    h = hashlib.sha1(template.encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()[:12]
+
+def render_config(template, params, run_dir):
+    """用 params 覆盖模板中的同名配置项 (模板中没有的追加到末尾)，并把输出路径改写到 run_dir 下"""
+    lines = []
+    seen = set()
+    for line in template.splitlines():
+        tokens = line.split(None, 1)
+        key = tokens[0] if tokens and not tokens[0].startswith('#') else None
+        if key in params:
+            line = f"{key} {params[key]}"
+            seen.add(key)
+        elif key is not None and is_output_key(key):
+            value = tokens[1].strip() if len(tokens) > 1 else ""
+            line = f"{key} {run_dir if key == 'DIR' else os.path.join(run_dir, os.path.basename(value))}"
+        lines.append(line)
+    lines.extend(f"{key} {value}" for key, value in params.items() if key not in seen)
+    return "\n".join(lines) + "\n"
+
+def read_manifest(out_dir):
+    """manifest.jsonl 中每个运行编号的最后一条记录"""
+    records = {}
+    path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    records[record["run"]] = record
+    return records
+
+def default_jobs(mem_per_run):
+    """并行数：不超过CPU核数，且 mem_per_run (MB) 乘并行数不超过当前可用内存"""
+    jobs = os.cpu_count() or 1
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            meminfo = dict(line.split(':', 1) for line in f)
+        available = int(meminfo["MemAvailable"].split()[0]) // 1024
+    except (OSError, KeyError, ValueError):
+        return jobs
+    return max(1, min(jobs, available // max(mem_per_run, 1)))
+
+def run_one(binary, config_path, run_dir):
+    """运行一次仿真，stdout/stderr 写入运行目录下的 stdout.log，返回 (返回码, 耗时秒数)"""
+    env = dict(os.environ)
+    build_dir = os.path.abspath("build")
+    env["LD_LIBRARY_PATH"] = build_dir + (":" + env["LD_LIBRARY_PATH"] if env.get("LD_LIBRARY_PATH") else "")
+    start = time.time()
+    with open(os.path.join(run_dir, "stdout.log"), 'w') as log:
+        ret = subprocess.call([binary, config_path], stdout=log, stderr=subprocess.STDOUT, env=env)
+    return ret, time.time() - start
+
+def sweep(template_file, out_dir, grid, binary='build/scratch/third', jobs=None, mem_per_run=1024, dry_run=False):
+    """展开网格并运行所有未完成的组合，返回失败的运行数"""
+    with open(template_file, 'r') as f:
+        template = f.read()
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    done = {r for r, record in read_manifest(out_dir).items() if record["status"] == "done"}
+
+    pending = []
+    for params in expand_grid(grid):
+        rid = run_id(template, params)
+        if rid in done:
+            continue
+        run_dir = os.path.join(out_dir, rid)
+        os.makedirs(run_dir, exist_ok=True)
+        config_path = os.path.join(run_dir, "config.txt")
+        with open(config_path, 'w') as f:
+            f.write(render_config(template, params, run_dir))
+        pending.append((rid, params, run_dir, config_path))
+
+    total = len(expand_grid(grid))
+    jobs = min(jobs or default_jobs(mem_per_run), max(len(pending), 1))
+    print(f"{total} runs in grid, {total - len(pending)} already done, {len(pending)} to run with {jobs} workers")
+    if dry_run:
+        for rid, params, _, config_path in pending:
+            print(f"  {rid} {json.dumps(params)} -> {config_path}")
+        return 0
+
+    failed = 0
+    with open(os.path.join(out_dir, MANIFEST), 'a') as manifest, ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run_one, binary, config_path, run_dir): (rid, params, run_dir)
+                   for rid, params, run_dir, config_path in pending}
+        for i, future in enumerate(as_completed(futures), 1):
+            rid, params, run_dir = futures[future]
+            ret, elapsed = future.result()
+            status = "done" if ret == 0 else "failed"
+            failed += ret != 0
+            manifest.write(json.dumps({"run": rid, "status": status, "returncode": ret,
+                                       "elapsed": round(elapsed, 1), "dir": run_dir, "params": params}) + "\n")
+            manifest.flush()
+            print(f"[{i}/{len(pending)}] {rid} {status} in {elapsed:.1f}s {json.dumps(params)}")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Run scratch/third over a parameter grid in parallel')
+    parser.add_argument('config', help='Template config file (e.g. mix/00_Hawkeye/config/config.txt)')
+    parser.add_argument('-o', '--out', required=True, help='Sweep directory: one sub-directory per run plus manifest.jsonl')
+    parser.add_argument('-p', '--param', action='append', metavar='KEY=V1,V2',
+                        help='Config key and comma-separated values to sweep; may be repeated')
+    parser.add_argument('--grid', help='JSON file mapping config keys to lists of values')
+    parser.add_argument('--binary', default='build/scratch/third', help='Simulator binary, run from the current directory')
+    parser.add_argument('-j', '--jobs', type=int, help='Concurrent runs (default: bounded by CPU count and --mem-per-run)')
+    parser.add_argument('--mem-per-run', type=int, default=1024, help='Expected peak memory of one run in MB')
+    parser.add_argument('--dry-run', action='store_true', help='Write the run configs and list them without running')
+    args = parser.parse_args()
+
+    grid = load_grid(args.param, args.grid)
+    if not grid:
+        parser.error('no parameters to sweep, use -p KEY=V1,V2 or --grid')
+    if not args.dry_run and not os.path.exists(args.binary):
+        parser.error(f"{args.binary} not found, build it with ./waf first")
+    failed = sweep(args.config, args.out, grid, args.binary, args.jobs, args.mem_per_run, args.dry_run)
+    if failed:
+        raise SystemExit(f"{failed} runs failed, rerun the same command to retry them")
+
+if __name__ == "__main__":
+    main()
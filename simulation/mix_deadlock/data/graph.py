@@ -1,40 +1,58 @@
+import argparse
+import glob
 import json
+import os
+import re
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import repeat
+import numpy as np
+from provenance import ProvenanceGraph, PORT, FLOW
 
 SWITCH_LIST = [0, 1, 2, 3]
+MIN_POLL_GAP = 50000  # ns，同一交换机相邻两条记录间隔小于此值时丢弃后一条
+
+def interleave_pkts(pktnums):
+    """按出队顺序返回每个包所属的流下标
+
+    各流的包在队列中均匀交织：流 i 的第 k 个包排序键为 k / pktnums[i]，
+    键相同时流下标小者在前，与逐包取最小相对指针的模拟结果一致。
+    """
+    pktnums = np.asarray(pktnums, dtype=np.int64)
+    flow_idx = np.repeat(np.arange(len(pktnums)), pktnums)
+    first = np.repeat(np.cumsum(pktnums) - pktnums, pktnums)
+    rank = (np.arange(len(flow_idx)) - first) / pktnums[flow_idx]
+    return flow_idx[np.lexsort((flow_idx, rank))]
+
+def waitfor_counts(pkt_list, queuedepths, flownum):
+    """counts[f][g]：流 f 的每个包向前看 queuedepths[f] 个包时遇到流 g 的包的总次数
+
+    用流 g 的前缀计数求窗口 [p - depth, p) 内的包数，每个流一次线性扫描。
+    """
+    n = len(pkt_list)
+    pos = np.arange(n)
+    depth = np.maximum(np.asarray(queuedepths, dtype=np.int64), 0)[pkt_list]
+    lo = np.maximum(pos - depth, 0)
+    counts = np.zeros((flownum, flownum), dtype=np.int64)
+    prefix = np.empty(n + 1, dtype=np.int64)
+    prefix[0] = 0
+    for g in range(flownum):
+        np.cumsum(pkt_list == g, out=prefix[1:])
+        counts[:, g] = np.bincount(pkt_list, weights=prefix[pos] - prefix[lo], minlength=flownum)
+    return counts
 
 def sim_pkt_queue(flows, pktnums, queuedepths):
     flownum = len(flows)
     if flownum == 0:
         return
-    ptrs = [0] * flownum
-    pkt_list = []
-    pkt_waitfor = []
     degree = {}
+    for flow in flows:
+        degree[flow] = 0
 
-    for flow_id in range(flownum):
-        degree[flows[flow_id]] = 0
-        pkt_waitfor.append([])
-        for flow_id1 in range(flownum):
-            pkt_waitfor[flow_id].append(0)
-    
-    while True:
-        rela_ptrs = [ ptr/pktnum for ptr, pktnum in zip(ptrs, pktnums)]
-        if(min(rela_ptrs) >= 1):
-            break
-        max_idx = rela_ptrs.index(min(rela_ptrs))
-        ptrs[max_idx] += 1
-        pkt_list.append(max_idx)
-
-    for pkt_id in range(len(pkt_list)):
-        queuedepth = queuedepths[pkt_list[pkt_id]]
-        for i in range(1, queuedepth + 1):
-            if pkt_id - i < 0:
-                break
-            pkt_waitfor[pkt_list[pkt_id]][pkt_list[pkt_id - i]] += 1
-
-    for flow_idx in range(flownum):
-        for flow_idx1 in range(flownum):
-            pkt_waitfor[flow_idx][flow_idx1] = round(pkt_waitfor[flow_idx][flow_idx1] / pktnums[flow_idx], 1)
+    counts = waitfor_counts(interleave_pkts(pktnums), queuedepths, flownum).tolist()
+    pkt_waitfor = [[round(count / pktnums[flow_idx], 1) if pktnums[flow_idx] else 0.0 for count in counts[flow_idx]]
+                   for flow_idx in range(flownum)]
     pkt_waitfor = [dict(zip(flows, pkt_waitfor[flow_idx])) for flow_idx in range(flownum)]
     pkt_waitfor = dict(zip(flows, pkt_waitfor))
 
@@ -45,104 +63,435 @@ def sim_pkt_queue(flows, pktnums, queuedepths):
 
     return degree
 
-def parse_telemetry(switch_dict, switch_list):
-    for swicth_id in switch_list:
-        f = open("telemetry_"+str(swicth_id)+".txt", 'r')
-        lines = f.readlines()
-        f.close()
-
-        switch_dict[str(swicth_id)] = {}
-        line_idx = 0
-        while line_idx < len(lines):
-            line = lines[line_idx]
-            
-            if line.startswith("time"):
-                time = line.split()[1]
-                switch_dict[str(swicth_id)][time] = {"epoch_now":{},"epoch_last":{}}
-                porttelemetry = {"epoch_now":{},"epoch_last":{}}
-                trafficmeter = {}
-                inport = -1
-                teleflag = False
-                polling = False
-                port = "0"
-                epoch = "epoch_now"
-
-            elif line.startswith("end"):
-                if inport != -1:
-                    switch_dict[str(swicth_id)][time]["inport"] = inport
-                for epoch in ["epoch_now", "epoch_last"]:
-                    if switch_dict[str(swicth_id)][time][epoch] != {} and polling == False:
-                        for key in porttelemetry[epoch].keys():
-                            if sum(trafficmeter.values()) == 0:
-                                porttelemetry[epoch][key] = 0
-                            else:
-                                porttelemetry[epoch][key] = porttelemetry[epoch][key] * trafficmeter[key] / sum(trafficmeter.values())
-                        switch_dict[str(swicth_id)][time][epoch]["p2p_weight"] = porttelemetry[epoch]
-                
-            elif line.startswith("polling"):
-                switch_dict[str(swicth_id)][time]["type"] = "flow_trace"
-                polling = True
-            elif line.startswith("signal"):
-                switch_dict[str(swicth_id)][time]["type"] = "pfc_trace"
-                polling = False
-            elif line.startswith("epoch"):
-                epoch = "epoch_"+line.split()[1]
-            elif teleflag and line == '\n':
+def iter_polls(path):
+    """逐条产出 telemetry 文件中的 (time, poll)"""
+    with open(path, 'r') as f:
+        yield from parse_polls(f)
+
+def parse_polls(lines):
+    """逐条产出 (time, poll)，poll 为一次信号/轮询触发的遥测记录
+
+    每行只切分一次；端口遥测与流量计数的数值行紧随其表头，直接从行迭代器读取。
+    """
+    lines = iter(lines)
+    poll = None
+    teleflag = False
+    for line in lines:
+        tok = line.split()
+        if not tok:
+            if teleflag:
                 teleflag = False
                 degrees = sim_pkt_queue(flows, pktnums, queuedepths)
                 if degrees is not None:
-                    switch_dict[str(swicth_id)][time][epoch][port]["p2f_weight"] = degrees
-            elif line.startswith("flow telemetry"):
-                flows = []
-                pktnums = []
-                queuedepths = []
-                switch_dict[str(swicth_id)][time][epoch][port]["f2p_weight"] = {}
-                port = line.split()[-1]
-                line_idx += 1
-                teleflag = True
-            elif line.startswith("port telemetry"):
-                port = line[:-1].split()[-1]
-                pktnum = int(lines[line_idx+2].split()[2])
-                qdepth = int(lines[line_idx+2].split()[0])
-                paused = int(lines[line_idx+2].split()[1])
-                switch_dict[str(swicth_id)][time][epoch][port] = {}
-                switch_dict[str(swicth_id)][time][epoch][port]["paused_pkt"] = paused
-                if pktnum == 0:
-                    porttelemetry[epoch][line[:-1].split()[-1]] = 0
-                else:
-                    porttelemetry[epoch][line[:-1].split()[-1]] = qdepth / pktnum
-            elif line.startswith("traffic meter form port"):
-                port = line[:-1].split()[-1]
-                trafficmeter[port] = int(lines[line_idx+2][:-1])
-                inport = line[:-1].split()[4]
-            elif teleflag:
-                flow = line.split()[1]+"->"+line.split()[2]
-                pktnum = int(line.split()[8])
-                paused = int(line.split()[10])
-                flows.append(flow)
-                pktnums.append(pktnum)
-                switch_dict[str(swicth_id)][time][epoch][port]["f2p_weight"][flow] = paused
-                if (int(line.split()[8])-int(line.split()[10])) == 0:
-                    queuedepths.append(0)
-                else:
-                    queuedepths.append(int(int(line.split()[9]) / (int(line.split()[8])-int(line.split()[10]))))
+                    poll[epoch][port]["p2f_weight"] = degrees
+            continue
 
-            line_idx += 1
+        head = tok[0]
+        if head == "time":
+            if poll is not None:
+                yield t, poll
+            t = tok[1]
+            poll = {"epoch_now":{},"epoch_last":{}}
+            porttelemetry = {"epoch_now":{},"epoch_last":{}}
+            trafficmeter = {}
+            inport = -1
+            teleflag = False
+            polling = False
+            port = "0"
+            epoch = "epoch_now"
 
-def main():
-    switch_list = SWITCH_LIST
-    switch_dict = {}
+        elif head == "end":
+            if inport != -1:
+                poll["inport"] = inport
+            total = sum(trafficmeter.values())
+            for epoch in ["epoch_now", "epoch_last"]:
+                if poll[epoch] != {} and polling == False:
+                    for key in porttelemetry[epoch].keys():
+                        if total == 0:
+                            porttelemetry[epoch][key] = 0
+                        else:
+                            porttelemetry[epoch][key] = porttelemetry[epoch][key] * trafficmeter[key] / total
+                    poll[epoch]["p2p_weight"] = porttelemetry[epoch]
+            yield t, poll
+            poll = None
+
+        elif head == "polling":
+            poll["type"] = "flow_trace"
+            polling = True
+        elif head == "signal":
+            poll["type"] = "pfc_trace"
+            polling = False
+        elif head == "epoch":
+            epoch = "epoch_"+tok[1]
+        elif head == "flow" and tok[1] == "telemetry":
+            flows = []
+            pktnums = []
+            queuedepths = []
+            port = tok[-1]
+            poll[epoch][port]["f2p_weight"] = {}
+            next(lines)  # 表头
+            teleflag = True
+        elif head == "port" and tok[1] == "telemetry":
+            port = tok[-1]
+            next(lines)  # 表头
+            qdepth, paused, pktnum = (int(v) for v in next(lines).split())
+            poll[epoch][port] = {"paused_pkt": paused}
+            if pktnum == 0:
+                porttelemetry[epoch][port] = 0
+            else:
+                porttelemetry[epoch][port] = qdepth / pktnum
+        elif head == "traffic":
+            port = tok[-1]
+            next(lines)  # 表头
+            trafficmeter[port] = int(next(lines))
+            inport = tok[4]
+        elif teleflag:
+            flow = tok[1]+"->"+tok[2]
+            pktnum = int(tok[8])
+            enqdepth = int(tok[9])
+            paused = int(tok[10])
+            flows.append(flow)
+            pktnums.append(pktnum)
+            poll[epoch][port]["f2p_weight"][flow] = paused
+            if pktnum - paused == 0:
+                queuedepths.append(0)
+            else:
+                queuedepths.append(int(enqdepth / (pktnum - paused)))
 
-    parse_telemetry(switch_dict, switch_list)
+    # 文件在记录中途截断时保留已解析的部分
+    if poll is not None:
+        yield t, poll
 
+def parse_switch(switch_id, directory='.'):
+    """解析单个交换机的 telemetry 文件，返回 (switch, {time: poll})"""
+    return str(switch_id), dict(iter_polls(os.path.join(directory, "telemetry_"+str(switch_id)+".txt")))
+
+def parse_telemetry(switch_dict, switch_list, jobs=None, directory='.'):
+    """多进程并行解析 switch_list 中各交换机的 telemetry 文件，按 switch_list 顺序合并进 switch_dict
+
+    jobs 为 None 时使用全部CPU核数；jobs 为1或只有一个交换机时在当前进程内解析。
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(switch_list))
+    if jobs <= 1:
+        switch_dict.update(map(parse_switch, switch_list, repeat(directory)))
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        switch_dict.update(pool.map(parse_switch, switch_list, repeat(directory)))
+
+def drop_close_polls(switch_dict):
+    """同一交换机相邻两条记录间隔小于 MIN_POLL_GAP 时丢弃后一条"""
     for switch in switch_dict.keys():
         time_list = list(switch_dict[switch].keys())
         for time_idx in range(len(time_list) - 1):
-            if int(time_list[time_idx + 1]) - int(time_list[time_idx]) < 50000:
+            if int(time_list[time_idx + 1]) - int(time_list[time_idx]) < MIN_POLL_GAP:
                 switch_dict[switch].pop(time_list[time_idx+1])
 
-    with open('telemetry.json', 'w') as f:
+# --- Binary Telemetry Format ---
+# TELEMETRY_FORMAT 1 时所有交换机写入同一个 telemetry.bin，记录布局见 telemetry-format.h
+TELEMETRY_FILE_MAGIC = 0x4d544b48  # "HKTM"
+TELEMETRY_FILE_HEADER_SIZE = 8
+TELEMETRY_POLL, TELEMETRY_PORT, TELEMETRY_FLOW = 0, 1, 2
+TELEMETRY_SIGNAL = 0
+TELEMETRY_RECORD_DTYPE = np.dtype([
+    ('time', '<u8'), ('switch', '<u2'), ('kind', 'u1'), ('trigger', 'u1'),
+    ('epoch', 'u1'), ('protocol', 'u1'), ('port', '<u2'), ('inport', '<u2'), ('flow_idx', '<u2'),
+    ('src_ip', '<u4'), ('dst_ip', '<u4'), ('src_port', '<u2'), ('dst_port', '<u2'),
+    ('min_seq', '<u2'), ('max_seq', '<u2'), ('packet_num', '<u4'), ('enq_qdepth', '<u4'),
+    ('paused', '<u4'), ('p2p_bytes', '<u4'), ('pad', '<u4'),
+])
+assert TELEMETRY_RECORD_DTYPE.itemsize == 56
+EPOCH_KEYS = ("epoch_now", "epoch_last")
+
+def read_telemetry_records(path):
+    """读取 telemetry.bin 的全部记录"""
+    with open(path, 'rb') as f:
+        magic, version = struct.unpack('<II', f.read(TELEMETRY_FILE_HEADER_SIZE))
+    if magic != TELEMETRY_FILE_MAGIC:
+        raise ValueError(f"{path} is not a binary telemetry file")
+    return np.fromfile(path, dtype=TELEMETRY_RECORD_DTYPE, offset=TELEMETRY_FILE_HEADER_SIZE)
+
+def binary_polls(records):
+    """按 POLL 记录切分，逐条产出 (switch, time, poll)，poll 的结构与 parse_polls 相同"""
+    starts = np.flatnonzero(records['kind'] == TELEMETRY_POLL)
+    ends = np.r_[starts[1:], len(records)].astype(np.int64)
+
+    # 队列深度与文本格式解析时的 int(enqQdepth / (packetNum - paused)) 一致
+    pkt = records['packet_num'].astype(np.int64)
+    paused = records['paused'].astype(np.int64)
+    enq = records['enq_qdepth'].astype(np.int64)
+    active = pkt - paused
+    with np.errstate(divide='ignore', invalid='ignore'):
+        qdepth = np.where(active == 0, 0, np.trunc(enq / active)).astype(np.int64).tolist()
+    kind = records['kind'].tolist()
+    epoch = records['epoch'].tolist()
+    port = records['port'].tolist()
+    src_ip = records['src_ip'].tolist()
+    dst_ip = records['dst_ip'].tolist()
+    p2p_bytes = records['p2p_bytes'].tolist()
+    pkt, paused, enq = pkt.tolist(), paused.tolist(), enq.tolist()
+
+    def close_table(table, flows, pktnums, queuedepths):
+        degrees = sim_pkt_queue(flows, pktnums, queuedepths)
+        if degrees is not None:
+            table["p2f_weight"] = degrees
+
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        signal = records['trigger'][start] == TELEMETRY_SIGNAL
+        poll = {"epoch_now":{}, "epoch_last":{}, "type": "pfc_trace" if signal else "flow_trace"}
+        porttelemetry = {"epoch_now":{}, "epoch_last":{}}
+        trafficmeter = {}
+        table = None
+        for i in range(start + 1, end):
+            if kind[i] == TELEMETRY_PORT:
+                if table is not None:
+                    close_table(table, flows, pktnums, queuedepths)
+                ep = EPOCH_KEYS[epoch[i]]
+                name = str(port[i])
+                table = poll[ep][name] = {"paused_pkt": paused[i], "f2p_weight": {}}
+                porttelemetry[ep][name] = 0 if pkt[i] == 0 else enq[i] / pkt[i]
+                if signal and epoch[i] == 0:
+                    trafficmeter[name] = p2p_bytes[i]
+                flows, pktnums, queuedepths = [], [], []
+            elif kind[i] == TELEMETRY_FLOW:
+                flow = f"{src_ip[i]:08x}->{dst_ip[i]:08x}"
+                flows.append(flow)
+                pktnums.append(pkt[i])
+                queuedepths.append(qdepth[i])
+                table["f2p_weight"][flow] = paused[i]
+        if table is not None:
+            close_table(table, flows, pktnums, queuedepths)
+
+        if trafficmeter:
+            poll["inport"] = str(records['inport'][start])
+            total = sum(trafficmeter.values())
+            for ep in EPOCH_KEYS:
+                if poll[ep] != {}:
+                    weights = porttelemetry[ep]
+                    for key in weights.keys():
+                        weights[key] = 0 if total == 0 else weights[key] * trafficmeter[key] / total
+                    poll[ep]["p2p_weight"] = weights
+        yield int(records['switch'][start]), int(records['time'][start]), poll
+
+def read_binary_telemetry(path, switch_list=None):
+    """把 telemetry.bin 读成与 parse_telemetry 相同结构的 switch_dict
+
+    switch_list 为 None 时包含文件中出现的全部交换机 (按编号排序)，否则只保留并按其顺序排列。
+    """
+    switch_dict = {} if switch_list is None else {str(s): {} for s in switch_list}
+    for switch, t, poll in binary_polls(read_telemetry_records(path)):
+        key = str(switch)
+        if switch_list is None:
+            switch_dict.setdefault(key, {})[str(t)] = poll
+        elif key in switch_dict:
+            switch_dict[key][str(t)] = poll
+    if switch_list is None:
+        switch_dict = {key: switch_dict[key] for key in sorted(switch_dict, key=int)}
+    return switch_dict
+
+class TelemetryTail:
+    """跟踪仿真过程中仍在写入的 telemetry 文件，只解析已完整写出的 time ... end 记录"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = b''
+        self.block = []
+
+    def read_polls(self):
+        """返回自上次调用以来新写完的 (time, poll) 列表"""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return []
+        if size < self.offset:  # 文件被重新创建 (仿真重跑)
+            self.offset = 0
+            self.partial = b''
+            self.block = []
+        if size == self.offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        polls = []
+        for line in lines:
+            line = line.decode() + '\n'
+            self.block.append(line)
+            if line.startswith("end"):
+                polls.extend(parse_polls(self.block))
+                self.block = []
+        return polls
+
+def follow(switch_list, interval=1.0, topo_file=None, top=5, method='pagerank', stable=0):
+    """在线诊断：轮询跟踪各交换机 telemetry 文件，每读到新记录就更新溯源图并重新排序根因
+
+    stable > 0 时，若最高分的根因端口与流在连续 stable 次更新中保持不变则停止跟踪。
+    返回已读入的 switch_dict (已按 MIN_POLL_GAP 去重)，Ctrl-C 同样结束跟踪。
+    """
+    tails = [(str(s), TelemetryTail("telemetry_"+str(s)+".txt")) for s in switch_list]
+    switch_dict = {switch: {} for switch, _ in tails}
+    last_time = {}
+    graph = ProvenanceGraph(topo_file)
+    leader = None
+    unchanged = 0
+    print(f"Following {len(tails)} telemetry files (Ctrl-C to stop)...")
+    try:
+        while True:
+            updated = 0
+            for switch, tail in tails:
+                for t, poll in tail.read_polls():
+                    prev = last_time.get(switch)
+                    last_time[switch] = int(t)
+                    if prev is not None and int(t) - prev < MIN_POLL_GAP:
+                        continue
+                    switch_dict[switch][t] = poll
+                    graph.add_poll(switch, poll)
+                    updated += 1
+            if updated == 0:
+                time.sleep(interval)
+                continue
+
+            graph.finalize()
+            scores = graph.rank(method)
+            ports = graph.top_k(scores, PORT, top)
+            flows = graph.top_k(scores, FLOW, top)
+            latest = max(last_time.values())
+            print(f"[t={latest / 1e3:.1f}us] +{updated} polls, {graph.num_vertices} vertices, {graph.num_edges} edges")
+            print("  ports: " + ", ".join(f"{name} ({score:.3g})" for name, score in ports))
+            print("  flows: " + ", ".join(f"{name} ({score:.3g})" for name, score in flows))
+
+            current = (ports[0][0] if ports else None, flows[0][0] if flows else None)
+            unchanged = unchanged + 1 if current == leader else 1
+            leader = current
+            if stable > 0 and unchanged >= stable:
+                print(f"Root cause stable for {stable} updates: port {leader[0]}, flow {leader[1]}")
+                break
+    except KeyboardInterrupt:
+        pass
+    return switch_dict
+
+# --- Batch Diagnosis ---
+TELEMETRY_FILE_RE = re.compile(r"telemetry_(\d+)\.txt$")
+# 未指定 --topo 时依次在实验目录下查找的拓扑文件 (00_Hawkeye 的 output/ 与 config/ 同级)
+TOPOLOGY_CANDIDATES = ("topology.txt", os.path.join("..", "config", "topology.txt"), os.path.join("..", "topology.txt"))
+
+def read_switch_ids(topo_file):
+    """拓扑文件第二行为全部交换机编号"""
+    with open(topo_file, 'r') as f:
+        f.readline()
+        return [int(v) for v in f.readline().split()]
+
+def find_topology(directory, topo_file=None):
+    """返回实验目录对应的拓扑文件；topo_file 为相对路径时相对于实验目录"""
+    for name in (topo_file,) if topo_file else TOPOLOGY_CANDIDATES:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def telemetry_switch_ids(directory):
+    """目录中 telemetry_<id>.txt 的交换机编号，升序"""
+    ids = (TELEMETRY_FILE_RE.match(os.path.basename(p)) for p in glob.glob(os.path.join(directory, "telemetry_*.txt")))
+    return sorted(int(m.group(1)) for m in ids if m)
+
+def find_experiments(roots):
+    """roots 及其子目录中含 telemetry_<id>.txt 或 telemetry.bin 的目录，按路径排序"""
+    found = set()
+    for root in roots:
+        for directory, _, files in os.walk(root):
+            if "telemetry.bin" in files or any(TELEMETRY_FILE_RE.match(f) for f in files):
+                found.add(directory)
+    return sorted(found)
+
+def diagnose_experiment(directory, topo_file=None, output='telemetry.json'):
+    """为一个实验目录建图并写出 output，返回 (交换机数, 记录数)
+
+    交换机按拓扑文件第二行的顺序，只保留有 telemetry 文件的交换机；找不到拓扑文件时使用目录中全部
+    telemetry_<id>.txt。目录中没有文本 telemetry 文件时读取 telemetry.bin。
+    """
+    found = telemetry_switch_ids(directory)
+    topo = find_topology(directory, topo_file)
+    if found:
+        switch_list = [s for s in read_switch_ids(topo) if s in found] if topo else found
+        switch_dict = {}
+        parse_telemetry(switch_dict, switch_list, jobs=1, directory=directory)
+    else:
+        switch_list = read_switch_ids(topo) if topo else None
+        switch_dict = read_binary_telemetry(os.path.join(directory, "telemetry.bin"), switch_list)
+    drop_close_polls(switch_dict)
+    with open(os.path.join(directory, output), 'w') as f:
+        json.dump(switch_dict, f)
+    return len(switch_dict), sum(len(polls) for polls in switch_dict.values())
+
+def batch(roots, topo_file=None, jobs=None, output='telemetry.json'):
+    """对 roots 下的全部实验目录运行 diagnose_experiment，所有实验共用一个进程池，返回失败的实验数"""
+    experiments = find_experiments(roots)
+    if not experiments:
+        print("No telemetry files found")
+        return 0
+    jobs = min(jobs or os.cpu_count() or 1, len(experiments))
+    print(f"Diagnosing {len(experiments)} experiments with {jobs} workers...")
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(diagnose_experiment, d, topo_file, output): d for d in experiments}
+        for future in as_completed(futures):
+            directory = futures[future]
+            try:
+                switches, polls = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"  FAILED {directory}: {e!r}")
+                continue
+            print(f"  {directory}: {switches} switches, {polls} polls -> {output}")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the PFC provenance graph from switch telemetry files')
+    parser.add_argument('--switches', type=int, nargs='+',
+                        help='Switch IDs (telemetry_<id>.txt; default SWITCH_LIST, or every switch in --binary)')
+    parser.add_argument('--binary', nargs='?', const='telemetry.bin',
+                        help='Read the consolidated binary telemetry file written with TELEMETRY_FORMAT 1')
+    parser.add_argument('--jobs', '-j', type=int, help='Worker processes for parsing (default: CPU count)')
+    parser.add_argument('--follow', action='store_true',
+                        help='Tail the telemetry files while the simulation runs and rank root causes online')
+    parser.add_argument('--interval', type=float, default=1.0, help='Polling interval in seconds for --follow')
+    parser.add_argument('--batch', nargs='+', metavar='DIR',
+                        help='Diagnose every experiment directory with telemetry files under these paths in one worker pool')
+    parser.add_argument('-o', '--output', default='telemetry.json',
+                        help='Result file name, written into each experiment directory in --batch mode')
+    parser.add_argument('--topo', help='Topology file passed to the provenance graph in --follow mode; '
+                        'in --batch mode the switch IDs are read from its second line (relative to each experiment directory)')
+    parser.add_argument('-k', '--top', type=int, default=5, help='Root causes printed per update in --follow mode')
+    parser.add_argument('--method', choices=['pagerank', 'indegree'], default='pagerank')
+    parser.add_argument('--stable', type=int, default=0,
+                        help='Stop --follow once the top port and flow stay unchanged for this many updates')
+    args = parser.parse_args()
+    if args.follow and args.binary:
+        parser.error('--follow tails the text telemetry files and cannot be combined with --binary')
+    if args.batch and (args.follow or args.binary or args.switches):
+        parser.error('--batch discovers switches and telemetry files itself and cannot be combined with --follow, --binary or --switches')
+    if args.batch:
+        failed = batch(args.batch, args.topo, args.jobs, args.output)
+        if failed:
+            raise SystemExit(f"{failed} experiments failed")
+        return
+    switch_list = args.switches if args.switches or args.binary else SWITCH_LIST
+
+    if args.follow:
+        switch_dict = follow(switch_list, args.interval, args.topo, args.top, args.method, args.stable)
+    else:
+        if args.binary:
+            switch_dict = read_binary_telemetry(args.binary, switch_list)
+        else:
+            switch_dict = {}
+            parse_telemetry(switch_dict, switch_list, args.jobs)
+        drop_close_polls(switch_dict)
+
+    with open(args.output, 'w') as f:
         json.dump(switch_dict, f)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
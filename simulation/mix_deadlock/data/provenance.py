@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Provenance graph ranking
+把 graph.py 输出的 telemetry.json 构建为端口/流顶点上的 CSR 稀疏邻接矩阵，
+沿 "等待/被阻塞" 方向传播受害程度，按个性化 PageRank 或加权入度给出根因端口与流。
+
+边的方向均由受害者指向原因：
+  流 -> 端口   f2p_weight：流在该端口被PFC暂停的包数
+  端口 -> 流   p2f_weight：流在该端口队列中被其他流等待的净程度 (只取正值)
+  端口 -> 端口 p2p_weight：信号入端口的拥塞按流量占比归因到各出端口
+  端口 -> 端口 (需 --topo) 信号沿链路到达入端口时，上游被暂停的出端口指向该入端口
+"""
+
+import argparse
+import csv
+import json
+import numpy as np
+
+EPOCHS = ("epoch_now", "epoch_last")
+PORT, FLOW = 0, 1
+
+def port_name(switch, port):
+    return f"SW{switch}-P{port}"
+
+def load_topology_ports(topo_file):
+    """按 third.cc 建链顺序还原端口号：返回 {(node, port): (peer, peer_port)} 与交换机集合
+
+    每个节点的端口号从1开始 (0为回环设备)，按链路在拓扑文件中出现的顺序递增。
+    """
+    with open(topo_file, 'r') as f:
+        tokens = f.read().split()
+    node_num, switch_num, link_num = (int(v) for v in tokens[:3])
+    switches = set(int(v) for v in tokens[3:3 + switch_num])
+    pos = 3 + switch_num
+    next_port = [1] * node_num
+    peers = {}
+    for _ in range(link_num):
+        a, b = int(tokens[pos]), int(tokens[pos + 1])
+        pos += 5
+        pa, pb = next_port[a], next_port[b]
+        next_port[a] += 1
+        next_port[b] += 1
+        peers[(a, pa)] = (b, pb)
+        peers[(b, pb)] = (a, pa)
+    return peers, switches
+
+def build_csr(src, dst, weight, n):
+    """合并重复边并返回按行排序的 CSR 三元组 (indptr, indices, data)"""
+    key = np.asarray(src, dtype=np.int64) * n + np.asarray(dst, dtype=np.int64)
+    key, inverse = np.unique(key, return_inverse=True)
+    data = np.bincount(inverse, weights=weight, minlength=len(key))
+    rows = key // n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, key % n, data
+
+class ProvenanceGraph:
+    """端口/流顶点上的带权有向图，邻接矩阵以 CSR 形式保存"""
+
+    def __init__(self, topo_file=None):
+        self.peers, self.switches = load_topology_ports(topo_file) if topo_file else ({}, set())
+        self.names = []
+        self.kinds = []
+        self.index = {}
+        self.src = []
+        self.dst = []
+        self.weight = []
+        self.symptom = {}  #端口顶点 -> 被暂停包数，作为 PageRank 的重启分布
+        self.kind_array = self.indptr = self.indices = self.data = None
+
+    def vertex(self, name, kind):
+        idx = self.index.get(name)
+        if idx is None:
+            idx = self.index[name] = len(self.names)
+            self.names.append(name)
+            self.kinds.append(kind)
+        return idx
+
+    def add_edge(self, u, v, w):
+        if w > 0:
+            self.src.append(u)
+            self.dst.append(v)
+            self.weight.append(w)
+
+    def add_poll(self, switch, poll):
+        """把一条遥测记录的边加入图中；之后需调用 finalize() 重建 CSR"""
+        inport = poll.get("inport")
+        if inport is not None:
+            u = self.vertex(port_name(switch, inport), PORT)
+            peer = self.peers.get((int(switch), int(inport)))
+            if peer is not None and peer[0] in self.switches:
+                self.add_edge(self.vertex(port_name(*peer), PORT), u, 1.0)
+        for epoch in EPOCHS:
+            for port, tele in poll.get(epoch, {}).items():
+                if port == "p2p_weight":
+                    if inport is not None:
+                        u = self.vertex(port_name(switch, inport), PORT)
+                        for out, w in tele.items():
+                            self.add_edge(u, self.vertex(port_name(switch, out), PORT), w)
+                    continue
+                p = self.vertex(port_name(switch, port), PORT)
+                self.symptom[p] = self.symptom.get(p, 0) + tele.get("paused_pkt", 0)
+                for flow, paused in tele.get("f2p_weight", {}).items():
+                    self.add_edge(self.vertex(flow, FLOW), p, paused)
+                for flow, degree in tele.get("p2f_weight", {}).items():
+                    self.add_edge(p, self.vertex(flow, FLOW), degree)
+
+    @classmethod
+    def from_switch_dict(cls, switch_dict, topo_file=None, t_start=None, t_end=None):
+        """由 telemetry.json 的内容建图；t_start/t_end (ns) 限定参与建图的记录时间"""
+        g = cls(topo_file)
+        for switch, polls in switch_dict.items():
+            for time, poll in polls.items():
+                t = int(time)
+                if (t_start is not None and t < t_start) or (t_end is not None and t > t_end):
+                    continue
+                g.add_poll(switch, poll)
+        g.finalize()
+        return g
+
+    def finalize(self):
+        """由已加入的边重建 CSR 邻接矩阵，重复边权重相加"""
+        n = len(self.names)
+        self.kind_array = np.asarray(self.kinds, dtype=np.int8)
+        self.indptr, self.indices, self.data = build_csr(self.src, self.dst, np.asarray(self.weight, dtype=np.float64), n)
+
+    @property
+    def num_vertices(self):
+        return len(self.names)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def rows(self):
+        return np.repeat(np.arange(self.num_vertices), np.diff(self.indptr))
+
+    def personalization(self):
+        """重启分布：按端口被暂停包数加权；全部为0时退化为均匀分布"""
+        v = np.zeros(self.num_vertices)
+        if self.symptom:
+            idx = np.fromiter(self.symptom.keys(), dtype=np.int64, count=len(self.symptom))
+            v[idx] = np.fromiter(self.symptom.values(), dtype=np.float64, count=len(self.symptom))
+        total = v.sum()
+        return v / total if total > 0 else np.full(self.num_vertices, 1.0 / max(self.num_vertices, 1))
+
+    def pagerank(self, alpha=0.85, tol=1e-8, max_iter=200):
+        """个性化 PageRank：按出边权重归一化转移，无出边顶点的质量回到重启分布"""
+        n = self.num_vertices
+        if n == 0:
+            return np.zeros(0)
+        rows = self.rows()
+        out_w = np.bincount(rows, weights=self.data, minlength=n)
+        prob = self.data / out_w[rows]
+        dangling = out_w == 0
+        v = self.personalization()
+        x = v.copy()
+        for _ in range(max_iter):
+            spread = np.bincount(self.indices, weights=x[rows] * prob, minlength=n)
+            x_new = alpha * (spread + x[dangling].sum() * v) + (1 - alpha) * v
+            err = np.abs(x_new - x).sum()
+            x = x_new
+            if err < tol:
+                break
+        return x
+
+    def indegree(self):
+        """加权入度"""
+        return np.bincount(self.indices, weights=self.data, minlength=self.num_vertices)
+
+    def rank(self, method='pagerank', alpha=0.85):
+        """按 method ('pagerank' 或 'indegree') 计算各顶点得分"""
+        return self.pagerank(alpha) if method == 'pagerank' else self.indegree()
+
+    def top_k(self, scores, kind, k):
+        """返回 kind 类顶点中得分最高的 k 个 (name, score)"""
+        idx = np.flatnonzero(self.kind_array == kind)
+        k = min(k, len(idx))
+        if k == 0:
+            return []
+        top = idx[np.argpartition(-scores[idx], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.names[i], float(scores[i])) for i in top]
+
+def main():
+    parser = argparse.ArgumentParser(description='Rank root-cause ports and flows on the PFC provenance graph')
+    parser.add_argument('telemetry', nargs='?', default='telemetry.json', help='telemetry.json written by graph.py')
+    parser.add_argument('--topo', help='Topology file, links signal-receiving ports to the upstream paused ports')
+    parser.add_argument('--method', choices=['pagerank', 'indegree'], default='pagerank')
+    parser.add_argument('--alpha', type=float, default=0.85, help='PageRank damping factor')
+    parser.add_argument('-k', '--top', type=int, default=10, help='Number of ports and flows to report')
+    parser.add_argument('--start', type=int, help='Only use telemetry records at or after this time (ns)')
+    parser.add_argument('--end', type=int, help='Only use telemetry records at or before this time (ns)')
+    parser.add_argument('--csv', help='Write the full ranking to this CSV file')
+    args = parser.parse_args()
+
+    with open(args.telemetry, 'r') as f:
+        switch_dict = json.load(f)
+    g = ProvenanceGraph.from_switch_dict(switch_dict, args.topo, args.start, args.end)
+    scores = g.rank(args.method, args.alpha)
+    print(f"Provenance graph: {g.num_vertices} vertices, {g.num_edges} edges")
+
+    for kind, title in ((PORT, 'ports'), (FLOW, 'flows')):
+        print(f"\nTop {args.top} root-cause {title} ({args.method}):")
+        for rank, (name, score) in enumerate(g.top_k(scores, kind, args.top), 1):
+            print(f"  {rank:3d}. {name:<24s} {score:.6g}")
+
+    if args.csv:
+        order = np.argsort(-scores, kind='stable')
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['rank', 'vertex', 'type', 'score'])
+            for rank, i in enumerate(order, 1):
+                writer.writerow([rank, g.names[i], 'port' if g.kinds[i] == PORT else 'flow', scores[i]])
+        print(f"\nRanking saved to {args.csv}")
+
+if __name__ == "__main__":
+    main()
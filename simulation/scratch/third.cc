@@ -38,6 +38,8 @@
 #include <ns3/rdma-driver.h>
 #include <ns3/switch-node.h>
 #include <ns3/sim-setting.h>
+#include <ns3/telemetry-format.h>
+#include <ns3/monitor-format.h>
 
 using namespace ns3;
 using namespace std;
@@ -81,8 +83,14 @@ bool rate_bound = true; // 速率边界限制
 uint32_t ack_high_prio = 0; // ACK报文是否设为高优先级
 uint64_t link_down_time = 0; // 链路断开的时间点
 uint32_t link_down_A = 0, link_down_B = 0; // 链路断开的两个端点节点ID
+uint32_t incremental_route_repair = 0; // 1: 断链时只修复受影响目的主机的路由表项, 0: 全量重算并清空所有路由表
 
 uint32_t enable_trace = 1; // 是否启用追踪记录
+uint32_t trace_block_records = 0; // trace块大小(记录数)，0表示逐条写出的原始格式
+uint32_t trace_compress = 1; // 块模式下是否用zlib压缩每块
+uint32_t trace_event_mask = ~0u; // 记录的事件类型，第i位对应 Event i (Recv/Enqu/Dequ/Drop)
+vector<pair<uint32_t, uint32_t> > trace_ports; // 只记录这些 (node, port)，为空表示 trace.txt 中节点的所有端口
+uint64_t trace_start = 0, trace_end = ~(uint64_t)0; // 记录的时间窗口 (ns)
 
 uint32_t buffer_size = 16; // 缓冲区大小（通常以数据包数量计）
 
@@ -91,6 +99,8 @@ uint32_t qlen_dump_interval = 1000000, qlen_mon_interval = 100;
 // 队列长度监控的开始和结束时间 (ns)
 uint64_t qlen_mon_start = 2000000000, qlen_mon_end = 2100000000;
 string qlen_mon_file; // 队列长度监控输出文件路径
+uint32_t qlen_mon_format = 0; // 0: 每次输出完整的累计分布 (文本), 1: 二进制，每次只输出区间内新增的非零桶 (QlenDeltaRecord)
+uint32_t qlen_mon_change_only = 0; // 1: 只在端口出队列长度变化后的下一个采样点重新采样，输出与逐周期采样相同
 
 unordered_map<uint64_t, uint32_t> rate2kmax, rate2kmin;
 
@@ -99,6 +109,16 @@ string link_util_mon_file;                    // 链路利用率输出文件路
 uint32_t link_util_mon_interval = 100000;     // 监控间隔 (ns), 默认100us
 uint64_t link_util_mon_start = 0;             // 监控开始时间 (ns)
 uint64_t link_util_mon_end = 5000000000;      // 监控结束时间 (ns), 默认5s
+uint32_t link_util_mon_format = 0;            // 0: 文本, 1: 二进制，每次采样写一行各端口的累计发送字节数
+
+// 入端口队列监控参数 (用于PFC分析)
+string ingress_mon_file; // 入端口队列输出文件路径
+uint32_t ingress_mon_interval = 1000; // 监控间隔 (ns), 默认1us
+// 入端口队列监控的开始和结束时间 (ns)
+uint64_t ingress_mon_start = 2000000000, ingress_mon_end = 2100000000;
+uint32_t ingress_mon_format = 0; // 0: 文本, 1: 二进制 (IngressRecord)
+uint32_t ingress_mon_change_only = 0; // 1: 只在端口状态变化后的下一个采样点输出有变化的端口，读取端向前填充
+uint32_t ingress_mon_threshold = 0; // 按变化采样时，ingress/egress/hdrm 字节数的变化超过此值才输出 (bytes)
 
 // 存储每个节点每个端口的上次统计字节数和时间
 struct LinkStats {
@@ -117,6 +137,7 @@ set<int> agent_nodes;
 set<int> no_cc_nodes;
 uint32_t agent_threshold;
 uint32_t epoch_time = 0;
+uint32_t telemetry_format = 0; // 0: 每个交换机一个文本文件 telemetry_<id>.txt, 1: 所有交换机共用二进制 telemetry.bin
 
 /************************************************
  * Runtime varibles 运行时变量
@@ -138,13 +159,58 @@ struct Interface{
 	Interface() : idx(0), up(false){}
 };
 map<Ptr<Node>, map<Ptr<Node>, Interface> > nbr2if; //邻居（nbr）节点到接口（if）的映射
-// Mapping destination to next hop for each node: <node, <dest, <nexthop0, ...> > >
-map<Ptr<Node>, map<Ptr<Node>, vector<Ptr<Node> > > > nextHop;
-map<Ptr<Node>, map<Ptr<Node>, uint64_t> > pairDelay;
-map<Ptr<Node>, map<Ptr<Node>, uint64_t> > pairTxDelay;
-map<uint32_t, map<uint32_t, uint64_t> > pairBw;
-map<Ptr<Node>, map<Ptr<Node>, uint64_t> > pairBdp;
-map<uint32_t, map<uint32_t, uint64_t> > pairRtt;
+
+/*
+ * 路由表：全部按节点编号索引。每个目的主机对应一次BFS (RouteInfo)，只有一条上行链路连到交换机的主机
+ * 共用该 ToR 交换机为起点的BFS结果，主机到 ToR 的一跳单独记录在 HostRoute 中。
+ */
+struct Neighbor{
+	uint32_t id;		// 邻居节点编号
+	Interface *intf;	// nbr2if[node][邻居]
+	uint32_t rev;		// 本节点在邻居的 nbrList 中的位置
+};
+vector<vector<Neighbor> > nbrList;	// nbrList[node]：按 nbr2if[node] 的遍历顺序排列，决定ECMP下一跳的顺序
+struct PathMetric{
+	uint64_t delay;		// 传播延迟
+	uint64_t txDelay;	// 传输延迟
+	uint64_t bw;		// 瓶颈带宽，0 表示不可达
+};
+struct RouteInfo{
+	uint32_t root;		// BFS 起点：ToR 交换机，或主机自身
+	vector<int> dis;	// 到 root 的跳数，-1 表示不可达
+	vector<uint32_t> hopStart, hops;	// 节点 i 去往 root 的下一跳为 nbrList[i][hops[hopStart[i] .. hopStart[i+1])]
+};
+vector<RouteInfo> routes;
+vector<int> routeOfRoot;	// BFS起点 -> routes 下标，-1 表示尚无以该节点为起点的路由
+struct HostRoute{
+	int route;			// routes 下标，非主机为 -1
+	uint32_t rootPos;	// 共用 ToR 的路由时，主机在 nbrList[root] 中的位置
+	PathMetric link;	// 主机到 root 的一跳；root 为主机自身时为 {0, 0, max}
+};
+struct RouteMetrics{
+	vector<HostRoute> host;
+	vector<vector<PathMetric> > metric;	// metric[r][i]：节点 i 沿BFS树到 routes[r].root 的路径
+	// src 到主机 dst 的路径，与逐主机BFS得到的结果相同
+	PathMetric Pair(uint32_t src, uint32_t dst) const{
+		const HostRoute &hr = host[dst];
+		if (src == dst)
+			return PathMetric{0, 0, 0xfffffffffffffffflu};
+		const PathMetric &m = metric[hr.route][src];
+		if (m.bw == 0)
+			return PathMetric{0, 0, 0};
+		return PathMetric{m.delay + hr.link.delay, m.txDelay + hr.link.txDelay, std::min(m.bw, hr.link.bw)};
+	}
+};
+RouteMetrics routeMetrics;		// 当前路由 (断链后更新)
+RouteMetrics baseRouteMetrics;	// 建网时的路由，PairRtt / PairBdp 以此计算 (断链后不变)
+
+uint64_t PairRtt(uint32_t src, uint32_t dst){
+	PathMetric p = baseRouteMetrics.Pair(src, dst);
+	return p.delay * 2 + p.txDelay;
+}
+uint64_t PairBdp(uint32_t src, uint32_t dst){
+	return PairRtt(src, dst) * baseRouteMetrics.Pair(src, dst).bw / 1000000000/8;
+}
 
 std::vector<Ipv4Address> serverAddress;
 
@@ -178,7 +244,7 @@ void ScheduleFlowInputs(){
 #endif
 	while (flow_input.idx < flow_num && Seconds(flow_input.start_time) == Simulator::Now()){
 		uint32_t port = portNumder[flow_input.src][flow_input.dst]++; // get a new port number
-		RdmaClientHelper clientHelper(flow_input.pg, serverAddress[flow_input.src], serverAddress[flow_input.dst], port, flow_input.dport, flow_input.maxPacketCount, has_win?(global_t==1?maxBdp:pairBdp[n.Get(flow_input.src)][n.Get(flow_input.dst)]):0, global_t==1?maxRtt:pairRtt[flow_input.src][flow_input.dst]);
+		RdmaClientHelper clientHelper(flow_input.pg, serverAddress[flow_input.src], serverAddress[flow_input.dst], port, flow_input.dport, flow_input.maxPacketCount, has_win?(global_t==1?maxBdp:PairBdp(flow_input.src, flow_input.dst)):0, global_t==1?maxRtt:PairRtt(flow_input.src, flow_input.dst));
 		ApplicationContainer appCon = clientHelper.Install(n.Get(flow_input.src));
 		appCon.Start(Time(0));
 		// std::cout << "[FlowSchedule t=" << Simulator::Now().GetSeconds() << "s] "
@@ -236,7 +302,9 @@ void qp_finish(FILE* fout, Ptr<RdmaQueuePair> q){
 	LOG_GREEN("qp_finish!");
 #endif
 	uint32_t sid = ip_to_node_id(q->sip), did = ip_to_node_id(q->dip);
-	uint64_t base_rtt = pairRtt[sid][did], b = pairBw[sid][did]; //获取源节点到目的节点的往返延迟和瓶颈带宽
+	uint64_t base_rtt = PairRtt(sid, did), b = routeMetrics.Pair(sid, did).bw; //获取源节点到目的节点的往返延迟和瓶颈带宽
+	if (b == 0) //链路故障后已不可达 (最后的ACK已在途中)，沿用故障前的瓶颈带宽
+		b = baseRouteMetrics.Pair(sid, did).bw;
 	//计算总传输字节数（包括数据包头） 总字节数 = 有效载荷 + 所有包的头部开销（不含 INT）
 	uint32_t total_bytes = q->m_size + ((q->m_size-1) / packet_payload_size + 1) * (CustomHeader::GetStaticWholeHeaderSize() - IntHeader::GetStaticSize()); // translate to the minimum bytes required (with header but no INT)
 	uint64_t standalone_fct = base_rtt + total_bytes * 8000000000lu / b; //计算理想FCT（不考虑排队延迟）
@@ -277,49 +345,204 @@ void get_pfc(FILE* fout, Ptr<QbbNetDevice> dev, uint32_t type){  //文件 设备
 	fprintf(fout, "%lu %u %u %u %u\n", Simulator::Now().GetTimeStep(), dev->GetNode()->GetId(), dev->GetNode()->GetNodeType(), dev->GetIfIndex(), type);
 }
 
+//周期采样监控器的最后一个采样点：在第一个不早于 end 的采样点之后停止
+uint64_t monitor_last_sample(uint64_t start, uint64_t end, uint64_t interval){
+	if (end <= start)
+		return start;
+	return start + (end - start + interval - 1) / interval * interval;
+}
+
 struct QlenDistribution{
 	vector<uint32_t> cnt; // cnt[i] is the number of times that the queue len is i KB
 
-	void add(uint32_t qlen){
+	void add(uint32_t qlen, uint32_t times = 1){
 		uint32_t kb = qlen / 1000;
 		if (cnt.size() < kb+1)
 			cnt.resize(kb+1);
-		cnt[kb]++;
+		cnt[kb] += times;
 	}
 };
 map<uint32_t, map<uint32_t, QlenDistribution> > queue_result;
+uint32_t qlen_samples = 0; // 自上一次输出以来的采样次数 (QLEN_MON_FORMAT 1)
+
+//交换机端口所有队列的总长度
+uint32_t port_egress_bytes(Ptr<SwitchNode> sw, uint32_t j){
+	uint32_t size = 0;
+	for (uint32_t k = 0; k < SwitchMmu::qCnt; k++) //遍历交换机端口所有队列
+		size += sw->m_mmu->egress_bytes[j][k];
+	return size;
+}
+
+//将交换机缓冲区队列长度记录写入文件
+void write_qlen_dump(FILE* qlen_output, uint64_t now){
+	if (qlen_mon_format == 1){ //二进制：只写本区间内新增的非空队列桶 (kb > 0)，写完后清零
+		vector<QlenDeltaRecord> records;
+		for (auto &it0 : queue_result)
+			for (auto &it1 : it0.second){
+				auto &dist = it1.second.cnt;
+				for (uint32_t i = 1; i < dist.size(); i++){
+					if (dist[i] > 0)
+						records.push_back(QlenDeltaRecord{it0.first, it1.first, i, dist[i]});
+				}
+				std::fill(dist.begin(), dist.end(), 0);
+			}
+		QlenDumpHeader dh{now, qlen_samples, (uint32_t)records.size()};
+		fwrite(&dh, sizeof(dh), 1, qlen_output);
+		fwrite(records.data(), sizeof(QlenDeltaRecord), records.size(), qlen_output);
+		qlen_samples = 0;
+	}else{
+		fprintf(qlen_output, "time: %lu\n", now);
+		for (auto &it0 : queue_result) //遍历所有交换机
+			for (auto &it1 : it0.second){ //遍历交换机所有网络设备(端口)
+				fprintf(qlen_output, "%u %u", it0.first, it1.first);
+				auto &dist = it1.second.cnt;
+				for (uint32_t i = 0; i < dist.size(); i++)
+					fprintf(qlen_output, " %u", dist[i]); 
+				fprintf(qlen_output, "\n");
+			}
+	}
+	fflush(qlen_output);
+}
+
 //监控交换机缓冲区队列长度
 void monitor_buffer(FILE* qlen_output, NodeContainer *n){
+	qlen_samples++;
 	for (uint32_t i = 0; i < n->GetN(); i++){
 		if (n->Get(i)->GetNodeType() == 1){ // is switch
 			Ptr<SwitchNode> sw = DynamicCast<SwitchNode>(n->Get(i));
 			if (queue_result.find(i) == queue_result.end())
 				queue_result[i]; //如果第一次遇到此交换机，则创建交换机缓冲区队列长度记录
 			for (uint32_t j = 1; j < sw->GetNDevices(); j++){ //遍历交换机的所有网络设备(端口) j从1开始，因为0是交换机本身或者是CPU端口
-				uint32_t size = 0;
-				for (uint32_t k = 0; k < SwitchMmu::qCnt; k++) //遍历交换机端口所有队列
-					size += sw->m_mmu->egress_bytes[j][k]; //统计交换机端口所有队列的总长度
+				uint32_t size = port_egress_bytes(sw, j); //统计交换机端口所有队列的总长度
 				//cout<<"switch "<<i<<" port "<<j<<" size: "<<size<<endl;
 				queue_result[i][j].add(size); //将交换机端口所有队列的总长度添加到交换机缓冲区队列长度记录中
 			}
 		}
 	}
-	if (Simulator::Now().GetTimeStep() % qlen_dump_interval == 0){ //每隔qlen_dump_interval个时间步，将交换机缓冲区队列长度记录写入文件
-		fprintf(qlen_output, "time: %lu\n", Simulator::Now().GetTimeStep());
-		for (auto &it0 : queue_result) //遍历所有交换机
-			for (auto &it1 : it0.second){ //遍历交换机所有网络设备(端口)
-				fprintf(qlen_output, "%u %u", it0.first, it1.first);
-				auto &dist = it1.second.cnt;
-				for (uint32_t i = 0; i < dist.size(); i++)
-					fprintf(qlen_output, " %u", dist[i]); 
-				fprintf(qlen_output, "\n");
-			}
-		fflush(qlen_output);
-	}
+	if (Simulator::Now().GetTimeStep() % qlen_dump_interval == 0) //每隔qlen_dump_interval个时间步，将交换机缓冲区队列长度记录写入文件
+		write_qlen_dump(qlen_output, Simulator::Now().GetTimeStep());
 	if (Simulator::Now().GetTimeStep() < qlen_mon_end) //如果当前时间步小于qlen_mon_end，则调度下一个时间步的缓冲区监控
 		Simulator::Schedule(NanoSeconds(qlen_mon_interval), &monitor_buffer, qlen_output, n); //递归调用
 }
 
+// QLEN_MON_CHANGE_ONLY: 各端口当前的出队列长度及其从第几个采样点起尚未计入分布，及自上一次采样以来出队列有变化的端口
+struct QlenPortState{
+	uint32_t qlen = 0;
+	uint64_t since = 0;
+	bool dirty = false;
+};
+vector<vector<QlenPortState> > qlen_state; // [node][port]，监控开始后才分配
+vector<pair<Ptr<SwitchNode>, uint32_t> > qlen_dirty;
+bool qlen_sample_pending = false;
+uint64_t qlen_next_dump = 0; // 下一次输出的时刻
+uint64_t qlen_dump_from = 0; // 下一次输出的区间从第几个采样点开始
+
+//不早于 t 的第一个输出时刻：与逐周期采样相同，是 qlen_dump_interval 整数倍的采样点；没有时返回 UINT64_MAX
+uint64_t qlen_dump_after(uint64_t t){
+	uint64_t last = monitor_last_sample(qlen_mon_start, qlen_mon_end, qlen_mon_interval);
+	for (uint64_t d = (t + qlen_dump_interval - 1) / qlen_dump_interval * qlen_dump_interval; d <= last; d += qlen_dump_interval)
+		if ((d - qlen_mon_start) % qlen_mon_interval == 0)
+			return d;
+	return UINT64_MAX;
+}
+
+//在第 k 个采样点重新采样一个端口：队列长度桶变化时，把旧的长度按其保持的采样点数计入分布
+void sample_qlen_port(uint64_t k, Ptr<SwitchNode> sw, uint32_t j){
+	QlenPortState &st = qlen_state[sw->GetId()][j];
+	st.dirty = false;
+	uint32_t size = port_egress_bytes(sw, j);
+	if (size / 1000 != st.qlen / 1000){
+		queue_result[sw->GetId()][j].add(st.qlen, k - st.since);
+		st.qlen = size;
+		st.since = k;
+	}
+}
+
+void dump_buffer_changes(FILE* qlen_output);
+
+//在输出的前一个采样点调度输出：与逐周期采样相同，输出与同一时刻其他事件的先后顺序不变
+void pre_dump_buffer_changes(FILE* qlen_output){
+	Simulator::Schedule(NanoSeconds(qlen_mon_interval), &dump_buffer_changes, qlen_output);
+}
+
+//调度不早于 t 的下一次输出
+void schedule_buffer_dump(FILE* qlen_output, uint64_t t){
+	uint64_t now = Simulator::Now().GetTimeStep();
+	qlen_next_dump = qlen_dump_after(t);
+	if (qlen_next_dump == UINT64_MAX)
+		return;
+	if (qlen_next_dump == now)
+		Simulator::ScheduleNow(&dump_buffer_changes, qlen_output);
+	else
+		Simulator::Schedule(NanoSeconds(qlen_next_dump - qlen_mon_interval - now), &pre_dump_buffer_changes, qlen_output);
+}
+
+/**
+ * QLEN_MON_CHANGE_ONLY 1: 监控开始时记录各端口的出队列长度，之后只在出队列变化后的下一个采样点重新采样有变化的端口，
+ * 输出时再把各端口当前的长度按其保持的采样点数一次计入分布。输出与逐周期采样相同，空闲时不产生事件
+ */
+void monitor_buffer_start(FILE* qlen_output, NodeContainer *n){
+	qlen_state.resize(n->GetN());
+	for (uint32_t i = 0; i < n->GetN(); i++){
+		if (n->Get(i)->GetNodeType() != 1)
+			continue;
+		Ptr<SwitchNode> sw = DynamicCast<SwitchNode>(n->Get(i));
+		qlen_state[i].resize(sw->GetNDevices());
+		for (uint32_t j = 1; j < sw->GetNDevices(); j++){
+			queue_result[i][j];
+			qlen_state[i][j].qlen = port_egress_bytes(sw, j);
+		}
+	}
+	schedule_buffer_dump(qlen_output, qlen_mon_start);
+}
+
+//按变化采样：只重新采样自上一次采样以来出队列有变化的端口
+void monitor_buffer_changes(){
+	uint64_t k = (Simulator::Now().GetTimeStep() - qlen_mon_start) / qlen_mon_interval;
+	for (auto &it : qlen_dirty)
+		sample_qlen_port(k, it.first, it.second);
+	qlen_dirty.clear();
+	qlen_sample_pending = false;
+}
+
+//按变化采样时的输出：先采样有变化的端口，再把各端口到本采样点为止的长度计入分布
+void dump_buffer_changes(FILE* qlen_output){
+	uint64_t now = Simulator::Now().GetTimeStep();
+	uint64_t k = (now - qlen_mon_start) / qlen_mon_interval;
+	for (auto &it : qlen_dirty)
+		sample_qlen_port(k, it.first, it.second);
+	qlen_dirty.clear();
+	for (uint32_t i = 0; i < qlen_state.size(); i++)
+		for (uint32_t j = 1; j < qlen_state[i].size(); j++){
+			QlenPortState &st = qlen_state[i][j];
+			queue_result[i][j].add(st.qlen, k + 1 - st.since);
+			st.since = k + 1;
+		}
+	qlen_samples = k + 1 - qlen_dump_from;
+	qlen_dump_from = k + 1;
+	write_qlen_dump(qlen_output, now);
+	schedule_buffer_dump(qlen_output, now + 1);
+}
+
+//SwitchNode "MmuChange" 回调：标记端口，并在下一个采样点调度一次采样 (下一个采样点要输出时由输出一并采样)；监控区间外忽略
+void qlen_port_changed(Ptr<SwitchNode> sw, uint32_t port){
+	if (qlen_state.empty()) // 监控尚未开始
+		return;
+	uint64_t now = Simulator::Now().GetTimeStep();
+	uint64_t next = qlen_mon_start + ((now - qlen_mon_start) / qlen_mon_interval + 1) * qlen_mon_interval;
+	if (next > monitor_last_sample(qlen_mon_start, qlen_mon_end, qlen_mon_interval))
+		return;
+	QlenPortState &st = qlen_state[sw->GetId()][port];
+	if (!st.dirty){
+		st.dirty = true;
+		qlen_dirty.push_back(make_pair(sw, port));
+	}
+	if (!qlen_sample_pending && next != qlen_next_dump){
+		qlen_sample_pending = true;
+		Simulator::Schedule(NanoSeconds(next - now), &monitor_buffer_changes);
+	}
+}
+
 /**
  * 监控链路利用率和吞吐量（支持主机和交换机节点）
  * @param link_util_output 输出文件指针
@@ -331,8 +554,10 @@ void monitor_buffer(FILE* qlen_output, NodeContainer *n){
  */
 void monitor_link_utilization(FILE* link_util_output, NodeContainer *n) {
     uint64_t currentTime = Simulator::Now().GetTimeStep();
+    vector<uint64_t> txBytes; // LINK_UTIL_MON_FORMAT 1: 按端口表顺序的累计发送字节数
     
-    fprintf(link_util_output, "time: %lu\n", currentTime);
+    if (link_util_mon_format != 1)
+        fprintf(link_util_output, "time: %lu\n", currentTime);
     
     for (uint32_t i = 0; i < n->GetN(); i++) {
         Ptr<Node> node = n->Get(i);
@@ -364,10 +589,14 @@ void monitor_link_utilization(FILE* link_util_output, NodeContainer *n) {
                 }
             }
             
+            // 二进制格式只记录累计字节数，吞吐与利用率由读取端计算
+            if (link_util_mon_format == 1)
+                txBytes.push_back(currentTxBytes);
+            
             // 计算时间间隔 (秒)
             double deltaTime = (currentTime - stats.lastTime) / 1e9;
             
-            if (deltaTime > 0 && stats.lastTime > 0) {
+            if (link_util_mon_format != 1 && deltaTime > 0 && stats.lastTime > 0) {
                 uint64_t deltaTxBytes = currentTxBytes - stats.lastTxBytes;
                 
                 // 计算吞吐量 (Gbps)
@@ -386,6 +615,10 @@ void monitor_link_utilization(FILE* link_util_output, NodeContainer *n) {
         }
     }
     
+    if (link_util_mon_format == 1) {
+        fwrite(&currentTime, sizeof(currentTime), 1, link_util_output);
+        fwrite(txBytes.data(), sizeof(uint64_t), txBytes.size(), link_util_output);
+    }
     fflush(link_util_output);
     
     // 如果当前时间小于监控结束时间，则在指定间隔后再次调度链路利用率监控函数
@@ -395,72 +628,281 @@ void monitor_link_utilization(FILE* link_util_output, NodeContainer *n) {
     }
 }
 
+//某交换机端口当前的 MMU 入端口状态：各队列字节数之和，paused 为任一队列是否已向上游发出 PAUSE
+IngressRecord sample_ingress_port(uint64_t now, Ptr<SwitchNode> sw, uint32_t j){
+	IngressRecord r{now, sw->GetId(), j, 0, 0, 0, 0};
+	for (uint32_t k = 0; k < SwitchMmu::qCnt; k++){
+		r.ingress += sw->m_mmu->ingress_bytes[j][k];
+		r.egress += sw->m_mmu->egress_bytes[j][k];
+		r.hdrm += sw->m_mmu->hdrm_bytes[j][k];
+		r.paused |= sw->m_mmu->paused[j][k] ? 1 : 0;
+	}
+	return r;
+}
 
-//计算路由 
-void CalculateRoute(Ptr<Node> host){
-	#if ENABLE_PRINT_DEBUG_LOG
-		// cout<<"--------------------------------"<<endl;
-		// cout<<"CalculateRoute!"<<endl;
-		// cout<<"host: "<<host->GetId()<<endl;
-		// cout<<"--------------------------------"<<endl;
-	#endif
+bool ingress_idle(const IngressRecord &r){
+	return r.ingress == 0 && r.egress == 0 && r.hdrm == 0 && r.paused == 0;
+}
+
+//写出一次采样；文本格式下 writeTime 为 false 且没有记录时不写 "time:" 行
+void write_ingress(FILE* ingress_output, uint64_t now, const vector<IngressRecord> &records, bool writeTime){
+	if (ingress_mon_format == 1){
+		fwrite(records.data(), sizeof(IngressRecord), records.size(), ingress_output);
+	}else{
+		if (writeTime || !records.empty())
+			fprintf(ingress_output, "time: %lu\n", now);
+		for (auto &r : records)
+			fprintf(ingress_output, "%u %u %u %u %u %u\n", r.node, r.port, r.ingress, r.egress, r.hdrm, r.paused);
+	}
+	fflush(ingress_output);
+}
+
+// INGRESS_MON_CHANGE_ONLY: 各端口上一次输出的状态，及自上一次采样以来 MMU 有变化的端口
+struct IngressPortState{
+	IngressRecord last;
+	bool dirty = false;
+};
+vector<vector<IngressPortState> > ingress_state; // [node][port]，监控开始后才分配
+vector<pair<Ptr<SwitchNode>, uint32_t> > ingress_dirty;
+bool ingress_sample_pending = false;
+
+//按变化采样时，端口是否需要输出：PAUSE 状态变化、回到空闲，或任一字节数相对上一次输出的变化超过阈值
+//(回到空闲总是输出，向前填充后不会把低于阈值的残留一直保持下去)
+bool ingress_changed(const IngressRecord &last, const IngressRecord &r){
+	if (last.paused != r.paused || (ingress_idle(r) && !ingress_idle(last)))
+		return true;
+	auto diff = [](uint32_t a, uint32_t b){ return a > b ? a - b : b - a; };
+	return diff(last.ingress, r.ingress) > ingress_mon_threshold
+		|| diff(last.egress, r.egress) > ingress_mon_threshold
+		|| diff(last.hdrm, r.hdrm) > ingress_mon_threshold;
+}
+
+/**
+ * 监控交换机各端口的 MMU 入端口状态 (用于PFC分析)
+ * 每个端口取各队列 ingress_bytes / egress_bytes / hdrm_bytes 之和，paused 为任一队列是否已向上游发出 PAUSE；
+ * 四项全为 0 的端口不输出。
+ *
+ * 输出格式 (INGRESS_MON_FORMAT 0):
+ * time: <timestamp_ns>
+ * <switch_id> <port_id> <ingress_bytes> <egress_bytes> <hdrm_bytes> <paused>
+ * INGRESS_MON_FORMAT 1 时每个端口写一条 IngressRecord
+ *
+ * INGRESS_MON_CHANGE_ONLY 1 时本函数只在开始时运行一次，记录并输出各端口的初始状态，
+ * 之后由 MMU 变化触发 monitor_ingress_changes
+ */
+void monitor_ingress(FILE* ingress_output, NodeContainer *n){
+	uint64_t now = Simulator::Now().GetTimeStep();
+	vector<IngressRecord> records;
+	if (ingress_mon_change_only)
+		ingress_state.resize(n->GetN());
+	for (uint32_t i = 0; i < n->GetN(); i++){
+		if (n->Get(i)->GetNodeType() != 1) // 只监控交换机
+			continue;
+		Ptr<SwitchNode> sw = DynamicCast<SwitchNode>(n->Get(i));
+		if (ingress_mon_change_only)
+			ingress_state[i].resize(sw->GetNDevices());
+		for (uint32_t j = 1; j < sw->GetNDevices(); j++){
+			IngressRecord r = sample_ingress_port(now, sw, j);
+			if (ingress_mon_change_only)
+				ingress_state[i][j].last = r;
+			if (!ingress_idle(r))
+				records.push_back(r);
+		}
+	}
+	write_ingress(ingress_output, now, records, !ingress_mon_change_only);
+	if (!ingress_mon_change_only && now < ingress_mon_end)
+		Simulator::Schedule(NanoSeconds(ingress_mon_interval), &monitor_ingress, ingress_output, n);
+}
+
+//按变化采样：只检查自上一次采样以来 MMU 有变化的端口
+void monitor_ingress_changes(FILE* ingress_output){
+	uint64_t now = Simulator::Now().GetTimeStep();
+	vector<IngressRecord> records;
+	for (auto &it : ingress_dirty){
+		IngressPortState &st = ingress_state[it.first->GetId()][it.second];
+		st.dirty = false;
+		IngressRecord r = sample_ingress_port(now, it.first, it.second);
+		if (ingress_changed(st.last, r)){
+			st.last = r;
+			records.push_back(r);
+		}
+	}
+	ingress_dirty.clear();
+	ingress_sample_pending = false;
+	sort(records.begin(), records.end(), [](const IngressRecord &a, const IngressRecord &b){
+		return a.node != b.node ? a.node < b.node : a.port < b.port;
+	});
+	write_ingress(ingress_output, now, records, false);
+}
+
+//SwitchNode "MmuChange" 回调：标记端口，并在下一个采样点 (晚于当前时刻) 调度一次采样；监控区间外忽略
+void ingress_port_changed(FILE* ingress_output, Ptr<SwitchNode> sw, uint32_t port){
+	if (ingress_state.empty()) // 监控尚未开始
+		return;
+	uint64_t now = Simulator::Now().GetTimeStep();
+	uint64_t next = ingress_mon_start + ((now - ingress_mon_start) / ingress_mon_interval + 1) * ingress_mon_interval;
+	if (next > monitor_last_sample(ingress_mon_start, ingress_mon_end, ingress_mon_interval))
+		return;
+	IngressPortState &st = ingress_state[sw->GetId()][port];
+	if (!st.dirty){
+		st.dirty = true;
+		ingress_dirty.push_back(make_pair(sw, port));
+	}
+	if (!ingress_sample_pending){
+		ingress_sample_pending = true;
+		Simulator::Schedule(NanoSeconds(next - now), &monitor_ingress_changes, ingress_output);
+	}
+}
+
+/**
+ * 按变化采样时，仿真结束后写出监控覆盖到的最后一个采样点 (ingress_mon_end 之后的第一个采样点，
+ * 仿真提前结束时为结束前的最后一个采样点)，读取端把仍未空闲的端口向前填充到该时刻。
+ * 文本格式写 "# End: <t>"，二进制格式写一条 node 为 INGRESS_END_NODE 的 IngressRecord
+ */
+void finish_ingress_monitor(FILE* ingress_output){
+	if (!ingress_mon_change_only || ingress_state.empty()) // 监控尚未开始
+		return;
+	uint64_t now = Simulator::Now().GetTimeStep();
+	uint64_t end = min(monitor_last_sample(ingress_mon_start, ingress_mon_end, ingress_mon_interval), ingress_mon_start + (now - ingress_mon_start) / ingress_mon_interval * ingress_mon_interval);
+	if (ingress_mon_format == 1){
+		IngressRecord r{end, INGRESS_END_NODE, 0, 0, 0, 0, 0};
+		fwrite(&r, sizeof(r), 1, ingress_output);
+	}else{
+		fprintf(ingress_output, "# End: %lu\n", end);
+	}
+	fflush(ingress_output);
+}
+
+
+//计算路由：从 routes[r].root 出发的BFS，记录各节点到 root 的最短路下一跳与路径延迟/带宽
+void CalculateRoute(uint32_t r){
+	RouteInfo &route = routes[r];
+	vector<PathMetric> &metric = routeMetrics.metric[r];
+	uint32_t node_cnt = nbrList.size();
+	route.dis.assign(node_cnt, -1);
+	metric.assign(node_cnt, PathMetric{0, 0, 0});
+	// (节点, 下一跳在 nbrList[节点] 中的位置)，按BFS发现顺序
+	vector<pair<uint32_t, uint32_t> > edges;
 	// queue for the BFS.
-	vector<Ptr<Node> > q;
-	// Distance from the host to each node.
-	map<Ptr<Node>, int> dis; //距离
-	map<Ptr<Node>, uint64_t> delay; //传播延迟
-	map<Ptr<Node>, uint64_t> txDelay; //传输延迟
-	map<Ptr<Node>, uint64_t> bw; //带宽
+	vector<uint32_t> q;
 	// init BFS.
-	q.push_back(host);
-	dis[host] = 0;
-	delay[host] = 0;
-	txDelay[host] = 0;
-	bw[host] = 0xfffffffffffffffflu;
+	q.push_back(route.root);
+	route.dis[route.root] = 0;
+	metric[route.root] = PathMetric{0, 0, 0xfffffffffffffffflu};
 	// BFS.
-	for (int i = 0; i < (int)q.size(); i++){
-		Ptr<Node> now = q[i];
-		int d = dis[now];
-		for (auto it = nbr2if[now].begin(); it != nbr2if[now].end(); it++){
+	for (uint32_t i = 0; i < q.size(); i++){
+		uint32_t now = q[i];
+		int d = route.dis[now];
+		for (const Neighbor &nb : nbrList[now]){
 			// skip down link
-			if (!it->second.up) //如果链路关闭，则跳过
+			if (!nb.intf->up) //如果链路关闭，则跳过
 				continue;
-			Ptr<Node> next = it->first;
+			uint32_t next = nb.id;
 			// If 'next' have not been visited.
-			if (dis.find(next) == dis.end()){ //如果next节点未被访问，则计算next节点到host的距离、延迟、传输延迟和带宽
-				dis[next] = d + 1;
-				delay[next] = delay[now] + it->second.delay; //计算next节点到host的延迟
-				txDelay[next] = txDelay[now] + packet_payload_size * 1000000000lu * 8 / it->second.bw; //计算next节点到host的传输延迟
-				bw[next] = std::min(bw[now], it->second.bw); //计算next节点到host的带宽，取最小值
+			if (route.dis[next] < 0){ //如果next节点未被访问，则计算next节点到root的距离、延迟、传输延迟和带宽
+				route.dis[next] = d + 1;
+				metric[next].delay = metric[now].delay + nb.intf->delay;
+				metric[next].txDelay = metric[now].txDelay + packet_payload_size * 1000000000lu * 8 / nb.intf->bw;
+				metric[next].bw = std::min(metric[now].bw, nb.intf->bw);
 				// we only enqueue switch, because we do not want packets to go through host as middle point
-				if (next->GetNodeType() == 1) //如果next节点是交换机，则加入队列
+				if (n.Get(next)->GetNodeType() == 1) //如果next节点是交换机，则加入队列
 					q.push_back(next);
 			}
-			// if 'now' is on the shortest path from 'next' to 'host'.
-			if (d + 1 == dis[next]){
-				nextHop[next][host].push_back(now);
-				//cout<<"nextHop["<<next->GetId()<<"]["<<host->GetId()<<"].push_back("<<now->GetId()<<")"<<endl;
-			}
+			// if 'now' is on the shortest path from 'next' to 'root'.
+			if (d + 1 == route.dis[next])
+				edges.push_back(make_pair(next, nb.rev));
 		}
 	}
-	for (auto it : delay)
-		pairDelay[it.first][host] = it.second;
-	for (auto it : txDelay)
-		pairTxDelay[it.first][host] = it.second;
-	for (auto it : bw)
-		pairBw[it.first->GetId()][host->GetId()] = it.second;
+	// 按节点稳定计数排序为 CSR，保持每个节点下一跳的发现顺序
+	route.hopStart.assign(node_cnt + 1, 0);
+	for (auto &e : edges)
+		route.hopStart[e.first + 1]++;
+	for (uint32_t i = 0; i < node_cnt; i++)
+		route.hopStart[i + 1] += route.hopStart[i];
+	vector<uint32_t> pos(route.hopStart.begin(), route.hopStart.end() - 1);
+	route.hops.resize(edges.size());
+	for (auto &e : edges)
+		route.hops[pos[e.first]++] = e.second;
+}
+
+//返回以 root 为起点的路由下标，没有时新建 (之后需调用 CalculateRoute)
+int RouteOf(uint32_t root){
+	if (routeOfRoot[root] < 0){
+		routeOfRoot[root] = routes.size();
+		routes.push_back(RouteInfo());
+		routes.back().root = root;
+	}
+	return routeOfRoot[root];
 }
 
+//为主机选定BFS起点：只有一条上行链路且连到交换机时，该主机的BFS与从ToR出发的BFS相同，仅多出主机到ToR的一跳
+HostRoute HostRouteOf(uint32_t host){
+	HostRoute hr{-1, 0, PathMetric{0, 0, 0xfffffffffffffffflu}};
+	uint32_t root = host;
+	const Neighbor *uplink = NULL;
+	uint32_t up_cnt = 0;
+	for (const Neighbor &nb : nbrList[host]){
+		if (nb.intf->up){
+			uplink = &nb;
+			up_cnt++;
+		}
+	}
+	if (up_cnt == 1 && n.Get(uplink->id)->GetNodeType() == 1){
+		root = uplink->id;
+		hr.rootPos = uplink->rev;
+		hr.link = PathMetric{uplink->intf->delay, packet_payload_size * 1000000000lu * 8 / uplink->intf->bw, uplink->intf->bw};
+	}
+	hr.route = RouteOf(root);
+	return hr;
+}
+
+//按 nbr2if 重建邻接表，为每个主机选定BFS起点，再对每个起点计算一次路由
 void CalculateRoutes(NodeContainer &n){
 	#if ENABLE_PRINT_DEBUG_LOG
 		cout<<endl;
 		LOG_YELLOW("CalculateRoutes!");
 	#endif
-	for (int i = 0; i < (int)n.GetN(); i++){
-		Ptr<Node> node = n.Get(i);
-		if (node->GetNodeType() == 0)
-			CalculateRoute(node);
+	uint32_t node_cnt = n.GetN();
+	nbrList.assign(node_cnt, vector<Neighbor>());
+	for (uint32_t i = 0; i < node_cnt; i++){
+		auto it = nbr2if.find(n.Get(i));
+		if (it == nbr2if.end())
+			continue;
+		for (auto &j : it->second)
+			nbrList[i].push_back(Neighbor{j.first->GetId(), &j.second, 0});
+	}
+	for (uint32_t i = 0; i < node_cnt; i++){
+		for (uint32_t k = 0; k < nbrList[i].size(); k++){
+			vector<Neighbor> &peer = nbrList[nbrList[i][k].id];
+			for (uint32_t l = 0; l < peer.size(); l++)
+				if (peer[l].id == i)
+					nbrList[i][k].rev = l;
+		}
+	}
+
+	routes.clear();
+	routeOfRoot.assign(node_cnt, -1);
+	routeMetrics.host.assign(node_cnt, HostRoute{-1, 0, PathMetric{0, 0, 0xfffffffffffffffflu}});
+	for (uint32_t i = 0; i < node_cnt; i++){
+		if (n.Get(i)->GetNodeType() == 0)
+			routeMetrics.host[i] = HostRouteOf(i);
 	}
+	routeMetrics.metric.assign(routes.size(), vector<PathMetric>());
+	for (uint32_t r = 0; r < routes.size(); r++)
+		CalculateRoute(r);
+}
+
+//节点 node 经 route 去往主机 dst 的下一跳，返回其在 nbrList[node] 中位置的区间
+pair<const uint32_t*, const uint32_t*> NextHops(const RouteInfo &route, const HostRoute &hr, uint32_t node, uint32_t dst){
+	if (node == dst)
+		return make_pair((const uint32_t*)NULL, (const uint32_t*)NULL);
+	if (node == route.root) //ToR 直连目的主机
+		return make_pair(&hr.rootPos, &hr.rootPos + 1);
+	return make_pair(route.hops.data() + route.hopStart[node], route.hops.data() + route.hopStart[node + 1]);
+}
+pair<const uint32_t*, const uint32_t*> NextHops(uint32_t node, uint32_t dst){
+	const HostRoute &hr = routeMetrics.host[dst];
+	return NextHops(routes[hr.route], hr, node, dst);
 }
 
 //设置路由表 将计算好的“逻辑路由信息”下发到每个节点的实际转发表/路由表中
@@ -469,33 +911,33 @@ void SetRoutingEntries(){
 		cout<<endl<<"********************************"<<endl;
 		LOG_GREEN("SetRoutingEntries!");
 	#endif
-	// For each node.
-	for (auto i = nextHop.begin(); i != nextHop.end(); i++){ //遍历所有节点
-		Ptr<Node> node = i->first;
-		//cout<<"node: "<<node->GetId()<<" nextHop.size(): "<<i->second.size()<<endl;
-		auto &table = i->second; //table是node的下一跳节点列表
-		for (auto j = table.begin(); j != table.end(); j++){
-			// The destination node.
-			Ptr<Node> dst = j->first; //dst是某个目的节点
-			// The IP address of the dst.
-			Ipv4Address dstAddr = dst->GetObject<Ipv4>()->GetAddress(1, 0).GetLocal(); //dst的IP地址
+	// The IP address of each reachable dst host.
+	vector<uint32_t> dsts;
+	vector<Ipv4Address> dstAddrs;
+	for (uint32_t dst = 0; dst < routeMetrics.host.size(); dst++){
+		if (routeMetrics.host[dst].route < 0)
+			continue;
+		dsts.push_back(dst);
+		dstAddrs.push_back(n.Get(dst)->GetObject<Ipv4>()->GetAddress(1, 0).GetLocal()); //dst的IP地址
+	}
+	// For each node, fill its table for all dsts at once (逐节点填表，只需查找一次交换机/RdmaHw对象)
+	for (uint32_t i = 0; i < nbrList.size(); i++){
+		Ptr<Node> node = n.Get(i);
+		Ptr<SwitchNode> sw;
+		Ptr<RdmaHw> rdmaHw;
+		if (node->GetNodeType() == 1) //如果node是交换机，则添加转发表项
+			sw = DynamicCast<SwitchNode>(node);
+		else //如果node是主机，则添加路由表项
+			rdmaHw = node->GetObject<RdmaDriver>()->m_rdma;
+		for (uint32_t d = 0; d < dsts.size(); d++){
 			// The next hops towards the dst.
-			vector<Ptr<Node> > nexts = j->second; //nexts：从 node 到 dst 的所有最短路径上的下一跳节点集合（由 CalculateRoute 构建）
-			for (int k = 0; k < (int)nexts.size(); k++){
-				Ptr<Node> next = nexts[k]; //next是下一跳节点
-				uint32_t interface = nbr2if[node][next].idx;
-				//cout<<"dstAddr: "<<dstAddr<<" interface: "<<interface<<endl;
-				if (node->GetNodeType() == 1) { //如果node是交换机，则添加转发表项
-					DynamicCast<SwitchNode>(node)->AddTableEntry(dstAddr, interface);
-					#if ENABLE_PRINT_DEBUG_LOG
-						//cout<<"SwitchNode AddTableEntry("<<dstAddr<<", "<<interface<<")"<<endl;
-					#endif
-				} else {
-					node->GetObject<RdmaDriver>()->m_rdma->AddTableEntry(dstAddr, interface); //如果node是主机，则添加路由表项
-					#if ENABLE_PRINT_DEBUG_LOG
-						//cout<<"HostNode AddTableEntry("<<dstAddr<<", "<<interface<<")"<<endl;
-					#endif
-				}
+			auto nexts = NextHops(i, dsts[d]); //从 node 到 dst 的所有最短路径上的下一跳集合
+			for (const uint32_t *k = nexts.first; k != nexts.second; k++){
+				uint32_t interface = nbrList[i][*k].intf->idx;
+				if (sw != 0)
+					sw->AddTableEntry(dstAddrs[d], interface);
+				else
+					rdmaHw->AddTableEntry(dstAddrs[d], interface);
 			}
 		}
 	}
@@ -504,6 +946,86 @@ void SetRoutingEntries(){
 	#endif
 }
 
+//route 的最短路DAG中，node 是否经 nbrList[node][pos] 转发
+bool RouteUsesHop(const RouteInfo &route, uint32_t node, uint32_t pos){
+	for (uint32_t k = route.hopStart[node]; k < route.hopStart[node + 1]; k++)
+		if (route.hops[k] == pos)
+			return true;
+	return false;
+}
+
+//把 node 转发表中 dstAddr 的表项从 oldHops 改为 newHops，两者相同时不改动，返回是否改动
+bool UpdateRoutingEntry(uint32_t node, Ipv4Address &dstAddr, pair<const uint32_t*, const uint32_t*> oldHops, pair<const uint32_t*, const uint32_t*> newHops){
+	if (oldHops.second - oldHops.first == newHops.second - newHops.first && std::equal(oldHops.first, oldHops.second, newHops.first))
+		return false;
+	Ptr<Node> nd = n.Get(node);
+	if (nd->GetNodeType() == 1){
+		Ptr<SwitchNode> sw = DynamicCast<SwitchNode>(nd);
+		sw->ClearTableEntry(dstAddr);
+		for (const uint32_t *k = newHops.first; k != newHops.second; k++)
+			sw->AddTableEntry(dstAddr, nbrList[node][*k].intf->idx);
+	}else{
+		Ptr<RdmaHw> rdmaHw = nd->GetObject<RdmaDriver>()->m_rdma;
+		rdmaHw->ClearTableEntry(dstAddr);
+		for (const uint32_t *k = newHops.first; k != newHops.second; k++)
+			rdmaHw->AddTableEntry(dstAddr, nbrList[node][*k].intf->idx);
+	}
+	return true;
+}
+
+//链路 a-b 断开后的增量路由修复：只重算最短路DAG经过该链路的路由 (以及端点主机改换的起点)，
+//只改写下一跳发生变化的转发表项。返回表项被改写的 (主机, 目的主机)，其去往该目的主机的QP需要重新分配
+vector<pair<uint32_t, uint32_t> > RepairRoutes(uint32_t a, uint32_t b){
+	uint32_t posB = 0, posA = 0;	// b 在 nbrList[a] 中的位置，a 在 nbrList[b] 中的位置
+	while (nbrList[a][posB].id != b)
+		posB++;
+	posA = nbrList[a][posB].rev;
+
+	// recompute the routes whose DAG used the link, keeping the old ones for comparison
+	uint32_t route_cnt = routes.size();
+	map<uint32_t, RouteInfo> oldRoutes;
+	for (uint32_t r = 0; r < route_cnt; r++){
+		if (RouteUsesHop(routes[r], a, posB) || RouteUsesHop(routes[r], b, posA)){
+			oldRoutes[r] = routes[r];
+			CalculateRoute(r);
+		}
+	}
+	// an end host of the link may lose its only up link (or be left with exactly one)
+	vector<HostRoute> oldHost = routeMetrics.host;
+	for (uint32_t h : {a, b}){
+		if (n.Get(h)->GetNodeType() == 0)
+			routeMetrics.host[h] = HostRouteOf(h);
+	}
+	routeMetrics.metric.resize(routes.size());
+	for (uint32_t r = route_cnt; r < routes.size(); r++)
+		CalculateRoute(r);
+
+	vector<pair<uint32_t, uint32_t> > changed;
+	uint32_t updated = 0;
+	for (uint32_t dst = 0; dst < routeMetrics.host.size(); dst++){
+		const HostRoute &oldHr = oldHost[dst], &newHr = routeMetrics.host[dst];
+		if (newHr.route < 0)
+			continue;
+		auto it = oldRoutes.find(oldHr.route);
+		bool moved = oldHr.route != newHr.route || oldHr.rootPos != newHr.rootPos;
+		if (it == oldRoutes.end() && !moved)
+			continue;
+		const RouteInfo &oldRoute = it != oldRoutes.end() ? it->second : routes[oldHr.route];
+		Ipv4Address dstAddr = serverAddress[dst];
+		for (uint32_t i = 0; i < nbrList.size(); i++){
+			if (!UpdateRoutingEntry(i, dstAddr, NextHops(oldRoute, oldHr, i, dst), NextHops(i, dst)))
+				continue;
+			updated++;
+			if (n.Get(i)->GetNodeType() == 0)
+				changed.push_back(make_pair(i, dst));
+		}
+	}
+	#if ENABLE_PRINT_DEBUG_LOG
+		cout<<"RepairRoutes: "<<oldRoutes.size()<<" of "<<route_cnt<<" routes recomputed, "<<updated<<" table entries updated"<<endl;
+	#endif
+	return changed;
+}
+
 // take down the link between a and b, and redo the routing 断开两点间的链路并重新计算路由
 void TakeDownLink(NodeContainer n, Ptr<Node> a, Ptr<Node> b){
 	#if ENABLE_PRINT_DEBUG_LOG
@@ -522,7 +1044,14 @@ void TakeDownLink(NodeContainer n, Ptr<Node> a, Ptr<Node> b){
 			cout<<"********************************"<<endl<<endl;
 	#endif
 	nbr2if[a][b].up = nbr2if[b][a].up = false; //关闭链路
-	nextHop.clear(); //清空路由表
+	if (incremental_route_repair){
+		DynamicCast<QbbNetDevice>(a->GetDevice(nbr2if[a][b].idx))->TakeDown();
+		DynamicCast<QbbNetDevice>(b->GetDevice(nbr2if[b][a].idx))->TakeDown();
+		// 只修复受影响的表项，并只重新分配去往这些目的主机、且网卡发生变化的QP
+		for (auto &c : RepairRoutes(a->GetId(), b->GetId()))
+			n.Get(c.first)->GetObject<RdmaDriver>()->m_rdma->RedistributeQp(serverAddress[c.second]);
+		return;
+	}
 	CalculateRoutes(n); //重新计算路由
 	// clear routing tables 
 	for (uint32_t i = 0; i < n.GetN(); i++){
@@ -814,9 +1343,54 @@ int main(int argc, char *argv[])
 			}else if (key.compare("LINK_DOWN") == 0){
 				conf >> link_down_time >> link_down_A >> link_down_B;
 				std::cout << "LINK_DOWN\t\t\t" << link_down_time << ' '<< link_down_A << ' ' << link_down_B << '\n';
+			}else if (key.compare("INCREMENTAL_ROUTE_REPAIR") == 0){
+				conf >> incremental_route_repair;
+				std::cout << "INCREMENTAL_ROUTE_REPAIR\t\t" << incremental_route_repair << '\n';
 			}else if (key.compare("ENABLE_TRACE") == 0){
 				conf >> enable_trace;
 				std::cout << "ENABLE_TRACE\t\t\t" << enable_trace << '\n';
+			}else if (key.compare("TRACE_BLOCK_RECORDS") == 0){
+				conf >> trace_block_records;
+				std::cout << "TRACE_BLOCK_RECORDS\t\t" << trace_block_records << '\n';
+			}else if (key.compare("TRACE_COMPRESS") == 0){
+				conf >> trace_compress;
+				std::cout << "TRACE_COMPRESS\t\t\t" << trace_compress << '\n';
+			}else if (key.compare("TRACE_EVENTS") == 0){
+				int n_ev;
+				conf >> n_ev;
+				trace_event_mask = 0;
+				std::cout << "TRACE_EVENTS\t\t\t";
+				for (int i = 0; i < n_ev; i++){
+					std::string ev;
+					conf >> ev;
+					uint32_t e = Recv;
+					while (e <= Drop && ev.compare(EventToStr((Event)e)) != 0)
+						e++;
+					if (e > Drop){
+						std::cout << " (unknown event " << ev << ")";
+						continue;
+					}
+					trace_event_mask |= 1u << e;
+					std::cout << ' ' << ev;
+				}
+				std::cout << '\n';
+			}else if (key.compare("TRACE_PORTS") == 0){
+				int n_port;
+				conf >> n_port;
+				std::cout << "TRACE_PORTS\t\t\t";
+				for (int i = 0; i < n_port; i++){
+					uint32_t node, port;
+					conf >> node >> port;
+					trace_ports.push_back(make_pair(node, port));
+					std::cout << ' ' << node << ' ' << port;
+				}
+				std::cout << '\n';
+			}else if (key.compare("TRACE_START") == 0){
+				conf >> trace_start;
+				std::cout << "TRACE_START\t\t\t" << trace_start << '\n';
+			}else if (key.compare("TRACE_END") == 0){
+				conf >> trace_end;
+				std::cout << "TRACE_END\t\t\t" << trace_end << '\n';
 			}else if (key.compare("KMAX_MAP") == 0){
 				int n_k ;
 				conf >> n_k;
@@ -859,6 +1433,12 @@ int main(int argc, char *argv[])
 			}else if (key.compare("QLEN_MON_FILE") == 0){
 				conf >> qlen_mon_file;
 				std::cout << "QLEN_MON_FILE\t\t\t" << qlen_mon_file << '\n';
+			}else if (key.compare("QLEN_MON_FORMAT") == 0){
+				conf >> qlen_mon_format;
+				std::cout << "QLEN_MON_FORMAT\t\t\t" << qlen_mon_format << '\n';
+			}else if (key.compare("QLEN_MON_CHANGE_ONLY") == 0){
+				conf >> qlen_mon_change_only;
+				std::cout << "QLEN_MON_CHANGE_ONLY\t\t" << qlen_mon_change_only << '\n';
 			}else if (key.compare("QLEN_MON_START") == 0){
 				conf >> qlen_mon_start;
 				std::cout << "QLEN_MON_START\t\t\t" << qlen_mon_start << '\n';
@@ -877,6 +1457,30 @@ int main(int argc, char *argv[])
                         }else if (key.compare("LINK_UTIL_MON_END") == 0){
                                 conf >> link_util_mon_end;
                                 std::cout << "LINK_UTIL_MON_END\t\t" << link_util_mon_end << '\n';
+                        }else if (key.compare("LINK_UTIL_MON_FORMAT") == 0){
+                                conf >> link_util_mon_format;
+                                std::cout << "LINK_UTIL_MON_FORMAT\t\t" << link_util_mon_format << '\n';
+			}else if (key.compare("INGRESS_MON_FILE") == 0){
+				conf >> ingress_mon_file;
+				std::cout << "INGRESS_MON_FILE\t\t" << ingress_mon_file << '\n';
+			}else if (key.compare("INGRESS_MON_INTERVAL") == 0){
+				conf >> ingress_mon_interval;
+				std::cout << "INGRESS_MON_INTERVAL\t\t" << ingress_mon_interval << '\n';
+			}else if (key.compare("INGRESS_MON_START") == 0){
+				conf >> ingress_mon_start;
+				std::cout << "INGRESS_MON_START\t\t" << ingress_mon_start << '\n';
+			}else if (key.compare("INGRESS_MON_END") == 0){
+				conf >> ingress_mon_end;
+				std::cout << "INGRESS_MON_END\t\t\t" << ingress_mon_end << '\n';
+			}else if (key.compare("INGRESS_MON_FORMAT") == 0){
+				conf >> ingress_mon_format;
+				std::cout << "INGRESS_MON_FORMAT\t\t" << ingress_mon_format << '\n';
+			}else if (key.compare("INGRESS_MON_CHANGE_ONLY") == 0){
+				conf >> ingress_mon_change_only;
+				std::cout << "INGRESS_MON_CHANGE_ONLY\t\t" << ingress_mon_change_only << '\n';
+			}else if (key.compare("INGRESS_MON_THRESHOLD") == 0){
+				conf >> ingress_mon_threshold;
+				std::cout << "INGRESS_MON_THRESHOLD\t\t" << ingress_mon_threshold << '\n';
 			}else if (key.compare("MULTI_RATE") == 0){
 				int v;
 				conf >> v;
@@ -911,6 +1515,9 @@ int main(int argc, char *argv[])
 			else if (key.compare("EPOCH_TIME") == 0){
 				conf >> epoch_time;
 				std::cout << "EPOCH_TIME\t\t\t" << epoch_time << '\n';
+			}else if (key.compare("TELEMETRY_FORMAT") == 0){
+				conf >> telemetry_format;
+				std::cout << "TELEMETRY_FORMAT\t\t" << telemetry_format << '\n';
 			}else if (key.compare("NO_CC_NODE") == 0){
 				int n_k ;
 				conf >> n_k;
@@ -1136,12 +1743,21 @@ int main(int argc, char *argv[])
 	nic_rate = get_nic_rate(n);
 
 	// config switch
+	FILE *telemetry_bin = NULL;
+	if (telemetry_format == 1){
+		telemetry_bin = fopen((dir + "/telemetry.bin").c_str(), "wb");
+		TelemetryFileHeader th;
+		th.magic = TELEMETRY_FILE_MAGIC;
+		th.version = TELEMETRY_FILE_VERSION;
+		fwrite(&th, sizeof(th), 1, telemetry_bin);
+	}
 	#if ENABLE_PRINT_DEBUG_LOG
 		LOG_RED("Configure switches.");
 	#endif
 	for (uint32_t i = 0; i < node_num; i++){
 		if (n.Get(i)->GetNodeType() == 1){ // is switch
 			Ptr<SwitchNode> sw = DynamicCast<SwitchNode>(n.Get(i));
+			sw->InitPortState();  //链路已全部安装，按端口数分配交换机与MMU的每端口状态
 			uint32_t shift = 3; // by default 1/8
 			for (uint32_t j = 1; j < sw->GetNDevices(); j++){        //遍历交换机的所有网络设备(端口)
 				Ptr<QbbNetDevice> dev = DynamicCast<QbbNetDevice>(sw->GetDevice(j));
@@ -1177,9 +1793,14 @@ int main(int argc, char *argv[])
 			sw->m_mmu->node_id = sw->GetId();
 
 			//RDMA NPA detect
-			std::string telemetry_path = "/telemetry_" + std::to_string(i) + ".txt";
-			telemetry_path = dir + telemetry_path;
-			sw->fp_telemetry = fopen(telemetry_path.c_str(), "w");
+			if (telemetry_bin){
+				sw->fp_telemetry = telemetry_bin;
+				sw->telemetryBinary = true;
+			}else{
+				std::string telemetry_path = "/telemetry_" + std::to_string(i) + ".txt";
+				telemetry_path = dir + telemetry_path;
+				sw->fp_telemetry = fopen(telemetry_path.c_str(), "w");
+			}
 			if (ack_high_prio)
 				sw->SetAttribute("AckHighPrio", UintegerValue(1));
 			else
@@ -1260,6 +1881,7 @@ int main(int argc, char *argv[])
 	//
 	// get BDP and delay
 	//
+	baseRouteMetrics = routeMetrics;
 	maxRtt = maxBdp = 0;
 	for (uint32_t i = 0; i < node_num; i++){
 		if (n.Get(i)->GetNodeType() != 0)
@@ -1267,13 +1889,8 @@ int main(int argc, char *argv[])
 		for (uint32_t j = 0; j < node_num; j++){
 			if (n.Get(j)->GetNodeType() != 0)
 				continue;
-			uint64_t delay = pairDelay[n.Get(i)][n.Get(j)]; //获取单向传播延迟
-			uint64_t txDelay = pairTxDelay[n.Get(i)][n.Get(j)]; //获取传输延迟（数据包发送时间）
-			uint64_t rtt = delay * 2 + txDelay; //计算往返延迟
-			uint64_t bw = pairBw[i][j]; //获取链路带宽
-			uint64_t bdp = rtt * bw / 1000000000/8; //计算BDP（带宽延迟积）
-			pairBdp[n.Get(i)][n.Get(j)] = bdp; //存储BDP
-			pairRtt[i][j] = rtt; //存储往返延迟
+			uint64_t rtt = PairRtt(i, j); //往返延迟 = 单向传播延迟 * 2 + 传输延迟
+			uint64_t bdp = PairBdp(i, j); //BDP（带宽延迟积）
 			if (bdp > maxBdp) //更新最大BDP
 				maxBdp = bdp;
 			if (rtt > maxRtt) //更新最大往返延迟
@@ -1312,8 +1929,14 @@ int main(int argc, char *argv[])
 	}
 
 	FILE *trace_output = fopen(trace_output_file.c_str(), "w");
+	// 块模式在构造时先写文件头，须早于下面的 SimSetting
+	TraceWriter trace_writer(trace_output, trace_block_records, trace_compress ? TRACE_CODEC_ZLIB : TRACE_CODEC_NONE);
+	trace_writer.SetEventMask(trace_event_mask);
+	trace_writer.SetTimeWindow(trace_start, trace_end);
+	for (auto &port : trace_ports)
+		trace_writer.AddPort(port.first, port.second);
 	if (enable_trace)
-		qbb.EnableTracing(trace_output, trace_nodes);
+		qbb.EnableTracing(&trace_writer, trace_nodes);
 
 	// dump link speed to trace file
 	{
@@ -1333,8 +1956,8 @@ int main(int argc, char *argv[])
 		sim_setting.Serialize(trace_output);
 	}
 
-	// 使用 ns-3 的全局路由模块，根据已经配置好的拓扑，自动生成并填充所有节点的 IPv4 路由表
-	Ipv4GlobalRoutingHelper::PopulateRoutingTables();
+	// RDMA 流量只经过 SetRoutingEntries 配置的转发表，不再调用 Ipv4GlobalRoutingHelper::PopulateRoutingTables()
+	// (其全网最短路计算在大规模拓扑上耗时数分钟，而结果从未被查询)
 
 	NS_LOG_INFO("Create Applications."); //创建应用(流、客户端等)
 
@@ -1368,17 +1991,53 @@ int main(int argc, char *argv[])
 	}
 
 	// schedule buffer monitor 调度缓冲区监控 记录缓冲区队列长度
-	FILE* qlen_output = fopen(qlen_mon_file.c_str(), "w");
+	FILE* qlen_output = fopen(qlen_mon_file.c_str(), qlen_mon_format == 1 ? "wb" : "w");
+	if (qlen_mon_format == 1){
+		MonitorFileHeader qh{QLEN_FILE_MAGIC, QLEN_FILE_VERSION, qlen_mon_interval};
+		fwrite(&qh, sizeof(qh), 1, qlen_output);
+		vector<QlenPort> ports; //与 monitor_buffer 监控的端口相同
+		for (uint32_t i = 0; i < node_num; i++){
+			if (n.Get(i)->GetNodeType() == 1)
+				for (uint32_t j = 1; j < n.Get(i)->GetNDevices(); j++)
+					ports.push_back(QlenPort{i, j});
+		}
+		uint32_t port_num = ports.size();
+		fwrite(&port_num, sizeof(port_num), 1, qlen_output);
+		fwrite(ports.data(), sizeof(QlenPort), ports.size(), qlen_output);
+	}
+	if (qlen_mon_change_only){ //各交换机 MMU 变化时标记端口，按需调度采样
+		for (uint32_t i = 0; i < node_num; i++){
+			if (n.Get(i)->GetNodeType() != 1)
+				continue;
+			Ptr<SwitchNode> sw = DynamicCast<SwitchNode>(n.Get(i));
+			sw->TraceConnectWithoutContext("MmuChange", MakeBoundCallback(&qlen_port_changed, sw));
+		}
+	}
 	LOG_BLUE("Schedule buffer monitor from "<<qlen_mon_start<<" s to "<<qlen_mon_end<<" s to file "<<qlen_mon_file);
-	Simulator::Schedule(NanoSeconds(qlen_mon_start), &monitor_buffer, qlen_output, &n);
+	Simulator::Schedule(NanoSeconds(qlen_mon_start), qlen_mon_change_only ? &monitor_buffer_start : &monitor_buffer, qlen_output, &n);
 
         // schedule link utilization monitor 调度链路利用率监控
         if (!link_util_mon_file.empty()) {
-                FILE* link_util_output = fopen(link_util_mon_file.c_str(), "w");
+                FILE* link_util_output = fopen(link_util_mon_file.c_str(), link_util_mon_format == 1 ? "wb" : "w");
                 if (link_util_output) {
-                        fprintf(link_util_output, "# Link Utilization Monitor\n");
-                        fprintf(link_util_output, "# Format: time: <timestamp_ns>\n");
-                        fprintf(link_util_output, "# node_id port_id tx_bytes_total tx_throughput_Gbps tx_util_percent\n");
+                        if (link_util_mon_format == 1) {
+                                MonitorFileHeader lh{LINK_UTIL_FILE_MAGIC, LINK_UTIL_FILE_VERSION, link_util_mon_interval};
+                                fwrite(&lh, sizeof(lh), 1, link_util_output);
+                                vector<LinkUtilPort> ports; //与 monitor_link_utilization 每次写出的端口顺序相同
+                                for (uint32_t i = 0; i < node_num; i++)
+                                        for (uint32_t j = 1; j < n.Get(i)->GetNDevices(); j++) {
+                                                Ptr<QbbNetDevice> qbbDev = DynamicCast<QbbNetDevice>(n.Get(i)->GetDevice(j));
+                                                if (qbbDev != nullptr)
+                                                        ports.push_back(LinkUtilPort{i, j, qbbDev->GetDataRate().GetBitRate()});
+                                        }
+                                uint32_t port_num = ports.size();
+                                fwrite(&port_num, sizeof(port_num), 1, link_util_output);
+                                fwrite(ports.data(), sizeof(LinkUtilPort), ports.size(), link_util_output);
+                        } else {
+                                fprintf(link_util_output, "# Link Utilization Monitor\n");
+                                fprintf(link_util_output, "# Format: time: <timestamp_ns>\n");
+                                fprintf(link_util_output, "# node_id port_id tx_bytes_total tx_throughput_Gbps tx_util_percent\n");
+                        }
                         fflush(link_util_output);
                         
                         LOG_BLUE("Schedule link utilization monitor from " << link_util_mon_start 
@@ -1388,6 +2047,33 @@ int main(int argc, char *argv[])
                 }
         }
 
+	// schedule ingress queue monitor 调度入端口队列监控 (PFC分析)
+	FILE* ingress_output = NULL;
+	if (!ingress_mon_file.empty()){
+		ingress_output = fopen(ingress_mon_file.c_str(), ingress_mon_format == 1 ? "wb" : "w");
+		if (ingress_mon_format == 1){
+			MonitorFileHeader ih{ingress_mon_change_only ? INGRESS_CHANGE_FILE_MAGIC : INGRESS_FILE_MAGIC, INGRESS_FILE_VERSION, ingress_mon_interval};
+			fwrite(&ih, sizeof(ih), 1, ingress_output);
+		}else{
+			fprintf(ingress_output, "# Ingress Queue Monitor (for PFC analysis)\n");
+			fprintf(ingress_output, "# Format: time: <timestamp_ns>\n");
+			fprintf(ingress_output, "# switch_id port_id ingress_bytes egress_bytes hdrm_bytes paused\n");
+			if (ingress_mon_change_only)
+				fprintf(ingress_output, "# Change-only: interval %u threshold %u\n", ingress_mon_interval, ingress_mon_threshold);
+		}
+		fflush(ingress_output);
+		if (ingress_mon_change_only){ //各交换机 MMU 变化时标记端口，按需调度采样
+			for (uint32_t i = 0; i < node_num; i++){
+				if (n.Get(i)->GetNodeType() != 1)
+					continue;
+				Ptr<SwitchNode> sw = DynamicCast<SwitchNode>(n.Get(i));
+				sw->TraceConnectWithoutContext("MmuChange", MakeBoundCallback(&ingress_port_changed, ingress_output, sw));
+			}
+		}
+		LOG_BLUE("Schedule ingress queue monitor from "<<ingress_mon_start<<" ns to "<<ingress_mon_end<<" ns to file "<<ingress_mon_file);
+		Simulator::Schedule(NanoSeconds(ingress_mon_start), &monitor_ingress, ingress_output, &n);
+	}
+
 	//
 	// Now, do the actual simulation.
 	//
@@ -1397,10 +2083,14 @@ int main(int argc, char *argv[])
 	NS_LOG_INFO("Run Simulation.");
 	Simulator::Stop(Seconds(simulator_stop_time));
 	Simulator::Run();
+	if (ingress_output)
+		finish_ingress_monitor(ingress_output);
 	Simulator::Destroy();
 	NS_LOG_INFO("Done.");
 	LOG_GREEN("Simulation Complete!");
-	fclose(trace_output);
+	trace_writer.Close();
+	if (telemetry_bin)
+		fclose(telemetry_bin);
 
 	endt = clock();
 	LOG_GREEN("Total simulation time: "<<(double)(endt - begint) / CLOCKS_PER_SEC<<"s.");
@@ -37,6 +37,7 @@
 #include <ns3/rdma-driver.h>
 #include <ns3/switch-node.h>
 #include <ns3/sim-setting.h>
+#include <ns3/telemetry-format.h>
 
 using namespace ns3;
 using namespace std;
@@ -90,6 +91,7 @@ set<int> agent_nodes;
 set<int> no_cc_nodes;
 uint32_t agent_threshold;
 uint32_t epoch_time = 0;
+uint32_t telemetry_format = 0; // 0: 每个交换机一个文本文件 telemetry_<id>.txt, 1: 所有交换机共用二进制 telemetry.bin
 
 /************************************************
  * Runtime varibles
@@ -777,6 +779,9 @@ int main(int argc, char *argv[])
 			else if (key.compare("EPOCH_TIME") == 0){
 				conf >> epoch_time;
 				std::cout << "EPOCH_TIME\t\t\t" << epoch_time << '\n';
+			}else if (key.compare("TELEMETRY_FORMAT") == 0){
+				conf >> telemetry_format;
+				std::cout << "TELEMETRY_FORMAT\t\t" << telemetry_format << '\n';
 			}else if (key.compare("NO_CC_NODE") == 0){
 				int n_k ;
 				conf >> n_k;
@@ -957,9 +962,18 @@ int main(int argc, char *argv[])
 	nic_rate = get_nic_rate(n);
 
 	// config switch
+	FILE *telemetry_bin = NULL;
+	if (telemetry_format == 1){
+		telemetry_bin = fopen((dir + "/telemetry.bin").c_str(), "wb");
+		TelemetryFileHeader th;
+		th.magic = TELEMETRY_FILE_MAGIC;
+		th.version = TELEMETRY_FILE_VERSION;
+		fwrite(&th, sizeof(th), 1, telemetry_bin);
+	}
 	for (uint32_t i = 0; i < node_num; i++){
 		if (n.Get(i)->GetNodeType() == 1){ // is switch
 			Ptr<SwitchNode> sw = DynamicCast<SwitchNode>(n.Get(i));
+			sw->InitPortState();  //链路已全部安装，按端口数分配交换机与MMU的每端口状态
 			uint32_t shift = 3; // by default 1/8
 			for (uint32_t j = 1; j < sw->GetNDevices(); j++){
 				Ptr<QbbNetDevice> dev = DynamicCast<QbbNetDevice>(sw->GetDevice(j));
@@ -986,9 +1000,14 @@ int main(int argc, char *argv[])
 			sw->m_mmu->node_id = sw->GetId();
 
 			//RDMA NPA detect
-			std::string telemetry_path = "/telemetry_" + std::to_string(i) + ".txt";
-			telemetry_path = dir + telemetry_path;
-			sw->fp_telemetry = fopen(telemetry_path.c_str(), "w");
+			if (telemetry_bin){
+				sw->fp_telemetry = telemetry_bin;
+				sw->telemetryBinary = true;
+			}else{
+				std::string telemetry_path = "/telemetry_" + std::to_string(i) + ".txt";
+				telemetry_path = dir + telemetry_path;
+				sw->fp_telemetry = fopen(telemetry_path.c_str(), "w");
+			}
 			if (ack_high_prio)
 				sw->SetAttribute("AckHighPrio", UintegerValue(1));
 			else
@@ -1115,8 +1134,9 @@ int main(int argc, char *argv[])
 	}
 
 	FILE *trace_output = fopen(trace_output_file.c_str(), "w");
+	TraceWriter trace_writer(trace_output);
 	if (enable_trace)
-		qbb.EnableTracing(trace_output, trace_nodes);
+		qbb.EnableTracing(&trace_writer, trace_nodes);
 
 	// dump link speed to trace file
 	{
@@ -1176,7 +1196,9 @@ int main(int argc, char *argv[])
 	Simulator::Run();
 	Simulator::Destroy();
 	NS_LOG_INFO("Done.");
-	fclose(trace_output);
+	trace_writer.Close();
+	if (telemetry_bin)
+		fclose(telemetry_bin);
 
 	endt = clock();
 	std::cout << (double)(endt - begint) / CLOCKS_PER_SEC << "\n";
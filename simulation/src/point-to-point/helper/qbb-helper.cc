@@ -314,6 +314,7 @@ void QbbHelper::GetTraceFromPacket(TraceFormat &tr, Ptr<QbbNetDevice> dev, Ptr<c
 	CustomHeader hdr((hasL2?CustomHeader::L2_Header:0) | CustomHeader::L3_Header | CustomHeader::L4_Header);
 	p->PeekHeader(hdr);
 
+	memset(&tr, 0, sizeof(tr));  // 未用到的union字节与填充置0，输出确定且便于块压缩
 	tr.event = event;
 	tr.node = dev->GetNode()->GetId();
 	tr.nodeType = dev->GetNode()->GetNodeType();
@@ -366,71 +367,75 @@ void QbbHelper::GetTraceFromPacket(TraceFormat &tr, Ptr<QbbNetDevice> dev, Ptr<c
 	tr.qlen = dev->GetQueue()->GetNBytes(qidx);
 }
 
-void QbbHelper::PacketEventCallback(FILE *file, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, uint32_t qidx, Event event, bool hasL2){
+void QbbHelper::PacketEventCallback(TraceWriter *writer, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, uint32_t qidx, Event event, bool hasL2){
+	if (!writer->Accept(event, dev->GetNode()->GetId(), dev->GetIfIndex(), Simulator::Now().GetTimeStep()))
+		return;
 	TraceFormat tr;
 	GetTraceFromPacket(tr, dev, p, qidx, event, hasL2);
-	tr.Serialize(file);
+	writer->Write(tr);
 }
 
-void QbbHelper::MacRxDetailCallback (FILE* file, Ptr<QbbNetDevice> dev, Ptr<const Packet> p){
-	PacketEventCallback(file, dev, p, 0, Recv, true);
+void QbbHelper::MacRxDetailCallback (TraceWriter *writer, Ptr<QbbNetDevice> dev, Ptr<const Packet> p){
+	PacketEventCallback(writer, dev, p, 0, Recv, true);
 }
 
-void QbbHelper::EnqueueDetailCallback(FILE* file, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, uint32_t qidx){
-	PacketEventCallback(file, dev, p, qidx, Enqu, true);
+void QbbHelper::EnqueueDetailCallback(TraceWriter *writer, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, uint32_t qidx){
+	PacketEventCallback(writer, dev, p, qidx, Enqu, true);
 }
 
-void QbbHelper::DequeueDetailCallback(FILE* file, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, uint32_t qidx){
-	PacketEventCallback(file, dev, p, qidx, Dequ, true);
+void QbbHelper::DequeueDetailCallback(TraceWriter *writer, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, uint32_t qidx){
+	PacketEventCallback(writer, dev, p, qidx, Dequ, true);
 }
 
-void QbbHelper::DropDetailCallback(FILE* file, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, uint32_t qidx){
-	PacketEventCallback(file, dev, p, qidx, Drop, true);
+void QbbHelper::DropDetailCallback(TraceWriter *writer, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, uint32_t qidx){
+	PacketEventCallback(writer, dev, p, qidx, Drop, true);
 }
 
-void QbbHelper::QpDequeueCallback(FILE *file, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, Ptr<RdmaQueuePair> qp){
+void QbbHelper::QpDequeueCallback(TraceWriter *writer, Ptr<QbbNetDevice> dev, Ptr<const Packet> p, Ptr<RdmaQueuePair> qp){
+	if (!writer->Accept(Dequ, dev->GetNode()->GetId(), dev->GetIfIndex(), Simulator::Now().GetTimeStep()))
+		return;
 	TraceFormat tr;
 	GetTraceFromPacket(tr, dev, p, qp->m_pg, Dequ, true);
-	tr.Serialize(file);
+	writer->Write(tr);
 }
 
-void QbbHelper::EnableTracingDevice(FILE *file, Ptr<QbbNetDevice> nd){
+void QbbHelper::EnableTracingDevice(TraceWriter *writer, Ptr<QbbNetDevice> nd){
 	uint32_t nodeid = nd->GetNode ()->GetId ();
 	uint32_t deviceid = nd->GetIfIndex ();
 	std::ostringstream oss;
 
 	#if 1
-	nd->TraceConnectWithoutContext("MacRx", MakeBoundCallback(&QbbHelper::MacRxDetailCallback, file, nd));
+	nd->TraceConnectWithoutContext("MacRx", MakeBoundCallback(&QbbHelper::MacRxDetailCallback, writer, nd));
 	//oss << "/NodeList/" << nd->GetNode ()->GetId () << "/DeviceList/" << deviceid << "/$ns3::QbbNetDevice/MacRx";
-	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::MacRxDetailCallback, file, nd));
+	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::MacRxDetailCallback, writer, nd));
 
-	nd->TraceConnectWithoutContext("QbbEnqueue", MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, file, nd));
-	nd->TraceConnectWithoutContext("QbbDequeue", MakeBoundCallback (&QbbHelper::DequeueDetailCallback, file, nd));
-	nd->TraceConnectWithoutContext("QbbDrop", MakeBoundCallback (&QbbHelper::DropDetailCallback, file, nd));
-	nd->TraceConnectWithoutContext("RdmaQpDequeue", MakeBoundCallback (&QbbHelper::QpDequeueCallback, file, nd));
+	nd->TraceConnectWithoutContext("QbbEnqueue", MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, writer, nd));
+	nd->TraceConnectWithoutContext("QbbDequeue", MakeBoundCallback (&QbbHelper::DequeueDetailCallback, writer, nd));
+	nd->TraceConnectWithoutContext("QbbDrop", MakeBoundCallback (&QbbHelper::DropDetailCallback, writer, nd));
+	nd->TraceConnectWithoutContext("RdmaQpDequeue", MakeBoundCallback (&QbbHelper::QpDequeueCallback, writer, nd));
 	#endif
-	//nd->GetQueue()->TraceConnectWithoutContext("BeqEnqueue", MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, file, nd));
+	//nd->GetQueue()->TraceConnectWithoutContext("BeqEnqueue", MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, writer, nd));
 	//oss.str ("");
 	//oss << "/NodeList/" << nodeid << "/DeviceList/" << deviceid << "/$ns3::QbbNetDevice/TxBeQueue/BeqEnqueue";
-	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, file, nd));
+	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, writer, nd));
 
-	//nd->GetQueue()->TraceConnectWithoutContext("BeqDequeue", MakeBoundCallback (&QbbHelper::DequeueDetailCallback, file, nd));
+	//nd->GetQueue()->TraceConnectWithoutContext("BeqDequeue", MakeBoundCallback (&QbbHelper::DequeueDetailCallback, writer, nd));
 	//oss.str ("");
 	//oss << "/NodeList/" << nodeid << "/DeviceList/" << deviceid << "/$ns3::QbbNetDevice/TxBeQueue/BeqDequeue";
-	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::DequeueDetailCallback, file, nd));
+	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::DequeueDetailCallback, writer, nd));
 
-	//nd->GetRdmaQueue()->TraceConnectWithoutContext("RdmaEnqueue", MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, file, nd));
+	//nd->GetRdmaQueue()->TraceConnectWithoutContext("RdmaEnqueue", MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, writer, nd));
 	//oss.str ("");
 	//oss << "/NodeList/" << nodeid << "/DeviceList/" << deviceid << "/$ns3::QbbNetDevice/RdmaEgressQueue/RdmaEnqueue";
-	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, file, nd));
+	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::EnqueueDetailCallback, writer, nd));
 
-	//nd->GetRdmaQueue()->TraceConnectWithoutContext("RdmaDequeue", MakeBoundCallback (&QbbHelper::DequeueDetailCallback, file, nd));
+	//nd->GetRdmaQueue()->TraceConnectWithoutContext("RdmaDequeue", MakeBoundCallback (&QbbHelper::DequeueDetailCallback, writer, nd));
 	//oss.str ("");
 	//oss << "/NodeList/" << nodeid << "/DeviceList/" << deviceid << "/$ns3::QbbNetDevice/RdmaEgressQueue/RdmaDequeue";
-	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::DequeueDetailCallback, file, nd));
+	//Config::ConnectWithoutContext (oss.str (), MakeBoundCallback (&QbbHelper::DequeueDetailCallback, writer, nd));
 }
 
-void QbbHelper::EnableTracing(FILE *file, NodeContainer node_container){
+void QbbHelper::EnableTracing(TraceWriter *writer, NodeContainer node_container){
   NetDeviceContainer devs;
   for (NodeContainer::Iterator i = node_container.Begin (); i != node_container.End (); ++i)
     {
@@ -438,7 +443,7 @@ void QbbHelper::EnableTracing(FILE *file, NodeContainer node_container){
       for (uint32_t j = 0; j < node->GetNDevices (); ++j)
         {
 			if (node->GetDevice(j)->IsQbb())
-				EnableTracingDevice(file, DynamicCast<QbbNetDevice>(node->GetDevice(j)));
+				EnableTracingDevice(writer, DynamicCast<QbbNetDevice>(node->GetDevice(j)));
         }
     }
 }
@@ -28,6 +28,7 @@
 #include "ns3/deprecated.h"
 #include "ns3/trace-helper.h"
 #include "ns3/trace-format.h"
+#include "ns3/trace-writer.h"
 #include "ns3/qbb-net-device.h"
 
 namespace ns3 {
@@ -148,16 +149,16 @@ public:
   NetDeviceContainer Install (std::string aNode, std::string bNode);
 
   static void GetTraceFromPacket(TraceFormat &tr, Ptr<QbbNetDevice>, Ptr<const Packet> p, uint32_t qidx, Event event, bool hasL2);
-  static void PacketEventCallback(FILE *file, Ptr<QbbNetDevice>, Ptr<const Packet>, uint32_t qidx, Event event, bool hasL2);
-  static void MacRxDetailCallback (FILE* file, Ptr<QbbNetDevice>, Ptr<const Packet> p);
-  static void EnqueueDetailCallback(FILE* file, Ptr<QbbNetDevice>, Ptr<const Packet> p, uint32_t qidx);
-  static void DequeueDetailCallback(FILE* file, Ptr<QbbNetDevice>, Ptr<const Packet> p, uint32_t qidx);
-  static void DropDetailCallback(FILE* file, Ptr<QbbNetDevice>, Ptr<const Packet> p, uint32_t qidx);
-  static void QpDequeueCallback(FILE *file, Ptr<QbbNetDevice>, Ptr<const Packet>, Ptr<RdmaQueuePair>);
+  static void PacketEventCallback(TraceWriter *writer, Ptr<QbbNetDevice>, Ptr<const Packet>, uint32_t qidx, Event event, bool hasL2);
+  static void MacRxDetailCallback (TraceWriter *writer, Ptr<QbbNetDevice>, Ptr<const Packet> p);
+  static void EnqueueDetailCallback(TraceWriter *writer, Ptr<QbbNetDevice>, Ptr<const Packet> p, uint32_t qidx);
+  static void DequeueDetailCallback(TraceWriter *writer, Ptr<QbbNetDevice>, Ptr<const Packet> p, uint32_t qidx);
+  static void DropDetailCallback(TraceWriter *writer, Ptr<QbbNetDevice>, Ptr<const Packet> p, uint32_t qidx);
+  static void QpDequeueCallback(TraceWriter *writer, Ptr<QbbNetDevice>, Ptr<const Packet>, Ptr<RdmaQueuePair>);
 
-  void EnableTracingDevice(FILE *file, Ptr<QbbNetDevice>);
+  void EnableTracingDevice(TraceWriter *writer, Ptr<QbbNetDevice>);
 
-  void EnableTracing(FILE *file, NodeContainer node_container);
+  void EnableTracing(TraceWriter *writer, NodeContainer node_container);
 
 private:
   /**
@@ -0,0 +1,90 @@
+#ifndef MONITOR_FORMAT_H
+#define MONITOR_FORMAT_H
+#include <stdint.h>
+
+namespace ns3{
+
+/*
+ * scratch/third 各监控器的二进制输出布局，由 analyze/scripts/monitor_format.py 读取
+ *   文件头   MonitorFileHeader (magic 区分监控器类型)
+ *   若干条   定长记录，按写出顺序 (时间升序) 排列
+ */
+struct MonitorFileHeader{
+	uint32_t magic;
+	uint32_t version;
+	uint64_t interval;	// 采样周期 (ns)
+};
+
+/*
+ * 出端口队列长度分布 (QLEN_MON_FORMAT 1)，文件头之后为：
+ *   uint32 端口数 n，随后 n 个 QlenPort (被监控的全部交换机端口)
+ *   每次输出一个 QlenDumpHeader，随后 count 条 QlenDeltaRecord
+ * 每次输出只写本区间 (上一次输出, time] 内新增的采样，且只写队列非空 (kb > 0) 的桶；
+ * 端口在区间内落在 0 号桶的次数为 samples 减去该端口各条记录的 count 之和。累计分布为各区间之和。
+ */
+static const uint32_t QLEN_FILE_MAGIC = 0x4c514b48;	// "HKQL"
+static const uint32_t QLEN_FILE_VERSION = 1;
+
+struct QlenPort{
+	uint32_t node;
+	uint32_t port;
+};
+
+struct QlenDumpHeader{
+	uint64_t time;		// 输出时刻 (ns)
+	uint32_t samples;	// 区间内每个端口的采样次数
+	uint32_t count;		// 随后的 QlenDeltaRecord 条数
+};
+
+struct QlenDeltaRecord{
+	uint32_t node;
+	uint32_t port;
+	uint32_t kb;		// 队列长度 / 1000，不为 0
+	uint32_t count;		// 区间内落在该桶的采样次数
+};
+
+static_assert(sizeof(QlenDumpHeader) == 16 && sizeof(QlenDeltaRecord) == 16, "qlen layout is read by monitor_format.py");
+
+/*
+ * 链路利用率 (LINK_UTIL_MON_FORMAT 1)，文件头之后为：
+ *   uint32 端口数 n，随后 n 个 LinkUtilPort (全部主机与交换机端口)
+ *   每次采样一行：uint64 采样时刻 (ns)，随后 n 个 uint64 累计发送字节数，顺序与端口表相同
+ * 每行等长，可整体读成 (采样次数, n) 的矩阵；吞吐与利用率由相邻两行的差值与 bw 计算。
+ */
+static const uint32_t LINK_UTIL_FILE_MAGIC = 0x554c4b48;	// "HKLU"
+static const uint32_t LINK_UTIL_FILE_VERSION = 1;
+
+struct LinkUtilPort{
+	uint32_t node;
+	uint32_t port;
+	uint64_t bw;		// 链路带宽 (bps)
+};
+
+/*
+ * 入端口 MMU 状态 (INGRESS_MON_FORMAT 1)，文件头之后为定长的 IngressRecord，
+ * 与文本格式相同，每次采样只写 ingress/egress/hdrm/paused 不全为 0 的交换机端口。
+ * INGRESS_MON_CHANGE_ONLY 1 时使用 INGRESS_CHANGE_FILE_MAGIC：开始时写出全部非空闲端口，
+ * 之后只在端口状态变化 (含变为全 0) 后的下一个采样点写出该端口，读取端按 interval 向前填充。
+ * 仿真结束时再写一条 node 为 INGRESS_END_NODE 的结束记录，time 为监控的最后一个采样点，
+ * 读取端向前填充到该时刻 (文本格式为 "# End: <t>" 行)。
+ */
+static const uint32_t INGRESS_FILE_MAGIC = 0x51494b48;	// "HKIQ"
+static const uint32_t INGRESS_CHANGE_FILE_MAGIC = 0x43494b48;	// "HKIC"
+static const uint32_t INGRESS_END_NODE = 0xffffffff;
+static const uint32_t INGRESS_FILE_VERSION = 1;
+
+struct IngressRecord{
+	uint64_t time;		// 采样时刻 (ns)
+	uint32_t node;
+	uint32_t port;
+	uint32_t ingress;	// 各队列 ingress_bytes 之和
+	uint32_t egress;	// 各队列 egress_bytes 之和
+	uint32_t hdrm;		// 各队列 hdrm_bytes 之和
+	uint32_t paused;	// 任一队列已向上游发出 PAUSE 时为 1
+};
+
+static_assert(sizeof(LinkUtilPort) == 16 && sizeof(IngressRecord) == 32, "monitor layouts are read by monitor_format.py");
+
+} // namespace ns3
+
+#endif /* MONITOR_FORMAT_H */
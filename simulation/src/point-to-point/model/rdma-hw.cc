@@ -571,6 +571,10 @@ void RdmaHw::ClearTable(){
 	m_rtTable.clear();
 }
 
+void RdmaHw::ClearTableEntry(Ipv4Address &dstAddr){
+	m_rtTable.erase(dstAddr.Get());
+}
+
 void RdmaHw::RedistributeQp(){
 	// clear old qpGrp
 	for (uint32_t i = 0; i < m_nic.size(); i++){
@@ -589,6 +593,34 @@ void RdmaHw::RedistributeQp(){
 	}
 }
 
+void RdmaHw::RedistributeQp(Ipv4Address &dstAddr){
+	uint32_t dip = dstAddr.Get();
+	// take the qps to dip whose NIC changed out of their old qpGrp, keeping the order of the others
+	// finished qps are no longer in m_qpMap and may have no route left; leave them for GetNextQindex to drop
+	std::vector<Ptr<RdmaQueuePair> > moved;
+	for (uint32_t i = 0; i < m_nic.size(); i++){
+		if (m_nic[i].dev == NULL)
+			continue;
+		auto &qps = m_nic[i].qpGrp->m_qps;
+		uint32_t nxt = 0;
+		for (uint32_t j = 0; j < qps.size(); j++){
+			if (qps[j]->dip.Get() == dip && !qps[j]->IsFinished() && GetNicIdxOfQp(qps[j]) != i)
+				moved.push_back(qps[j]);
+			else
+				qps[nxt++] = qps[j];
+		}
+		qps.resize(nxt);
+	}
+
+	// redistribute them
+	for (auto &qp : moved){
+		uint32_t nic_idx = GetNicIdxOfQp(qp);
+		m_nic[nic_idx].qpGrp->AddQp(qp);
+		// Notify Nic
+		m_nic[nic_idx].dev->ReassignedQp(qp);
+	}
+}
+
 
 // RDMA NPA 发送polling包用于网络性能分析
 void ScheduleAckClock(uint64_t seq, Ptr<RdmaQueuePair> qp, Ptr<QbbNetDevice> dev){
@@ -76,7 +76,9 @@ public:
 	// call this function after the NIC is setup
 	void AddTableEntry(Ipv4Address &dstAddr, uint32_t intf_idx);
 	void ClearTable();
+	void ClearTableEntry(Ipv4Address &dstAddr);
 	void RedistributeQp();
+	void RedistributeQp(Ipv4Address &dstAddr); // only move the qps to dstAddr whose NIC changed
 
 	Ptr<Packet> GetNxtPacket(Ptr<RdmaQueuePair> qp); // get next packet to send, inc snd_nxt
 	void PktSent(Ptr<RdmaQueuePair> qp, Ptr<Packet> pkt, Time interframeGap);
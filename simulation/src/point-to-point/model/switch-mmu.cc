@@ -28,20 +28,14 @@ namespace ns3 {
 
 		// headroom
 		shared_used_bytes = 0;
-		memset(hdrm_bytes, 0, sizeof(hdrm_bytes));
-		memset(ingress_bytes, 0, sizeof(ingress_bytes));
-		memset(paused, 0, sizeof(paused));
-		memset(egress_bytes, 0, sizeof(egress_bytes));
-
-		memset(ingress_queue_length, 0, sizeof(ingress_queue_length));
-		memset(egress_queue_length, 0, sizeof(egress_queue_length));
+		total_hdrm = total_rsrv = 0;
 	}
 	bool SwitchMmu::CheckIngressAdmission(uint32_t port, uint32_t qIndex, uint32_t psize){
 		//std::cout << "CheckIngressAdmission: port:" << port << " queue:" << qIndex << " size:" << psize << std::endl;
 		//如果头空间不足或者共享使用的字节数超过PFC阈值，则拒绝接收数据包
 		if (psize + hdrm_bytes[port][qIndex] > headroom[port] && psize + GetSharedUsed(port, qIndex) > GetPfcThreshold(port)){
 			printf("%lu %u Drop: queue:%u,%u: Headroom full\n", Simulator::Now().GetTimeStep(), node_id, port, qIndex);
-			for (uint32_t i = 1; i < 64; i++)
+			for (uint32_t i = 1; i < 64 && i < hdrm_bytes.size(); i++)
 				printf("(%u,%u)", hdrm_bytes[i][3], ingress_bytes[i][3]); //打印头空间和入队列使用的字节数
 			printf("\n");
 			return false;
@@ -135,6 +129,20 @@ namespace ns3 {
 	void SwitchMmu::ConfigHdrm(uint32_t port, uint32_t size){
 		headroom[port] = size; //头空间大小
 	}
+	void SwitchMmu::ConfigPortNum(uint32_t n_dev){
+		QueueCounter zero = {};
+		pfc_a_shift.assign(n_dev, 0);
+		headroom.assign(n_dev, 0);
+		kmin.assign(n_dev, 0);
+		kmax.assign(n_dev, 0);
+		pmax.assign(n_dev, 0);
+		hdrm_bytes.assign(n_dev, zero);
+		ingress_bytes.assign(n_dev, zero);
+		paused.assign(n_dev, zero);
+		egress_bytes.assign(n_dev, zero);
+		ingress_queue_length.assign(n_dev, zero);
+		egress_queue_length.assign(n_dev, zero);
+	}
 	void SwitchMmu::ConfigNPort(uint32_t n_port){
 		total_hdrm = 0; //总头空间
 		total_rsrv = 0; //总保留空间
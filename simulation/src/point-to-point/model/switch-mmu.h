@@ -2,6 +2,8 @@
 #define SWITCH_MMU_H
 
 #include <unordered_map>
+#include <vector>
+#include <array>
 #include <ns3/node.h>
 
 namespace ns3 {
@@ -10,8 +12,8 @@ class Packet;
 
 class SwitchMmu: public Object{
 public:
-	static const uint32_t pCnt = 257;	// Number of ports used
 	static const uint32_t qCnt = 8;	// Number of queues/priorities used
+	typedef std::array<uint32_t, qCnt> QueueCounter;  //每端口各队列的计数
 
 	static TypeId GetTypeId (void);
 
@@ -38,31 +40,32 @@ public:
 
 	void ConfigEcn(uint32_t port, uint32_t _kmin, uint32_t _kmax, double _pmax);  //配置ECN
 	void ConfigHdrm(uint32_t port, uint32_t size);  //配置头空间(headroom)
+	void ConfigPortNum(uint32_t n_dev);  //按设备数 (含0号回环设备) 分配每端口状态，须在其他 Config* 之前调用
 	void ConfigNPort(uint32_t n_port);  //配置N端口
 	void ConfigBufferSize(uint32_t size);  //配置缓冲区大小
 
 	// config
 	uint32_t node_id;
 	uint32_t buffer_size;
-	uint32_t pfc_a_shift[pCnt];  //PFC抖动抑制比例
+	std::vector<uint32_t> pfc_a_shift;  //PFC抖动抑制比例
 	uint32_t reserve;
-	uint32_t headroom[pCnt];  //头空间
+	std::vector<uint32_t> headroom;  //头空间
 	uint32_t resume_offset;  //恢复偏移量
-	uint32_t kmin[pCnt], kmax[pCnt];  //ECN门限
-	double pmax[pCnt];  //ECN概率
+	std::vector<uint32_t> kmin, kmax;  //ECN门限
+	std::vector<double> pmax;  //ECN概率
 	uint32_t total_hdrm;  //总头空间
 	uint32_t total_rsrv;  //总保留空间
 
 	// runtime
 	uint32_t shared_used_bytes;  //共享使用的字节数
-	uint32_t hdrm_bytes[pCnt][qCnt];  //头空间使用的字节数
-	uint32_t ingress_bytes[pCnt][qCnt];  //入队列使用的字节数
-	uint32_t paused[pCnt][qCnt];  //暂停队列使用的字节数
-	uint32_t egress_bytes[pCnt][qCnt];  //出队列使用的字节数
+	std::vector<QueueCounter> hdrm_bytes;  //头空间使用的字节数
+	std::vector<QueueCounter> ingress_bytes;  //入队列使用的字节数
+	std::vector<QueueCounter> paused;  //暂停队列使用的字节数
+	std::vector<QueueCounter> egress_bytes;  //出队列使用的字节数
 
 	//RDMA NPA
-	uint32_t ingress_queue_length[pCnt][qCnt];  //入队列长度
-	uint32_t egress_queue_length[pCnt][qCnt];  //出队列长度
+	std::vector<QueueCounter> ingress_queue_length;  //入队列长度
+	std::vector<QueueCounter> egress_queue_length;  //出队列长度
 };
 
 } /* namespace ns3 */
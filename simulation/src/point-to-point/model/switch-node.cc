@@ -6,12 +6,15 @@
 #include "ns3/boolean.h"
 #include "ns3/uinteger.h"
 #include "ns3/double.h"
+#include "ns3/trace-source-accessor.h"
 #include "switch-node.h"
 #include "qbb-net-device.h"
 #include "ppp-header.h"
 #include "ns3/int-header.h"
 #include "ns3/log.h"
+#include "telemetry-format.h"
 #include <cmath>
+#include <cstring>
 
 #define ENABLE_PRINT_PACKET_LOG 0
 
@@ -43,6 +46,8 @@ TypeId SwitchNode::GetTypeId (void)
 			UintegerValue(9000),
 			MakeUintegerAccessor(&SwitchNode::m_maxRtt),
 			MakeUintegerChecker<uint32_t>())
+	.AddTraceSource("MmuChange", "The MMU state of a port may have changed (port index).",
+			MakeTraceSourceAccessor(&SwitchNode::m_traceMmuChange))
   ;
   return tid;
 }
@@ -51,40 +56,29 @@ SwitchNode::SwitchNode(){
 	m_ecmpSeed = m_id;
 	m_node_type = 1;
 	m_mmu = CreateObject<SwitchMmu>();
-	for (uint32_t i = 0; i < pCnt; i++)
-		for (uint32_t j = 0; j < pCnt; j++)
-			for (uint32_t k = 0; k < qCnt; k++)
-				m_bytes[i][j][k] = 0;  // 初始化三维字节统计数组 m_bytes[入端口][出端口][队列]
-	for (uint32_t i = 0; i < pCnt; i++)
-		m_txBytes[i] = 0;  // 初始化发送字节数计数器
-	for (uint32_t i = 0; i < pCnt; i++)
-		m_lastPktSize[i] = m_lastPktTs[i] = 0;  // 初始化最后一个包的大小和时间戳
-	for (uint32_t i = 0; i < pCnt; i++)
-		m_u[i] = 0;  // 初始化端口利用率
-	
+	m_slotIdx = 0;
+}
+
+//构造时设备尚未安装，每端口状态按实际设备数分配，避免为每台交换机预留 257 个端口的数组
+void SwitchNode::InitPortState(void){
+	uint32_t n = GetNDevices();
+	m_bytes.assign(n, std::vector<std::array<uint32_t, qCnt> >(n, std::array<uint32_t, qCnt>()));  // 初始化三维字节统计数组 m_bytes[入端口][出端口][队列]
+	m_txBytes.assign(n, 0);  // 初始化发送字节数计数器
+	m_lastPktSize.assign(n, 0);  // 初始化最后一个包的大小和时间戳
+	m_lastPktTs.assign(n, 0);
+	m_u.assign(n, 0);  // 初始化端口利用率
+
 	//RDMA NPA init
-	for (uint32_t i = 0; i < pCnt; i++)
-		for (uint32_t j = 0; j < epochNum; j++)
-			for (uint32_t k = 0; k < flowEntryNum; k++)
-				m_flowTelemetryData[i][j][k].flowTuple = FiveTuple{0,0,0,0,0};  // 初始化流遥测数据条目
+	m_flowTelemetryData.assign(n, std::array<FlowTable, epochNum>());  // 流表初始为空，条目在首个包到达时创建
+	m_flowOccupied.assign(n, std::array<FlowBitmap, epochNum>());
 	for (uint32_t j = 0; j < epochNum; j++)
-		for (uint32_t k = 0; k < pCnt; k++){
-				m_portTelemetryData[j][k].enqQdepth = 0;
-				m_portTelemetryData[j][k].pfcPausedPacketNum = 0;
-				m_portTelemetryData[j][k].lastTimeStep = 0;
-				m_portTelemetryData[j][k].packetNum = 0;
-			}
-	for (uint32_t i = 0; i < pCnt; i++)
-		for (uint32_t j = 0; j < pCnt; j++){
-			m_portToPortBytes[i][j] = 0;
-			for(uint32_t k = 0; k < portToPortSlot; k++)
-				m_portToPortBytesSlot[i][j][k] = 0;
-		}
-	for (uint32_t i = 0; i < pCnt; i++)
-		m_lastPollingEpoch[i] = 0;
-	m_slotIdx = 0;
-	for (uint32_t i = 0; i < pCnt; i++)
-		m_lastEventID[i] = 0;
+		m_portTelemetryData[j].assign(n, PortTelemetryData());
+	m_portToPortBytes.assign(n, std::vector<uint32_t>(n, 0));
+	m_portToPortBytesSlot.assign(n, std::vector<std::array<uint32_t, portToPortSlot> >(n, std::array<uint32_t, portToPortSlot>()));
+	m_lastPollingEpoch.assign(n, 0);
+	m_lastEventID.assign(n, 0);
+
+	m_mmu->ConfigPortNum(n);
 }
 
 //根据数据包和自定义头部确定输出端口（设备），使用 ECMP（等价多路径）进行负载均衡。
@@ -142,7 +136,76 @@ void SwitchNode::CheckAndSendResume(uint32_t inDev, uint32_t qIndex){
 	}
 }
 
+void SwitchNode::BeginTelemetry(uint32_t inport, bool isSignal){
+	if (telemetryBinary){
+		TelemetryRecord r;
+		memset(&r, 0, sizeof(r));
+		r.time = Simulator::Now().GetTimeStep();
+		r.switchId = GetId();
+		r.kind = TELEMETRY_POLL;
+		r.trigger = isSignal ? TELEMETRY_SIGNAL : TELEMETRY_POLLING;
+		r.inport = inport;
+		fwrite(&r, sizeof(r), 1, fp_telemetry);
+		return;
+	}
+	fprintf(fp_telemetry,"time %lld\n", Simulator::Now().GetTimeStep());
+	fprintf(fp_telemetry, isSignal ? "\nsignal\n\n" : "\npolling\n\n");
+}
+
+void SwitchNode::EndTelemetry(){
+	if (!telemetryBinary)
+		fprintf(fp_telemetry,"end\n\n");
+}
+
+//与文本格式输出相同的内容：epoch now 与 epoch last 各一条端口记录及其中仍活跃的流记录
+void SwitchNode::OutputTelemetryBinary(uint32_t port, uint32_t inport, bool isSignal){
+	uint64_t now = Simulator::Now().GetTimeStep();
+	TelemetryRecord r;
+	memset(&r, 0, sizeof(r));
+	r.time = now;
+	r.switchId = GetId();
+	r.trigger = isSignal ? TELEMETRY_SIGNAL : TELEMETRY_POLLING;
+	r.port = port;
+	r.inport = inport;
+	for (uint32_t e = 0; e < 2; e++){
+		uint32_t epoch = (GetEpochIdx() + epochNum - e) % epochNum;
+		uint64_t window = epochTime * (epochNum - 1 + e);
+		r.epoch = e;
+
+		PortTelemetryData &pt = m_portTelemetryData[epoch][port];
+		r.kind = TELEMETRY_PORT;
+		r.packetNum = pt.packetNum;
+		r.enqQdepth = pt.enqQdepth;
+		r.pfcPausedPacketNum = pt.pfcPausedPacketNum;
+		r.portToPortBytes = (isSignal && e == 0) ? m_portToPortBytes[inport][port] : 0;
+		fwrite(&r, sizeof(r), 1, fp_telemetry);
+
+		r.kind = TELEMETRY_FLOW;
+		r.portToPortBytes = 0;
+		for (uint32_t i : ActiveFlowSlots(port, epoch, window)){
+			FlowTelemetryData &ft = m_flowTelemetryData[port][epoch].at(i);
+			r.flowIdx = i;
+			r.srcIp = ft.flowTuple.srcIp;
+			r.dstIp = ft.flowTuple.dstIp;
+			r.srcPort = ft.flowTuple.srcPort;
+			r.dstPort = ft.flowTuple.dstPort;
+			r.protocol = ft.flowTuple.protocol;
+			r.minSeq = ft.minSeq;
+			r.maxSeq = ft.maxSeq;
+			r.packetNum = ft.packetNum;
+			r.enqQdepth = ft.enqQdepth;
+			r.pfcPausedPacketNum = ft.pfcPausedPacketNum;
+			fwrite(&r, sizeof(r), 1, fp_telemetry);
+		}
+		r.flowIdx = r.srcIp = r.dstIp = r.srcPort = r.dstPort = r.protocol = r.minSeq = r.maxSeq = 0;
+	}
+}
+
 void SwitchNode::OutputTelemetry(uint32_t port, uint32_t inport, bool isSignal){
+	if (telemetryBinary){
+		OutputTelemetryBinary(port, inport, isSignal);
+		return;
+	}
 	int epoch = GetEpochIdx();
 	fprintf(fp_telemetry,"epoch now\n\n");
 	if(isSignal){
@@ -158,20 +221,19 @@ void SwitchNode::OutputTelemetry(uint32_t port, uint32_t inport, bool isSignal){
 
 	fprintf(fp_telemetry,"flow telemetry data for port %d\n", port);
 	fprintf(fp_telemetry, "flowIdx srcIp dstIp srcPort dstPort protocol minSeq maxSeq packetNum enqQdepth pfcPausedPacketNum\n");
-	for(int i = 0; i < flowEntryNum; i++){
-		if(m_flowTelemetryData[port][epoch][i].flowTuple.srcIp != 0 && Simulator::Now().GetTimeStep() - m_flowTelemetryData[port][epoch][i].lastTimeStep <= epochTime * (epochNum - 1)){
-			fprintf(fp_telemetry, "%d ", i);
-			fprintf(fp_telemetry, "%08x ", m_flowTelemetryData[port][epoch][i].flowTuple.srcIp);
-			fprintf(fp_telemetry, "%08x ", m_flowTelemetryData[port][epoch][i].flowTuple.dstIp);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].flowTuple.srcPort);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].flowTuple.dstPort);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].flowTuple.protocol);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].minSeq);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].maxSeq);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].packetNum);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].enqQdepth);
-			fprintf(fp_telemetry, "%d\n", m_flowTelemetryData[port][epoch][i].pfcPausedPacketNum);
-		}
+	for(uint32_t i : ActiveFlowSlots(port, epoch, epochTime * (epochNum - 1))){
+		FlowTelemetryData &ft = m_flowTelemetryData[port][epoch].at(i);
+		fprintf(fp_telemetry, "%d ", i);
+		fprintf(fp_telemetry, "%08x ", ft.flowTuple.srcIp);
+		fprintf(fp_telemetry, "%08x ", ft.flowTuple.dstIp);
+		fprintf(fp_telemetry, "%d ", ft.flowTuple.srcPort);
+		fprintf(fp_telemetry, "%d ", ft.flowTuple.dstPort);
+		fprintf(fp_telemetry, "%d ", ft.flowTuple.protocol);
+		fprintf(fp_telemetry, "%d ", ft.minSeq);
+		fprintf(fp_telemetry, "%d ", ft.maxSeq);
+		fprintf(fp_telemetry, "%d ", ft.packetNum);
+		fprintf(fp_telemetry, "%d ", ft.enqQdepth);
+		fprintf(fp_telemetry, "%d\n", ft.pfcPausedPacketNum);
 	}
 
 	epoch = (epoch + epochNum - 1) % epochNum;
@@ -185,20 +247,19 @@ void SwitchNode::OutputTelemetry(uint32_t port, uint32_t inport, bool isSignal){
 
 	fprintf(fp_telemetry,"flow telemetry data for port %d\n", port);
 	fprintf(fp_telemetry, "flowIdx srcIp dstIp srcPort dstPort protocol minSeq maxSeq packetNum enqQdepth pfcPausedPacketNum\n");
-	for(int i = 0; i < flowEntryNum; i++){
-		if(m_flowTelemetryData[port][epoch][i].flowTuple.srcIp != 0 && Simulator::Now().GetTimeStep() - m_flowTelemetryData[port][epoch][i].lastTimeStep <= epochTime * epochNum){
-			fprintf(fp_telemetry, "%d ", i);
-			fprintf(fp_telemetry, "%08x ", m_flowTelemetryData[port][epoch][i].flowTuple.srcIp);
-			fprintf(fp_telemetry, "%08x ", m_flowTelemetryData[port][epoch][i].flowTuple.dstIp);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].flowTuple.srcPort);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].flowTuple.dstPort);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].flowTuple.protocol);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].minSeq);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].maxSeq);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].packetNum);
-			fprintf(fp_telemetry, "%d ", m_flowTelemetryData[port][epoch][i].enqQdepth);
-			fprintf(fp_telemetry, "%d\n", m_flowTelemetryData[port][epoch][i].pfcPausedPacketNum);
-		}
+	for(uint32_t i : ActiveFlowSlots(port, epoch, epochTime * epochNum)){
+		FlowTelemetryData &ft = m_flowTelemetryData[port][epoch].at(i);
+		fprintf(fp_telemetry, "%d ", i);
+		fprintf(fp_telemetry, "%08x ", ft.flowTuple.srcIp);
+		fprintf(fp_telemetry, "%08x ", ft.flowTuple.dstIp);
+		fprintf(fp_telemetry, "%d ", ft.flowTuple.srcPort);
+		fprintf(fp_telemetry, "%d ", ft.flowTuple.dstPort);
+		fprintf(fp_telemetry, "%d ", ft.flowTuple.protocol);
+		fprintf(fp_telemetry, "%d ", ft.minSeq);
+		fprintf(fp_telemetry, "%d ", ft.maxSeq);
+		fprintf(fp_telemetry, "%d ", ft.packetNum);
+		fprintf(fp_telemetry, "%d ", ft.enqQdepth);
+		fprintf(fp_telemetry, "%d\n", ft.pfcPausedPacketNum);
 	}
 	fprintf(fp_telemetry,"\n");
 	fflush(fp_telemetry);
@@ -212,9 +273,8 @@ void SwitchNode::SendToDev(Ptr<Packet>p, CustomHeader &ch){
 		uint32_t inDev = t.GetFlowId();  //获取入端口（index of dev）
 		int event_id = ch.signal.eventID;  //获取事件ID
 
-		fprintf(fp_telemetry,"time %lld\n", Simulator::Now().GetTimeStep());
-		fprintf(fp_telemetry,"\nsignal\n\n");
-		for (uint32_t idx = 0; idx < pCnt; idx++){  //遍历所有端口
+		BeginTelemetry(inDev, true);
+		for (uint32_t idx = 0; idx < GetNDevices(); idx++){  //遍历所有端口
 			if(m_portToPortBytes[inDev][idx] > 0){  //如果端口到端口字节流量计数器大于0，则输出遥测数据
 				OutputTelemetry(idx, inDev, true);  //输出遥测数据
 				//仅在检测到 PFC 暂停时才继续传播
@@ -229,7 +289,7 @@ void SwitchNode::SendToDev(Ptr<Packet>p, CustomHeader &ch){
 				}
 			}
 		}
-		fprintf(fp_telemetry,"end\n\n");
+		EndTelemetry();
 		return;	
 	}
 	//RDMA NPA : polling packet parse 
@@ -245,10 +305,9 @@ void SwitchNode::SendToDev(Ptr<Packet>p, CustomHeader &ch){
 				DynamicCast<QbbNetDevice>(m_devices[idx])-> SendSignal(event_id); // 发送信号给下游设备
 			}
 		}
-		fprintf(fp_telemetry,"time %lld\n", Simulator::Now().GetTimeStep());
-		fprintf(fp_telemetry,"\npolling\n\n");
+		BeginTelemetry(inDev, false);
 		OutputTelemetry(idx, inDev, false); //不输出端口间流量统计，只输出端口和流的遥测数据
-		fprintf(fp_telemetry,"end\n\n");
+		EndTelemetry();
 	}
 
 	int idx = GetOutDev(p, ch);
@@ -311,6 +370,8 @@ void SwitchNode::SendToDev(Ptr<Packet>p, CustomHeader &ch){
 				return; // Drop
 			}
 			CheckAndSendPfc(inDev, qIndex);  //检查并发送暂停信号，用于暂停队列
+			m_traceMmuChange(inDev);
+			m_traceMmuChange(idx);
 		}
 
 		// RDMA NPA
@@ -319,8 +380,8 @@ void SwitchNode::SendToDev(Ptr<Packet>p, CustomHeader &ch){
 			//如果计算出的槽索引与当前 m_slotIdx 不同，说明时间槽已切换->需要更新端口到端口字节流量计数器
 			if((Simulator::Now().GetTimeStep() / (epochTime / portToPortSlot)) % portToPortSlot != m_slotIdx){
 				m_slotIdx = (Simulator::Now().GetTimeStep() / (epochTime / portToPortSlot)) % portToPortSlot;  //更新时间槽索引
-				for(uint32_t inDev = 0; inDev < pCnt; inDev++){
-					for(uint32_t outDev = 0; outDev < pCnt; outDev++){
+				for(uint32_t inDev = 0; inDev < m_portToPortBytes.size(); inDev++){
+					for(uint32_t outDev = 0; outDev < m_portToPortBytes.size(); outDev++){
 						m_portToPortBytes[inDev][outDev] -= m_portToPortBytesSlot[inDev][outDev][m_slotIdx];  //从总字节数中减去即将被覆盖的旧槽数据
 						m_portToPortBytesSlot[inDev][outDev][m_slotIdx] = 0; //将旧槽清零，准备写入新数据
 					}
@@ -367,6 +428,7 @@ void SwitchNode::SendToDev(Ptr<Packet>p, CustomHeader &ch){
 				}
 				entry.lastTimeStep = Simulator::Now().GetTimeStep();
 			}
+			m_flowOccupied[idx][epochIdx][flowIdx / 64] |= 1ULL << (flowIdx % 64);  //标记条目占用，供 OutputTelemetry 按下标顺序只遍历活跃条目
 
 			auto &portEntry = m_portTelemetryData[epochIdx][idx];  //当前周期和输出端口的端口遥测条目引用
 			bool newPortEntry = Simulator::Now().GetTimeStep() - portEntry.lastTimeStep > epochTime * (epochNum - 1);
@@ -430,7 +492,36 @@ uint32_t SwitchNode::EcmpHash(const uint8_t* key, size_t len, uint32_t seed) {
 }
 
 uint32_t SwitchNode::FiveTupleHash(const FiveTuple &fiveTuple){
-	return EcmpHash((const uint8_t*)&fiveTuple, sizeof(fiveTuple), flowHashSeed) % flowEntryNum;
+	// 逐字段拷贝到紧凑缓冲：FiveTuple 末尾的填充字节未初始化，直接哈希整个结构体会使同一条流落到不同条目
+	uint8_t key[4+4+2+2+1];
+	memcpy(key, &fiveTuple.srcIp, 4);
+	memcpy(key + 4, &fiveTuple.dstIp, 4);
+	memcpy(key + 8, &fiveTuple.srcPort, 2);
+	memcpy(key + 10, &fiveTuple.dstPort, 2);
+	key[12] = fiveTuple.protocol;
+	return EcmpHash(key, sizeof(key), flowHashSeed) % flowEntryNum;
+}
+
+//遍历占用位图而非全部 flowEntryNum 个条目；超过 epochNum 个周期未更新的条目不会再被输出，从流表中删除
+const std::vector<uint32_t>& SwitchNode::ActiveFlowSlots(uint32_t port, uint32_t epoch, uint64_t window){
+	uint64_t now = Simulator::Now().GetTimeStep();
+	FlowTable &table = m_flowTelemetryData[port][epoch];
+	m_activeSlots.clear();
+	for (uint32_t w = 0; w < flowWordNum; w++){
+		uint64_t bits = m_flowOccupied[port][epoch][w];
+		while (bits){
+			uint32_t i = w * 64 + __builtin_ctzll(bits);
+			bits &= bits - 1;
+			auto it = table.find(i);
+			uint64_t age = now - it->second.lastTimeStep;
+			if (age > epochTime * epochNum){
+				table.erase(it);
+				m_flowOccupied[port][epoch][w] &= ~(1ULL << (i % 64));
+			}else if (it->second.flowTuple.srcIp != 0 && age <= window)
+				m_activeSlots.push_back(i);
+		}
+	}
+	return m_activeSlots;
 }
 
 uint32_t SwitchNode::GetEpochIdx(){
@@ -450,6 +541,10 @@ void SwitchNode::ClearTable(){
 	m_rtTable.clear();
 }
 
+void SwitchNode::ClearTableEntry(Ipv4Address &dstAddr){
+	m_rtTable.erase(dstAddr.Get());
+}
+
 // This function can only be called in switch mode
 bool SwitchNode::SwitchReceiveFromDevice(Ptr<NetDevice> device, Ptr<Packet> packet, CustomHeader &ch){
 	uint32_t inPort = device->GetIfIndex();
@@ -520,6 +615,8 @@ void SwitchNode::SwitchNotifyDequeue(uint32_t ifIndex, uint32_t qIndex, Ptr<Pack
 		}
 		//CheckAndSendPfc(inDev, qIndex);
 		CheckAndSendResume(inDev, qIndex);
+		m_traceMmuChange(inDev);
+		m_traceMmuChange(ifIndex);
 	} else {
 		// Print dequeue log for highest priority queue (qIndex == 0)
 #if ENABLE_PRINT_PACKET_LOG
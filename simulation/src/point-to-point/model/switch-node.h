@@ -2,7 +2,10 @@
 #define SWITCH_NODE_H
 
 #include <unordered_map>
+#include <vector>
+#include <array>
 #include <ns3/node.h>
+#include <ns3/traced-callback.h>
 #include "qbb-net-device.h"
 #include "switch-mmu.h"
 #include "pint.h"
@@ -12,19 +15,19 @@ namespace ns3 {
 class Packet;
 
 class SwitchNode : public Node{
-	static const uint32_t pCnt = 257;	// Number of ports used 端口数
-	static const uint32_t qCnt = 8;	// Number of queues/priorities used 队列数
+	static const uint32_t qCnt = SwitchMmu::qCnt;	// Number of queues/priorities used 队列数
 	uint32_t m_ecmpSeed; // ECMP种子
 	std::unordered_map<uint32_t, std::vector<int> > m_rtTable; // map from ip address (u32) to possible ECMP port (index of dev)
 
+	// 以下每端口状态均由 InitPortState() 按设备数分配
 	// monitor of PFC
-	uint32_t m_bytes[pCnt][pCnt][qCnt]; // m_bytes[inDev][outDev][qidx] is the bytes from inDev enqueued for outDev at qidx [入端口][出端口][队列索引]
+	std::vector<std::vector<std::array<uint32_t, qCnt> > > m_bytes; // m_bytes[inDev][outDev][qidx] is the bytes from inDev enqueued for outDev at qidx [入端口][出端口][队列索引]
 	
-	uint64_t m_txBytes[pCnt]; // counter of tx bytes 发送字节数计数器
+	std::vector<uint64_t> m_txBytes; // counter of tx bytes 发送字节数计数器
 
-	uint32_t m_lastPktSize[pCnt]; // 最后一个包的大小
-	uint64_t m_lastPktTs[pCnt]; // ns 最后一个包的时间戳
-	double m_u[pCnt]; // 端口利用率
+	std::vector<uint32_t> m_lastPktSize; // 最后一个包的大小
+	std::vector<uint64_t> m_lastPktTs; // ns 最后一个包的时间戳
+	std::vector<double> m_u; // 端口利用率
 
 	// RDMA NPA 网络性能分析
 	static const uint32_t flowHashSeed = 0x233;	// Seed for flow hash 流哈希种子
@@ -33,8 +36,8 @@ class SwitchNode : public Node{
 	static const uint32_t portToPortSlot = 5;	// port to port bytes slot 端口到端口时间槽数量
 	uint64_t m_lastSignalEpoch;	// last signal time 最后一个信号时间
 	uint32_t m_slotIdx;	// current epoch index 当前周期索引
-	uint64_t m_lastPollingEpoch[pCnt];	// last polling epoch 最后一个轮询周期
-	uint32_t m_lastEventID[pCnt];	// last event ID 最后一个事件ID
+	std::vector<uint64_t> m_lastPollingEpoch;	// last polling epoch 最后一个轮询周期
+	std::vector<uint32_t> m_lastEventID;	// last event ID 最后一个事件ID
 	struct FiveTuple{
 		uint32_t srcIp;
 		uint32_t dstIp;
@@ -67,10 +70,15 @@ class SwitchNode : public Node{
 
 		uint32_t lastTimeStep;		// last timestep >> 5
 	};
-	FlowTelemetryData m_flowTelemetryData[pCnt][epochNum][flowEntryNum]; // 流遥测表： 端口 周期 流
-	PortTelemetryData m_portTelemetryData[epochNum][pCnt]; // 端口遥测表：周期 端口
-	uint32_t m_portToPortBytes[pCnt][pCnt]; // bytes from port to port 端口到端口字节流量计
-	uint32_t m_portToPortBytesSlot[pCnt][pCnt][portToPortSlot]; // 端口到端口字节槽
+	typedef std::unordered_map<uint32_t, FlowTelemetryData> FlowTable;	// 流表下标 (FiveTupleHash) -> 条目，只保存使用中的条目
+	static const uint32_t flowWordNum = flowEntryNum / 64;
+	typedef std::array<uint64_t, flowWordNum> FlowBitmap;
+	std::vector<std::array<FlowTable, epochNum> > m_flowTelemetryData; // 流遥测表： 端口 周期 流
+	std::vector<std::array<FlowBitmap, epochNum> > m_flowOccupied; // 流表占用位图：第i位为1表示条目i在 FlowTable 中
+	std::vector<uint32_t> m_activeSlots; // ActiveFlowSlots 的结果缓冲
+	std::vector<PortTelemetryData> m_portTelemetryData[epochNum]; // 端口遥测表：周期 端口
+	std::vector<std::vector<uint32_t> > m_portToPortBytes; // bytes from port to port 端口到端口字节流量计
+	std::vector<std::vector<std::array<uint32_t, portToPortSlot> > > m_portToPortBytesSlot; // 端口到端口字节槽
 
 protected:
 	bool m_ecnEnabled;
@@ -88,16 +96,22 @@ private:
 	// RDMA NPA
 	static uint32_t FiveTupleHash(const FiveTuple &fiveTuple);
 	uint32_t GetEpochIdx();
+	const std::vector<uint32_t>& ActiveFlowSlots(uint32_t port, uint32_t epoch, uint64_t window);  //按下标升序返回 window 内更新过的流条目，并删除已过期条目
+	void BeginTelemetry(uint32_t inport, bool isSignal);  //写出一次信号/轮询遥测的开头 (文本 "time ..." / 二进制 POLL 记录)
+	void EndTelemetry();
 	void OutputTelemetry(uint32_t port, uint32_t inport, bool isSignal);
+	void OutputTelemetryBinary(uint32_t port, uint32_t inport, bool isSignal);
 
 public:
 	Ptr<SwitchMmu> m_mmu;
 
 	static TypeId GetTypeId (void);
 	SwitchNode();
+	void InitPortState(void);  //按当前设备数分配每端口状态 (含 m_mmu)，须在链路安装完成后、配置MMU之前调用
 	void SetEcmpSeed(uint32_t seed);
 	void AddTableEntry(Ipv4Address &dstAddr, uint32_t intf_idx); //添加路由表条目
 	void ClearTable();
+	void ClearTableEntry(Ipv4Address &dstAddr); //删除去往 dstAddr 的全部表项
 	bool SwitchReceiveFromDevice(Ptr<NetDevice> device, Ptr<Packet> packet, CustomHeader &ch);
 	void SwitchNotifyDequeue(uint32_t ifIndex, uint32_t qIndex, Ptr<Packet> p);
 
@@ -108,8 +122,12 @@ public:
 	int logres_shift(int b, int l);
 	int log2apprx(int x, int b, int m, int l); // given x of at most b bits, use most significant m bits of x, calc the result in l bits
 
+	// MMU 中某端口的 ingress/egress/hdrm 字节数或 PAUSE 状态可能变化 (参数为端口号)，供入端口队列监控按变化采样
+	TracedCallback<uint32_t> m_traceMmuChange;
+
 	// for RDMA NPA detect
 	FILE *fp_telemetry = NULL;
+	bool telemetryBinary = false;	// true: fp_telemetry 为所有交换机共用的二进制 telemetry.bin
 	uint32_t epochTime = 1000000;
 };
 
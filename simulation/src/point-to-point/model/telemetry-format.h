@@ -0,0 +1,57 @@
+#ifndef TELEMETRY_FORMAT_H
+#define TELEMETRY_FORMAT_H
+#include <stdint.h>
+
+namespace ns3{
+
+/*
+ * 二进制遥测文件布局 (TELEMETRY_FORMAT 1)：所有交换机共用一个 telemetry.bin
+ *   文件头   TelemetryFileHeader (magic = TELEMETRY_FILE_MAGIC)
+ *   若干条   TelemetryRecord，按写出顺序排列
+ * 每次信号/轮询先写一条 kind = POLL 的记录 (对应文本格式的 "time ... signal/polling")，
+ * 随后是该次输出的 PORT / FLOW 记录，直到下一条 POLL 记录为止。
+ */
+static const uint32_t TELEMETRY_FILE_MAGIC = 0x4d544b48;	// "HKTM"
+static const uint32_t TELEMETRY_FILE_VERSION = 1;
+
+enum TelemetryKind{
+	TELEMETRY_POLL = 0,
+	TELEMETRY_PORT = 1,
+	TELEMETRY_FLOW = 2
+};
+
+enum TelemetryTrigger{
+	TELEMETRY_SIGNAL = 0,	// PFC信号触发 (pfc_trace)
+	TELEMETRY_POLLING = 1	// 轮询包触发 (flow_trace)
+};
+
+struct TelemetryFileHeader{
+	uint32_t magic;
+	uint32_t version;
+};
+
+struct TelemetryRecord{
+	uint64_t time;
+	uint16_t switchId;
+	uint8_t kind;		// TelemetryKind
+	uint8_t trigger;	// TelemetryTrigger
+	uint8_t epoch;		// 0: epoch now, 1: epoch last
+	uint8_t protocol;	// FLOW
+	uint16_t port;		// PORT / FLOW：遥测端口
+	uint16_t inport;	// POLL：信号/轮询包的入端口
+	uint16_t flowIdx;	// FLOW：流表下标
+	uint32_t srcIp, dstIp;	// FLOW
+	uint16_t srcPort, dstPort;	// FLOW
+	uint16_t minSeq, maxSeq;	// FLOW
+	uint32_t packetNum;	// PORT / FLOW
+	uint32_t enqQdepth;	// PORT / FLOW
+	uint32_t pfcPausedPacketNum;	// PORT / FLOW
+	uint32_t portToPortBytes;	// PORT (仅信号触发)：inport 到 port 的流量计数
+	uint32_t pad;
+};
+
+static_assert(sizeof(TelemetryRecord) == 56, "TelemetryRecord layout is read by graph.py");
+
+} // namespace ns3
+
+#endif /* TELEMETRY_FORMAT_H */
@@ -0,0 +1,102 @@
+#include <cstring>
+#include <algorithm>
+#ifdef HAVE_ZLIB
+#include <zlib.h>
+#endif
+#include "ns3/log.h"
+#include "trace-writer.h"
+
+NS_LOG_COMPONENT_DEFINE("TraceWriter");
+namespace ns3 {
+	TraceWriter::TraceWriter(FILE *file, uint32_t blockRecords, uint8_t codec)
+		: m_file(file), m_blockRecords(blockRecords), m_codec(codec),
+		  m_eventMask(~0u), m_start(0), m_end(~(uint64_t)0){
+	#ifndef HAVE_ZLIB
+		if (m_codec == TRACE_CODEC_ZLIB){
+			NS_LOG_WARN("zlib not available, trace blocks are written uncompressed");
+			m_codec = TRACE_CODEC_NONE;
+		}
+	#endif
+		if (IsBlockMode()){
+			m_block.reserve(m_blockRecords);
+			TraceFileHeader fh;
+			fh.magic = TRACE_FILE_MAGIC;
+			fh.version = TRACE_FILE_VERSION;
+			fwrite(&fh, sizeof(fh), 1, m_file);
+		}
+	}
+
+	TraceWriter::~TraceWriter(){
+		if (m_file)
+			Flush();
+	}
+
+	void TraceWriter::Write(const TraceFormat &tr){
+		if (!IsBlockMode()){
+			fwrite(&tr, sizeof(TraceFormat), 1, m_file);
+			return;
+		}
+		m_block.push_back(tr);
+		if (m_block.size() >= m_blockRecords)
+			WriteBlock();
+	}
+
+	void TraceWriter::Flush(){
+		if (IsBlockMode() && !m_block.empty())
+			WriteBlock();
+		fflush(m_file);
+	}
+
+	void TraceWriter::Close(){
+		if (!m_file)
+			return;
+		Flush();
+		fclose(m_file);
+		m_file = NULL;
+	}
+
+	void TraceWriter::WriteBlock(void){
+		TraceBlockHeader bh;
+		memset(&bh, 0, sizeof(bh));
+		bh.magic = TRACE_BLOCK_MAGIC;
+		bh.count = m_block.size();
+		bh.tFirst = m_block.front().time;
+		bh.tLast = m_block.back().time;
+
+		// 节点位图：读取端据此跳过不含目标节点的块
+		uint16_t nodeMin = m_block[0].node, nodeMax = m_block[0].node;
+		for (const TraceFormat &tr : m_block){
+			nodeMin = std::min(nodeMin, tr.node);
+			nodeMax = std::max(nodeMax, tr.node);
+		}
+		bh.nodeMin = nodeMin;
+		bh.bitmapBytes = (nodeMax - nodeMin) / 8 + 1;
+		m_bitmap.assign(bh.bitmapBytes, 0);
+		for (const TraceFormat &tr : m_block){
+			uint32_t bit = tr.node - nodeMin;
+			m_bitmap[bit / 8] |= 1 << (bit % 8);
+		}
+
+		const uint8_t *payload = reinterpret_cast<const uint8_t*>(m_block.data());
+		bh.rawBytes = bh.count * sizeof(TraceFormat);
+		bh.compBytes = bh.rawBytes;
+		bh.codec = TRACE_CODEC_NONE;
+	#ifdef HAVE_ZLIB
+		if (m_codec == TRACE_CODEC_ZLIB){
+			uLongf compLen = compressBound(bh.rawBytes);
+			m_comp.resize(compLen);
+			// 压缩失败或不划算时按原样写出该块
+			if (compress2(m_comp.data(), &compLen, payload, bh.rawBytes, Z_BEST_SPEED) == Z_OK && compLen < bh.rawBytes){
+				payload = m_comp.data();
+				bh.compBytes = compLen;
+				bh.codec = TRACE_CODEC_ZLIB;
+			}
+		}
+	#endif
+
+		fwrite(&bh, sizeof(bh), 1, m_file);
+		fwrite(m_bitmap.data(), 1, m_bitmap.size(), m_file);
+		fwrite(payload, 1, bh.compBytes, m_file);
+		m_block.clear();
+	}
+}
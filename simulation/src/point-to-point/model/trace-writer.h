@@ -0,0 +1,83 @@
+#ifndef TRACE_WRITER_H
+#define TRACE_WRITER_H
+
+#include <stdint.h>
+#include <cstdio>
+#include <vector>
+#include <unordered_set>
+#include "trace-format.h"
+
+namespace ns3 {
+
+/*
+ * 块结构trace文件布局 (块模式):
+ *   文件头   TraceFileHeader  (magic = TRACE_FILE_MAGIC)
+ *   SimSetting               (与原始格式相同)
+ *   若干块   TraceBlockHeader + 节点位图 + 负载 (count 条 TraceFormat，按 codec 压缩)
+ * 原始模式下不写文件头，每条记录直接 fwrite，与 TraceFormat::Serialize 完全一致。
+ */
+static const uint32_t TRACE_FILE_MAGIC = 0x42544b48;	// "HKTB"
+static const uint32_t TRACE_BLOCK_MAGIC = 0x4b4c4254;	// "TBLK"
+static const uint32_t TRACE_FILE_VERSION = 1;
+
+enum TraceCodec{
+	TRACE_CODEC_NONE = 0,
+	TRACE_CODEC_ZLIB = 1
+};
+
+struct TraceFileHeader{
+	uint32_t magic;
+	uint32_t version;
+};
+
+struct TraceBlockHeader{
+	uint32_t magic;
+	uint32_t count;			// 块内记录数
+	uint64_t tFirst, tLast;	// 块内首末记录时间
+	uint16_t nodeMin;		// 位图第0位对应的节点号
+	uint16_t bitmapBytes;	// 节点位图字节数，位图覆盖 [nodeMin, nodeMin + bitmapBytes * 8)
+	uint8_t codec;			// TraceCodec
+	uint8_t pad[3];
+	uint32_t rawBytes;		// 解压后负载字节数 (count * sizeof(TraceFormat))
+	uint32_t compBytes;		// 文件中负载字节数
+};
+
+class TraceWriter{
+public:
+	// blockRecords 为0时为原始模式；codec 请求zlib但编译时未找到zlib时退化为不压缩
+	TraceWriter(FILE *file, uint32_t blockRecords = 0, uint8_t codec = TRACE_CODEC_ZLIB);
+	~TraceWriter();
+
+	void Write(const TraceFormat &tr);
+	void Flush();  //写出缓冲中未满的块
+	void Close();  //Flush 后关闭文件；之后析构不再访问文件
+	bool IsBlockMode(void) const { return m_blockRecords > 0; }
+
+	// 过滤条件，在构造 TraceFormat 之前由回调检查；默认全部记录
+	void SetEventMask(uint32_t mask) { m_eventMask = mask; }  //第i位对应 Event i
+	void AddPort(uint32_t node, uint32_t intf) { m_ports.insert(PortKey(node, intf)); }  //为空时记录所有端口
+	void SetTimeWindow(uint64_t start, uint64_t end) { m_start = start; m_end = end; }  //[start, end] (ns)
+	bool Accept(uint32_t event, uint32_t node, uint32_t intf, uint64_t time) const {
+		return (m_eventMask >> event & 1) && time >= m_start && time <= m_end
+			&& (m_ports.empty() || m_ports.count(PortKey(node, intf)));
+	}
+
+private:
+	static uint64_t PortKey(uint32_t node, uint32_t intf) { return (uint64_t)node << 32 | intf; }
+	void WriteBlock(void);
+
+	FILE *m_file;
+	uint32_t m_blockRecords;
+	uint8_t m_codec;
+	std::vector<TraceFormat> m_block;
+	std::vector<uint8_t> m_bitmap;
+	std::vector<uint8_t> m_comp;
+
+	uint32_t m_eventMask;
+	std::unordered_set<uint64_t> m_ports;
+	uint64_t m_start, m_end;
+};
+
+} // namespace ns3
+
+#endif /* TRACE_WRITER_H */